@@ -0,0 +1,368 @@
+import asyncio
+import concurrent.futures
+import threading
+import queue
+from time import time
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    aiohttp = None
+
+from .BodyBuffer import BodyBuffer
+from .CooldownLock import AsyncCooldownLock
+from .RequestUtils import build_response, FETCH_FULL, FETCH_TRUNCATE, FETCH_SKIP
+
+
+# Url of an engine item for logging, the request it got to if any,
+# else the (url or request, depth[, attempt]) it came in as
+def get_item_url(request, item):
+    if request is not None:
+        return request.url
+    if isinstance(item, tuple) and item:
+        return getattr(item[0], 'url', item[0])
+    return item
+
+
+'''
+AsyncRequestEngine
+    Drop-in replacement for the RequestWorkers WorkerManager that
+    runs every request on a single asyncio event loop (aiohttp)
+    instead of one blocking OS thread per in-flight request.
+    Pulls (request, depth) items from the input queue and puts
+    (response, content, depth) items on the output queue, exactly
+    like OmenEye.request_worker, so the parsers and DB workers
+    do not know the difference.
+
+__init__
+    session - the requests.Session to take headers, cookies and proxies from
+    input_queue - the queue of (request, depth) to pull from
+    output_queue - the queue to put (response, content, depth) on
+    concurrency - max number of requests in flight at once
+    canary - optional WAF canary to pause on while it says blocked
+    delay - optional cooldown between requests (like CooldownLock)
+    jitter - optional max jitter added to the cooldown
+    render_func - optional blocking func(response, content) -> content, run in a thread
+    max_size - max body size in bytes
+    chunk_size - size of the chunks the body is read in
+    spill_size - body size in bytes after which it is spilled to disk
+    fetch_policy - optional FetchPolicy deciding how much of each body to download
+    retries - number of immediate retries on connection errors
+    result_func - optional func(request, depth, response, content) -> output item or None,
+                  used instead of always putting (response, content, depth)
+    redirect_func - optional func(result, hops) -> next request of a redirect chain or None
+    build_func - optional func(item) -> (request, depth) or None, run on every input
+                 item first (eg. the request builder, to pull urls straight off the url queue)
+    error_func - optional func(url) called when handling an item raised, to record it as failed
+    The build, result, redirect and error funcs may block (eg. on a bounded
+    queue), so they run in the loop's thread pool, never on the loop itself.
+
+fetch_request - fetch a request from another thread (eg. a soft-404 probe) on the
+                loop, paced and limited like the engine's own requests
+start_threads - start the event loop thread
+stop_threads - stop the event loop, use in emergencies
+join_threads - stop the event loop when the input queue is empty
+get_rates - get intake and output rates of the engine
+'''
+class AsyncRequestEngine:
+    def __init__(self,
+            session=None,
+            input_queue=None,
+            output_queue=None,
+            concurrency=100,
+            canary=None,
+            delay=None,
+            jitter=None,
+            render_func=None,
+            max_size=1024*1024*250, # 250 MB
+            chunk_size=1024*64, # 64 KB
+            spill_size=None,
+            fetch_policy=None,
+            retries=2,
+            result_func=None,
+            redirect_func=None,
+            build_func=None,
+            error_func=None,
+        ):
+
+        if aiohttp is None:
+            raise ImportError("The async engine requires aiohttp (pip install aiohttp)")
+        if session is None:
+            raise TypeError(f"session should be of type 'requests.Session', but got {type(session).__name__}")
+        if concurrency is None or not isinstance(concurrency, int):
+            raise TypeError(f"concurrency should be of type 'int', but got {type(concurrency).__name__}")
+        if input_queue is None or not isinstance(input_queue, queue.Queue):
+            raise TypeError(f"input_queue should be of type 'queue.Queue', but got {type(input_queue).__name__}")
+        if output_queue is None or not isinstance(output_queue, queue.Queue):
+            raise TypeError(f"output_queue should be of type 'queue.Queue', but got {type(output_queue).__name__}")
+
+        self.session = session
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.concurrency = concurrency
+        self.canary = canary
+        self.delay = delay
+        self.jitter = jitter
+        self.render_func = render_func
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.spill_size = spill_size
+        self.fetch_policy = fetch_policy
+        self.retries = retries
+        self.result_func = result_func
+        self.redirect_func = redirect_func
+        self.build_func = build_func
+        self.error_func = error_func
+
+        self.thread = None
+        self.loop = None
+        self.stop_threads_event = threading.Event()
+
+        self.last_output_time = 0
+        self.last_input_time = 0
+        self.input_ema = 0.0
+        self.output_ema = 0.0
+
+        #A higher alpha (e.g., 0.3) means the rate will adjust more quickly to recent changes.
+        self.alpha = 0.01  # EMA smoothing factor
+
+        self.lock = threading.Lock()
+
+    def start_threads(self):
+        self.thread = threading.Thread(target=asyncio.run, args=(self.main(),))
+        self.thread.start()
+
+    def stop_threads(self):
+        self.stop_threads_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def join_threads(self):
+        self.input_queue.join()
+        self.stop_threads()
+
+    async def main(self):
+        if self.delay or self.jitter:
+            self.timing_lock = AsyncCooldownLock(
+                cooldown_period=self.delay if self.delay else 0,
+                max_jitter=self.jitter if self.jitter else 0
+            )
+        else:
+            self.timing_lock = None
+
+        slots = asyncio.Semaphore(self.concurrency)
+        # Held only while a request is on the wire, so a fetch_request
+        # never waits on a worker that is blocked on a full queue
+        self.fetch_slots = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=False)
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=10)
+
+        # Cookies are already in the prepared request's headers,
+        # so aiohttp must not keep its own jar
+        async with aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                cookie_jar=aiohttp.DummyCookieJar()
+            ) as client:
+            self.client = client
+            self.loop = asyncio.get_running_loop()
+
+            tasks = set()
+            while not self.stop_threads_event.is_set():
+                await slots.acquire()
+                try:
+                    item = self.input_queue.get_nowait()
+                except queue.Empty:
+                    slots.release()
+                    await asyncio.sleep(0.01)
+                    continue
+
+                task = asyncio.create_task(self.worker(client, slots, item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            self.loop = None
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def worker(self, client, slots, item):
+        request = None
+        try:
+            if self.build_func:
+                built = await self.run_blocking(self.build_func, item)
+            else:
+                built = item
+            if built:
+                request, depth = built
+            else:
+                request, depth = None, None
+            hops = 0
+
+            # Each redirect hop is fetched here and emitted as its own
+            # response, instead of going back around through the queues
+            while request is not None:
+                result = await self.fetch_one(client, request, depth)
+                if result:
+                    if result[0] is not None:
+                        with self.lock:
+                            current_time = time()
+                            time_diff = current_time - self.last_output_time
+                            self.output_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.output_ema
+                            self.last_output_time = current_time
+                    await self.put_output(result)
+
+                if self.redirect_func:
+                    request = await self.run_blocking(self.redirect_func, result, hops)
+                else:
+                    request = None
+                hops += 1
+
+            with self.lock:
+                current_time = time()
+                time_diff = current_time - self.last_input_time
+                self.input_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.input_ema
+                self.last_input_time = current_time
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A task that dies silently would leave its item undone
+            # and the crawl waiting on it forever
+            url = get_item_url(request, item)
+            print(f'[!] AsyncRequestEngine: {type(e).__name__} while handling {url}: {e}')
+            if self.error_func:
+                try:
+                    await self.run_blocking(self.error_func, url)
+                except Exception as e:
+                    print(f'[!] AsyncRequestEngine: {type(e).__name__} while recording {url} as failed: {e}')
+        finally:
+            self.input_queue.task_done()
+            slots.release()
+
+    async def run_blocking(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    # A blocking put would stall the whole event loop, so wait for
+    # room in a full (bounded) output queue without blocking it
+    async def put_output(self, result):
+        while True:
+            try:
+                self.output_queue.put_nowait(result)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.01)
+
+    # Canary, cooldown and concurrency every request goes through
+    async def fetch_paced(self, client, request):
+        # Canary Blocking
+        if self.canary:
+            while self.canary.is_blocked:
+                await asyncio.sleep(1)
+
+        async with self.fetch_slots:
+            if self.timing_lock:
+                await self.timing_lock.acquire()
+            try:
+                return await self.fetch(client, request)
+            finally:
+                if self.timing_lock:
+                    self.timing_lock.release()
+
+    # Blocks the calling thread, (None, None) if the engine is not running
+    def fetch_request(self, request):
+        loop = self.loop
+        if loop is None:
+            return None, None
+        try:
+            future = asyncio.run_coroutine_threadsafe(self.fetch_paced(self.client, request), loop)
+            return future.result()
+        except (RuntimeError, concurrent.futures.CancelledError):
+            # The loop stopped before or while fetching it
+            return None, None
+
+    async def fetch_one(self, client, request, depth):
+        response, content = await self.fetch_paced(client, request)
+
+        if self.result_func:
+            result = await self.run_blocking(self.result_func, request, depth, response, content)
+        else:
+            result = (response, content, depth)
+
+        if result and result[0] is not None and self.render_func:
+            content = await self.run_blocking(self.render_func, result[0], result[1])
+            result = (result[0], content, result[2])
+        return result
+
+    # Same contract as get_url_w_request_and_session:
+    # returns (response, content) or (None, None) after retries+1 tries
+    async def fetch(self, client, request):
+        prepped = self.session.prepare_request(request)
+        scheme = prepped.url.split(':', 1)[0].lower()
+        proxy = self.session.proxies.get(scheme)
+
+        retry_count = 0
+        while retry_count <= self.retries:
+            try:
+                async with client.request(
+                        prepped.method,
+                        yarl.URL(prepped.url, encoded=True),
+                        headers=dict(prepped.headers),
+                        data=prepped.body,
+                        proxy=proxy,
+                        allow_redirects=False,
+                    ) as resp:
+
+                    # Headers are in, decide how much of the body is worth having
+                    if self.fetch_policy:
+                        decision, limit = self.fetch_policy.decide(resp.headers, url=prepped.url)
+                    else:
+                        decision, limit = FETCH_FULL, self.max_size
+                    limit = min(limit, self.max_size)
+
+                    # Unread bytes make aiohttp drop the connection on exit
+                    body = BodyBuffer(spill_size=self.spill_size)
+                    if decision != FETCH_SKIP:
+                        async for chunk in resp.content.iter_chunked(self.chunk_size):
+                            if len(body) + len(chunk) > limit:
+                                if decision == FETCH_TRUNCATE:
+                                    body.write(chunk[:limit - len(body)])
+                                    break
+                                raise ValueError("Response size exceeds maximum size")
+                            body.write(chunk)
+
+                    # requests folds repeated headers into one comma separated value
+                    headers = {}
+                    for name, value in resp.headers.items():
+                        if name in headers:
+                            headers[name] += ', ' + value
+                        else:
+                            headers[name] = value
+
+                    content = body.getbuffer()
+                    response = build_response(
+                        prepped,
+                        resp.status,
+                        headers,
+                        url=resp.url,
+                        reason=resp.reason,
+                        content=content,
+                    )
+                    response.fetch_decision = decision
+                    return response, content
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                retry_count += 1
+            except ValueError:
+                # Too big, trying again will not help
+                break
+
+        return None, None
+
+    # A fused build step is not timed on its own, every stage
+    # reports the engine's rates
+    def get_rates(self, stage=None):
+        with self.lock:
+            input_rate = self.input_ema
+            output_rate = self.output_ema
+        return input_rate, output_rate
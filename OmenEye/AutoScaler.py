@@ -0,0 +1,153 @@
+import threading
+from collections import deque
+from time import time, strftime
+
+
+'''
+AutoScaler
+    Grows and shrinks the number of threads of each pipeline stage
+    between min_threads and max_threads while the crawl runs, so
+    threads move to wherever the work piles up (eg. from fetching
+    to parsing when the crawl hits a JS heavy section).
+
+    Every interval seconds, for each stage:
+      - a backlog (more than backlog_factor items waiting per
+        thread) grows the stage by a quarter (at least 1 thread),
+        unless the last growth did not raise its measured
+        throughput, then that growth is undone and the stage is
+        held for hold_rounds rounds
+        (eg. fetching is bound by the target or a delay, not threads)
+      - an input queue that stayed empty for idle_rounds rounds
+        shrinks the stage by 1 thread
+    Every decision is logged in the history (and to log_func).
+
+__init__
+    stages - list of (name, manager) pairs, a manager needs input_queue,
+             num_threads, scale_to and get_processed (WorkerManager, ResponseDBManager)
+    min_threads - min number of threads per stage
+    max_threads - max number of threads per stage
+    interval - seconds between scaling rounds
+    backlog_factor - items waiting per thread that count as a backlog
+    idle_rounds - rounds with an empty input queue before shrinking
+    hold_rounds - rounds to hold a stage after a growth that did not pay off
+    log_func - optional func(message) called for every decision
+
+start - start the controller thread
+stop - stop the controller thread
+check - (do not use) run one round of scaling decisions
+get_history - get the most recent decisions
+'''
+class AutoScaler:
+    def __init__(self,
+            stages=None,
+            min_threads=1,
+            max_threads=32,
+            interval=2.0,
+            backlog_factor=2,
+            idle_rounds=3,
+            hold_rounds=5,
+            log_func=None,
+        ):
+
+        if stages is None or not isinstance(stages, list):
+            raise TypeError(f"stages should be of type 'list', but got {type(stages).__name__}")
+        if not isinstance(min_threads, int):
+            raise TypeError(f"min_threads should be of type 'int', but got {type(min_threads).__name__}")
+        if not isinstance(max_threads, int):
+            raise TypeError(f"max_threads should be of type 'int', but got {type(max_threads).__name__}")
+
+        self.stages = stages
+        self.min_threads = max(min_threads, 1)
+        self.max_threads = max(max_threads, self.min_threads)
+        self.interval = interval
+        self.backlog_factor = backlog_factor
+        self.idle_rounds = idle_rounds
+        self.hold_rounds = hold_rounds
+        self.log_func = log_func
+
+        # Per stage: processed count at the last round, throughput
+        # before the last growth, idle rounds, rounds left on hold
+        self.state = {}
+        for name, manager in self.stages:
+            self.state[name] = {
+                'processed': manager.get_processed(),
+                'grown_from_rate': None,
+                'grown_from_threads': None,
+                'idle': 0,
+                'hold': 0,
+            }
+        self.last_check = time()
+
+        self.history = deque(maxlen=100)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.last_check = time()
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.check()
+
+    def check(self):
+        current_time = time()
+        elapsed = max(current_time - self.last_check, 0.001)
+        self.last_check = current_time
+
+        for name, manager in self.stages:
+            state = self.state[name]
+            processed = manager.get_processed()
+            rate = (processed - state['processed']) / elapsed
+            state['processed'] = processed
+
+            threads = manager.num_threads
+            depth = manager.input_queue.qsize()
+
+            if depth == 0:
+                state['idle'] += 1
+            else:
+                state['idle'] = 0
+
+            if state['hold'] > 0:
+                state['hold'] -= 1
+                continue
+
+            if depth > threads * self.backlog_factor and threads < self.max_threads:
+                grown_from_rate = state['grown_from_rate']
+                if grown_from_rate is not None and rate <= grown_from_rate * 1.05:
+                    # More threads did not buy more throughput, give them back
+                    old_threads = state['grown_from_threads']
+                    state['grown_from_rate'] = None
+                    state['hold'] = self.hold_rounds
+                    manager.scale_to(old_threads)
+                    self.log(f'{name}: {threads} -> {old_threads} threads, no gain from the last growth ({rate:.2f} items/sec, {depth} waiting)')
+                    continue
+                new_threads = min(self.max_threads, threads + max(1, threads // 4))
+                state['grown_from_rate'] = rate
+                state['grown_from_threads'] = threads
+                manager.scale_to(new_threads)
+                self.log(f'{name}: {threads} -> {new_threads} threads ({depth} waiting, {rate:.2f} items/sec)')
+
+            elif state['idle'] >= self.idle_rounds and threads > self.min_threads:
+                state['idle'] = 0
+                state['grown_from_rate'] = None
+                manager.scale_to(threads - 1)
+                self.log(f'{name}: {threads} -> {threads - 1} threads (idle, {rate:.2f} items/sec)')
+
+    def log(self, message):
+        message = f'[{strftime("%H:%M:%S")}] {message}'
+        with self.lock:
+            self.history.append(message)
+        if self.log_func:
+            self.log_func(message)
+
+    def get_history(self, num=5):
+        with self.lock:
+            return list(self.history)[-num:]
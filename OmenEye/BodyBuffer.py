@@ -0,0 +1,66 @@
+import mmap
+import tempfile
+
+
+'''
+BodyBuffer
+    Growable buffer for a response body that is filled chunk by
+    chunk while streaming. Small bodies grow in place in a
+    bytearray (amortized, no re-copying of what is already there),
+    bodies past spill_size are moved to an anonymous temp file so
+    they do not sit in RSS. getbuffer() hands out a zero-copy
+    memoryview of the body (an mmap of the temp file when spilled),
+    which works anywhere bytes do for reading: str(), slicing,
+    regex, gzip and sqlite3 BLOB inserts.
+
+__init__
+    spill_size - bytes after which the body is spilled to disk (None = never)
+    spill_dir - directory for the temp file (None = system default)
+
+write - append a chunk
+getbuffer - get a memoryview of the whole body (do not write after this)
+is_spilled - True if the body lives on disk
+'''
+class BodyBuffer:
+    def __init__(self, spill_size=None, spill_dir=None):
+        self.spill_size = spill_size
+        self.spill_dir = spill_dir
+        self.size = 0
+        self.buffer = bytearray()
+        self.file = None
+        self.spilled = False
+
+    def __len__(self):
+        return self.size
+
+    def is_spilled(self):
+        return self.spilled
+
+    def write(self, chunk):
+        if self.file is None and self.spill_size is not None and self.size + len(chunk) > self.spill_size:
+            self._spill()
+
+        if self.file is None:
+            self.buffer += chunk
+        else:
+            self.file.write(chunk)
+        self.size += len(chunk)
+
+    def _spill(self):
+        self.file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self.spilled = True
+        self.file.write(self.buffer)
+        self.buffer = None
+
+    def getbuffer(self):
+        if self.file is None:
+            return memoryview(self.buffer)
+
+        self.file.flush()
+        # The mmap keeps its own handle on the (already unlinked)
+        # temp file, so the view outlives this buffer
+        body = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file.close()
+        self.file = None
+        self.buffer = None
+        return memoryview(body)
@@ -0,0 +1,120 @@
+import queue
+from collections import deque
+from time import time
+
+
+'''
+BoundedQueue
+    queue.Queue bounded by both the number of items and the total
+    size in bytes of the items in it. put() blocks while either
+    limit is reached, so a slow consumer pushes back on its
+    producers instead of letting memory grow without limit.
+    An item bigger than max_bytes on its own is still let in when
+    the queue is empty, otherwise it could never get through.
+
+__init__
+    maxsize - max number of items (0 = no limit)
+    max_bytes - max total size of the items in bytes (None = no limit)
+    size_func - func(item) -> size of the item in bytes
+
+put - same as queue.Queue.put, force=True ignores the limits (eg. for wake up signals)
+task_done_many - same as calling task_done n times, with one lock round trip
+get_bytes - total size in bytes of the items in the queue
+snapshot - copy of the items in the queue, in no particular order
+           (lock=False when the caller already holds the mutex)
+'''
+class BoundedQueue(queue.Queue):
+    def __init__(self, maxsize=0, max_bytes=None, size_func=None):
+        if max_bytes is not None and not isinstance(max_bytes, int):
+            raise TypeError(f"max_bytes should be of type 'int', but got {type(max_bytes).__name__}")
+        if max_bytes is not None and not callable(size_func):
+            raise TypeError(f"size_func should be of type 'callable', but got {type(size_func).__name__}")
+        super().__init__(maxsize=maxsize)
+        self.max_bytes = max_bytes
+        self.size_func = size_func
+        self.bytes = 0
+        self.sizes = deque()
+
+    def _is_full(self, size):
+        if self.maxsize > 0 and self._qsize() >= self.maxsize:
+            return True
+        if self.max_bytes is not None and self.bytes and self.bytes + size > self.max_bytes:
+            return True
+        return False
+
+    # Same as queue.Queue.put, with the byte limit added to the
+    # "is full" check
+    def put(self, item, block=True, timeout=None, force=False):
+        size = self.size_func(item) if self.max_bytes is not None else 0
+        with self.not_full:
+            if force:
+                pass
+            elif not block:
+                if self._is_full(size):
+                    raise queue.Full
+            elif timeout is None:
+                while self._is_full(size):
+                    self.not_full.wait()
+            elif timeout < 0:
+                raise ValueError("'timeout' must be a non-negative number")
+            else:
+                endtime = time() + timeout
+                while self._is_full(size):
+                    remaining = endtime - time()
+                    if remaining <= 0.0:
+                        raise queue.Full
+                    self.not_full.wait(remaining)
+            self._put(item)
+            self.sizes.append(size)
+            self.bytes += size
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    # Called by get() with the mutex held, get() notifies not_full after
+    def _get(self):
+        self.bytes -= self.sizes.popleft()
+        # Freed bytes may let in a smaller item than the one
+        # producer get() would wake up, so wake them all
+        if self.max_bytes is not None:
+            self.not_full.notify_all()
+        return super()._get()
+
+    def task_done_many(self, n):
+        with self.all_tasks_done:
+            unfinished = self.unfinished_tasks - n
+            if unfinished < 0:
+                raise ValueError('task_done() called too many times')
+            if unfinished == 0:
+                self.all_tasks_done.notify_all()
+            self.unfinished_tasks = unfinished
+
+    def get_bytes(self):
+        with self.mutex:
+            return self.bytes
+
+    def snapshot(self, lock=True):
+        if not lock:
+            return list(self.queue)
+        with self.mutex:
+            return list(self.queue)
+
+
+# Get up to batch_size items, waiting up to timeout for the first
+# one only (raises queue.Empty if there is none). A batch ends at
+# stop_item, so one worker does not swallow the wake up signals
+# meant for the others.
+def get_batch(input_queue, batch_size, timeout=1, stop_item=None):
+    items = [input_queue.get(timeout=timeout)]
+    while len(items) < batch_size and (stop_item is None or items[-1] is not stop_item):
+        try:
+            items.append(input_queue.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+def finish_batch(input_queue, n):
+    if isinstance(input_queue, BoundedQueue):
+        input_queue.task_done_many(n)
+    else:
+        for _ in range(n):
+            input_queue.task_done()
@@ -0,0 +1,66 @@
+from .RequestUtils import standardize_url
+
+
+# Rules a UrlCanonicalizer can apply
+CANONICAL_RULES = {
+    'fragment': 'drop #fragments',
+    'sort': 'sort the query params',
+    'ports': 'drop default ports (:80 for http, :443 for https)',
+    'case': 'lowercase the scheme and host',
+    'tracking': 'drop tracking params (utm_source, gclid, ...)',
+    'slash': 'drop trailing slashes from the path',
+}
+# A trailing slash can be a different page, so it is opt-in
+DEFAULT_RULES = ('fragment', 'sort', 'ports', 'case', 'tracking')
+
+TRACKING_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'utm_id',
+    'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'ref_src',
+}
+
+
+'''
+UrlCanonicalizer
+    Reduces every url to one canonical form when it is discovered,
+    so the spellings of one url (eg. HOST:443, an upper case host,
+    reordered params, a #fragment) are fetched once. The visited and
+    seen sets are keyed on the canonical form, and it is the form
+    that gets fetched. Built on standardize_url.
+
+__init__
+    rules - iterable of the CANONICAL_RULES to apply (empty = urls are left as they are)
+    ignored_params - set of param names the 'tracking' rule drops (Default TRACKING_PARAMS)
+
+canonicalize - get the canonical form of a url
+'''
+class UrlCanonicalizer:
+    def __init__(self, rules=DEFAULT_RULES, ignored_params=None):
+        rules = set(rules) if rules else set()
+        for rule in rules:
+            if rule not in CANONICAL_RULES:
+                raise ValueError(f"Unknown canonical url rule '{rule}', must be one of {', '.join(CANONICAL_RULES)}")
+
+        self.rules = rules
+        self.strip_fragment = 'fragment' in rules
+        self.sort_params = 'sort' in rules
+        self.default_ports = 'ports' in rules
+        self.lowercase = 'case' in rules
+        self.strip_trailing_slash = 'slash' in rules
+        if 'tracking' in rules:
+            self.ignored_params = set(ignored_params) if ignored_params is not None else TRACKING_PARAMS
+        else:
+            self.ignored_params = None
+
+    def canonicalize(self, url):
+        if not self.rules:
+            return url
+        return standardize_url(
+            url,
+            strip_fragment=self.strip_fragment,
+            sort_params=self.sort_params,
+            default_ports=self.default_ports,
+            lowercase=self.lowercase,
+            strip_trailing_slash=self.strip_trailing_slash,
+            ignored_params=self.ignored_params,
+        )
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+
+
+'''
+CrawlCheckpoint
+    Saves the crawl state that only lives in memory (frontier,
+    visited fingerprints, seen, urls claimed but not stored yet, and
+    the DB primary key counters) to an SQLite file next to the output DB,
+    so a crawl that crashed or was killed can be resumed.
+    Visited fingerprints and seen urls only ever grow, so a save only
+    appends the ones added since the last save. The frontier, the
+    in-flight urls, the counters and meta are small next to them and
+    are rewritten every time. Each save is one SQLite transaction,
+    so there is always one complete checkpoint on disk, even if the
+    process dies halfway through a save.
+    The first save of a crawl that did not load the checkpoint
+    starts a new file (in a temp file moved over the old one with
+    os.replace), so a fresh crawl never appends to an old one.
+
+__init__
+    path - path of the checkpoint file
+
+save - write a checkpoint (visited and seen are appended)
+load - read the last checkpoint, returns a dict (see save), later saves append to it
+exists - True if there is a checkpoint to resume from
+remove - delete the checkpoint (eg. once the crawl finished)
+'''
+class CrawlCheckpoint:
+    def __init__(self, path=None):
+        if path is None or not isinstance(path, str):
+            raise TypeError(f"path should be of type 'str', but got {type(path).__name__}")
+        self.path = path
+        # Set once the file holds the whole state to append to
+        self.appending = False
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.appending = False
+
+    # meta - dict of str values (eg. the start url)
+    # frontier - list of (url, depth) still queued
+    # in_flight - list of (url, depth) claimed but not stored yet
+    # visited - iterable of url fingerprints (unsigned 64 bit) stored since the last save
+    # seen - iterable of urls seen since the last save
+    # counters - dict of primary key counter values
+    def save(self, meta, frontier, in_flight, visited, seen, counters):
+        if self.appending:
+            conn = sqlite3.connect(self.path)
+            with conn:
+                conn.execute('DELETE FROM meta')
+                conn.execute('DELETE FROM frontier')
+                conn.execute('DELETE FROM in_flight')
+                conn.execute('DELETE FROM counters')
+                self.write(conn, meta, frontier, in_flight, visited, seen, counters)
+            conn.close()
+            return
+
+        tmp_path = self.path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE frontier (url TEXT, depth INTEGER)')
+            conn.execute('CREATE TABLE in_flight (url TEXT, depth INTEGER)')
+            conn.execute('CREATE TABLE visited (fingerprint INTEGER)')
+            conn.execute('CREATE TABLE seen (url TEXT)')
+            conn.execute('CREATE TABLE counters (name TEXT PRIMARY KEY, value INTEGER)')
+            self.write(conn, meta, frontier, in_flight, visited, seen, counters)
+        conn.close()
+
+        # Atomic on POSIX and Windows, the old checkpoint stays
+        # whole until the new one is complete
+        os.replace(tmp_path, self.path)
+        self.appending = True
+
+    def write(self, conn, meta, frontier, in_flight, visited, seen, counters):
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [(k, str(v)) for k, v in meta.items()])
+        conn.executemany('INSERT INTO frontier VALUES (?, ?)', frontier)
+        conn.executemany('INSERT INTO in_flight VALUES (?, ?)', in_flight)
+        # SQLite integers are signed
+        conn.executemany('INSERT INTO visited VALUES (?)', ((fp - (1 << 64) if fp >= (1 << 63) else fp,) for fp in visited))
+        conn.executemany('INSERT INTO seen VALUES (?)', ((url,) for url in seen))
+        conn.executemany('INSERT INTO counters VALUES (?, ?)', counters.items())
+
+    def load(self):
+        with sqlite3.connect(self.path) as conn:
+            state = {
+                'meta': dict(conn.execute('SELECT key, value FROM meta').fetchall()),
+                'frontier': conn.execute('SELECT url, depth FROM frontier').fetchall(),
+                'in_flight': conn.execute('SELECT url, depth FROM in_flight').fetchall(),
+                'visited': set(fp & ((1 << 64) - 1) for fp, in conn.execute('SELECT fingerprint FROM visited')),
+                'seen': set(url for url, in conn.execute('SELECT url FROM seen')),
+                'counters': dict(conn.execute('SELECT name, value FROM counters').fetchall()),
+            }
+        conn.close()
+        self.appending = True
+        return state
@@ -0,0 +1,168 @@
+import threading
+
+from .FingerprintTable import FingerprintTable, url_fingerprint
+
+
+QUEUED = 1
+IN_FLIGHT = 2
+VISITED = 3
+
+STATE_NAMES = {
+    QUEUED: 'queued',
+    IN_FLIGHT: 'in_flight',
+    VISITED: 'visited',
+}
+
+# Each url's byte in the table holds its state (low 2 bits) and the
+# depth it was claimed at (high 6 bits). Depths from DEEP up are all
+# kept as DEEP, "too deep to tell apart".
+STATE_MASK = 0b11
+DEPTH_SHIFT = 2
+DEEP = 63
+
+
+'''
+ClaimTracker
+    The one place that decides if a url gets fetched. A url is
+    claimed when it is discovered, so it goes in the url_queue once
+    no matter how many pages link to it, and every check-and-set
+    happens under one lock, so two workers can never both fetch it.
+    Each url moves through:
+        queued - claimed at discovery, waiting in the url_queue
+        in_flight - taken by a worker to be fetched
+        visited - its response is stored
+    Every claim turned down is counted by the state that turned it
+    down (eg. a nav link found on 10k pages is 1 claim and 9999
+    suppressed duplicates).
+    A url that is not known yet can be run past an admit_func (eg.
+    TrapDetector.admit) under the same lock, so only the thread that
+    wins the claim counts it.
+    The depth a url was claimed at is kept too. A queued url found
+    again at a smaller depth is claimed again with that depth, so it
+    gets queued again and its subtree is not cut short by --depth
+    (eg. a priority frontier fetched the deeper page first). The
+    entry left in the queue is turned down by start.
+    States are kept by url fingerprint in a FingerprintTable, so
+    tens of millions of urls fit in memory, but the urls themselves
+    can not be listed back.
+
+__init__
+    key_func - optional func(url) -> key to track the url by (eg. to ignore fragments)
+    spill - keep the table in a memory mapped temp file (see FingerprintTable)
+
+claim - claim a discovered url at a depth, False if it is already known and not found shallower (None if admit_func turned it down)
+start - move a url to in_flight, False if it is already in flight or visited (None if admit_func turned it down)
+finish - move a url to visited
+release - move a url back to queued (eg. its fetch was called off)
+get_depth - get the depth a url was claimed at (None if unknown or DEEP)
+set_state - set the state of a url as is (eg. when resuming)
+set_state_fp - same as set_state, with a fingerprint
+fingerprint - get the fingerprint a url is tracked by
+is_known - True if the url is in any state
+is_fetched - True if the url is in flight or visited
+get_fetched - get the fingerprints of the urls in flight or visited
+get_counts - get the number of urls in each state and of suppressed duplicates
+get_bytes - size of the table in bytes
+'''
+class ClaimTracker:
+    def __init__(self, key_func=None, spill=False):
+        if key_func is not None and not callable(key_func):
+            raise TypeError(f"key_func should be of type 'callable', but got {type(key_func).__name__}")
+        self.key_func = key_func
+        self.states = FingerprintTable(spill=spill)
+        self.state_counts = {QUEUED: 0, IN_FLIGHT: 0, VISITED: 0}
+        self.suppressed = {QUEUED: 0, IN_FLIGHT: 0, VISITED: 0}
+        self.lock = threading.Lock()
+
+    def fingerprint(self, url):
+        return url_fingerprint(self.key_func(url) if self.key_func else url)
+
+    # Called with self.lock held. The depth is kept as it was if
+    # not given.
+    def _set(self, fingerprint, state, depth=None):
+        old_value = self.states.get_fp(fingerprint)
+        old_state = old_value & STATE_MASK
+        if old_state:
+            self.state_counts[old_state] -= 1
+        if depth is None:
+            depth = old_value >> DEPTH_SHIFT
+        self.states.set_fp(fingerprint, state | min(depth, DEEP) << DEPTH_SHIFT)
+        self.state_counts[state] += 1
+
+    # admit_func - optional func(url) -> bool, only called for a url that is not known yet
+    def claim(self, url, admit_func=None, depth=0):
+        fingerprint = self.fingerprint(url)
+        with self.lock:
+            value = self.states.get_fp(fingerprint)
+            state = value & STATE_MASK
+            if state:
+                # Not fetched yet and found closer to the seed
+                if state == QUEUED and min(depth, DEEP) < value >> DEPTH_SHIFT:
+                    self._set(fingerprint, QUEUED, depth)
+                    return True
+                self.suppressed[state] += 1
+                return False
+            if admit_func and not admit_func(url):
+                return None
+            self._set(fingerprint, QUEUED, depth)
+            return True
+
+    def start(self, url, admit_func=None):
+        fingerprint = self.fingerprint(url)
+        with self.lock:
+            state = self.states.get_fp(fingerprint) & STATE_MASK
+            if state == IN_FLIGHT or state == VISITED:
+                self.suppressed[state] += 1
+                return False
+            if not state and admit_func and not admit_func(url):
+                return None
+            self._set(fingerprint, IN_FLIGHT)
+            return True
+
+    def finish(self, url):
+        self.set_state(url, VISITED)
+
+    def release(self, url):
+        self.set_state(url, QUEUED)
+
+    def set_state(self, url, state):
+        self.set_state_fp(self.fingerprint(url), state)
+
+    def set_state_fp(self, fingerprint, state):
+        with self.lock:
+            self._set(fingerprint, state)
+
+    # Reads take the lock too, the table is swapped out when it grows
+    def is_known(self, url):
+        fingerprint = self.fingerprint(url)
+        with self.lock:
+            return self.states.get_fp(fingerprint) != 0
+
+    def is_fetched(self, url):
+        fingerprint = self.fingerprint(url)
+        with self.lock:
+            state = self.states.get_fp(fingerprint) & STATE_MASK
+        return state == IN_FLIGHT or state == VISITED
+
+    def get_depth(self, url):
+        fingerprint = self.fingerprint(url)
+        with self.lock:
+            value = self.states.get_fp(fingerprint)
+        if not value or value >> DEPTH_SHIFT == DEEP:
+            return None
+        return value >> DEPTH_SHIFT
+
+    def get_fetched(self):
+        with self.lock:
+            return [fingerprint for fingerprint, value in self.states.items() if value & STATE_MASK != QUEUED]
+
+    def get_counts(self):
+        with self.lock:
+            return (
+                {STATE_NAMES[state]: count for state, count in self.state_counts.items()},
+                {STATE_NAMES[state]: count for state, count in self.suppressed.items()},
+            )
+
+    def get_bytes(self):
+        with self.lock:
+            return self.states.get_bytes()
@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import time
 import random
@@ -46,6 +47,42 @@ class CooldownLock:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.release()
 
+
+'''
+AsyncCooldownLock
+    asyncio version of CooldownLock for the async request engine.
+    Waits out the cooldown (plus jitter) with asyncio.sleep so the
+    event loop keeps running other requests' I/O while it waits.
+    Must be created and used inside the event loop that awaits it.
+'''
+class AsyncCooldownLock:
+    def __init__(self, cooldown_period, max_jitter=0):
+        self.lock = asyncio.Lock()
+        self.cooldown_period = cooldown_period
+        self.last_release_time = None
+        self.max_jitter = max_jitter
+
+    async def acquire(self):
+        jitter = random.uniform(0, self.max_jitter)
+        await self.lock.acquire()
+        if self.last_release_time is not None:
+            remaining = (self.cooldown_period + jitter) - (time.time() - self.last_release_time)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        self.last_release_time = None
+        return True
+
+    def release(self):
+        self.lock.release()
+        self.last_release_time = time.time()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
 '''
 # Example usage
 cooldown_lock = CooldownLock(cooldown_period=5, max_jitter=10)  # 5 seconds cooldown
@@ -0,0 +1,94 @@
+import threading
+from time import time
+
+
+'''
+CrawlBudget
+    Caps a crawl by number of requests, wall time and downloaded
+    body bytes. Every request has to be claimed before it is sent,
+    the first claim past a limit (or a call to stop, eg. on Ctrl-C)
+    marks the budget as spent. From then on no new request is
+    claimed, requests already in flight still finish, so the crawl
+    drains instead of being cut off.
+    The byte limit is checked at claim time, so requests in flight
+    when it is reached can go over it by their own size.
+
+__init__
+    max_requests - max number of requests to send (None = no limit)
+    max_time - max crawl time in seconds (None = no limit)
+    max_bytes - max total size of the downloaded bodies in bytes (None = no limit)
+
+start - start the clock
+claim_request - claim one request, False if the budget is spent
+add_bytes - count downloaded body bytes
+stop - spend the budget now, with the reason why
+is_spent - True if the budget is spent
+get_reason - why the budget was spent (None if it is not)
+get_counts - get (requests, bytes, seconds elapsed)
+'''
+class CrawlBudget:
+    def __init__(self, max_requests=None, max_time=None, max_bytes=None):
+        if max_requests is not None and not isinstance(max_requests, int):
+            raise TypeError(f"max_requests should be of type 'int', but got {type(max_requests).__name__}")
+        if max_time is not None and not isinstance(max_time, (int, float)):
+            raise TypeError(f"max_time should be of type 'float', but got {type(max_time).__name__}")
+        if max_bytes is not None and not isinstance(max_bytes, int):
+            raise TypeError(f"max_bytes should be of type 'int', but got {type(max_bytes).__name__}")
+
+        self.max_requests = max_requests
+        self.max_time = max_time
+        self.max_bytes = max_bytes
+
+        self.requests = 0
+        self.bytes = 0
+        self.start_time = time()
+        self.reason = None
+        self.spent_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.start_time = time()
+
+    def claim_request(self):
+        with self.lock:
+            if self.reason is None:
+                if self.max_requests is not None and self.requests >= self.max_requests:
+                    self._spend('max requests')
+                elif self.max_time is not None and time() - self.start_time >= self.max_time:
+                    self._spend('max time')
+                elif self.max_bytes is not None and self.bytes >= self.max_bytes:
+                    self._spend('max bytes')
+            if self.reason is not None:
+                return False
+            self.requests += 1
+            return True
+
+    def add_bytes(self, num_bytes):
+        with self.lock:
+            self.bytes += num_bytes
+
+    def stop(self, reason):
+        with self.lock:
+            if self.reason is None:
+                self._spend(reason)
+
+    # Called with self.lock held
+    def _spend(self, reason):
+        self.reason = reason
+        self.spent_event.set()
+
+    def is_spent(self):
+        # The time limit is also checked here, so an idle crawl
+        # (eg. only retries waiting) still notices it
+        if not self.spent_event.is_set() and self.max_time is not None:
+            if time() - self.start_time >= self.max_time:
+                self.stop('max time')
+        return self.spent_event.is_set()
+
+    def get_reason(self):
+        with self.lock:
+            return self.reason
+
+    def get_counts(self):
+        with self.lock:
+            return self.requests, self.bytes, time() - self.start_time
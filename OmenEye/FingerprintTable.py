@@ -0,0 +1,137 @@
+import hashlib
+import mmap
+import re
+import tempfile
+
+
+NON_ZERO = re.compile(b'[^\x00]')
+
+
+# n urls make n^2/2 pairs that each collide with odds 2^-64, so a
+# crawl of 10 million urls expects ~2.7e-6 collisions (about one in
+# 370,000 such crawls), 100 million ~2.7e-4. A collision only makes
+# one url look known, it is not fetched.
+def url_fingerprint(url):
+    fingerprint = int.from_bytes(hashlib.blake2b(url.encode(errors='surrogatepass'), digest_size=8).digest(), 'little')
+    # 0 marks an empty slot
+    return fingerprint or 1
+
+
+'''
+FingerprintTable
+    Compact map of url -> small state value (1-255) for very large
+    crawls. Only a 64 bit fingerprint of each url is kept, in an open
+    addressing hash table (linear probing) backed by one flat buffer:
+    8 bytes of fingerprint and 1 byte of state per slot, instead of
+    the 100+ bytes a url string costs in a set or dict. The table
+    doubles when it is 2/3 full. Urls can not be listed back from it.
+    With spill=True the buffer is a memory mapped temp file, so the
+    OS can page it out to disk instead of it taking up RAM.
+    Not thread safe on its own (see ClaimTracker).
+
+__init__
+    capacity - initial number of slots (rounded up to a power of 2)
+    spill - keep the table in a memory mapped temp file
+
+get - get the state of a url (0 if unknown)
+set - set the state of a url
+get_fp - same as get, with a fingerprint
+set_fp - same as set, with a fingerprint
+items - get (fingerprint, state) of every url in the table
+get_bytes - size of the table in bytes
+close - free the table (and its temp file)
+'''
+class FingerprintTable:
+    def __init__(self, capacity=1 << 16, spill=False):
+        if not isinstance(capacity, int):
+            raise TypeError(f"capacity should be of type 'int', but got {type(capacity).__name__}")
+        self.spill = spill
+        self.count = 0
+        self.buffer = None
+        self.spill_file = None
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.allocate(size)
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.max_count = capacity * 2 // 3
+        size = capacity * 9
+        if self.spill:
+            self.spill_file = tempfile.TemporaryFile(prefix='omeneye-fingerprints-')
+            self.spill_file.truncate(size)
+            self.buffer = mmap.mmap(self.spill_file.fileno(), size)
+        else:
+            self.buffer = bytearray(size)
+        view = memoryview(self.buffer)
+        self.keys = view[:capacity * 8].cast('Q')
+        self.values = view[capacity * 8:]
+
+    def grow(self):
+        old_keys, old_values = self.keys, self.values.tobytes()
+        old_buffer, old_file = self.buffer, self.spill_file
+        self.values.release()
+        self.allocate(self.capacity * 2)
+        self.count = 0
+        # Straight from the old table, a list of every entry would
+        # cost more than the table itself
+        for match in NON_ZERO.finditer(old_values):
+            self.set_fp(old_keys[match.start()], old_values[match.start()])
+        old_keys.release()
+        if old_file:
+            old_buffer.close()
+            old_file.close()
+
+    def find(self, fingerprint):
+        keys = self.keys
+        mask = self.mask
+        index = fingerprint & mask
+        while True:
+            key = keys[index]
+            if key == fingerprint or key == 0:
+                return index
+            index = (index + 1) & mask
+
+    def get_fp(self, fingerprint):
+        index = self.find(fingerprint)
+        if self.keys[index] == 0:
+            return 0
+        return self.values[index]
+
+    def set_fp(self, fingerprint, value):
+        index = self.find(fingerprint)
+        if self.keys[index] == 0:
+            if self.count >= self.max_count:
+                self.grow()
+                index = self.find(fingerprint)
+            self.keys[index] = fingerprint
+            self.count += 1
+        self.values[index] = value
+
+    def get(self, url):
+        return self.get_fp(url_fingerprint(url))
+
+    def set(self, url, value):
+        self.set_fp(url_fingerprint(url), value)
+
+    def items(self):
+        keys = self.keys
+        # Used slots are found by the regex engine instead of a
+        # python loop over every slot
+        values = self.values.tobytes()
+        return [(keys[match.start()], values[match.start()]) for match in NON_ZERO.finditer(values)]
+
+    def __len__(self):
+        return self.count
+
+    def get_bytes(self):
+        return self.capacity * 9
+
+    def close(self):
+        self.keys.release()
+        self.values.release()
+        if self.spill_file:
+            self.buffer.close()
+            self.spill_file.close()
@@ -0,0 +1,145 @@
+import heapq
+import itertools
+import threading
+from urllib.parse import urlparse, parse_qsl
+
+from .RequestUtils import url_template
+from .WorkTracker import TrackedQueue, STOP_SIGNAL
+
+
+# Extensions that are worth fetching first (pages that can hold
+# forms, params and links) and ones that rarely hold anything
+DYNAMIC_EXTENSIONS = {
+    '', 'html', 'htm', 'php', 'asp', 'aspx', 'jsp', 'jspx', 'do', 'action',
+    'cgi', 'pl', 'py', 'rb', 'cfm', 'shtml', 'xhtml', 'json', 'xml',
+}
+STATIC_EXTENSIONS = {
+    'css', 'png', 'jpg', 'jpeg', 'gif', 'svg', 'ico', 'webp', 'bmp', 'tif', 'tiff',
+    'woff', 'woff2', 'ttf', 'eot', 'otf', 'mp3', 'mp4', 'avi', 'mov', 'webm',
+    'zip', 'gz', 'tar', 'rar', '7z', 'pdf', 'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
+}
+
+DEFAULT_WEIGHTS = {
+    'depth': 1.0,     # taken off per level of depth
+    'template': 1.0,  # for a path template not seen before (shrinks as it is seen again)
+    'params': 0.5,    # per query param name not seen before
+    'type': 1.0,      # for a dynamic looking extension (taken off for a static one)
+    'form': 1.0,      # for a link found on a page with a form
+    'duplicate': 2.0, # taken off for a link found on a near-duplicate page
+}
+
+
+'''
+FrontierScorer
+    Scores urls as they are discovered, higher is fetched first.
+    The score is a weighted sum of:
+        depth - deeper urls score lower
+        template - novelty of the url's path template (see url_template)
+        params - query param names never seen before
+        type - the content type expected from the url's extension
+        form - the url was linked from a page with a form
+        duplicate - the url was linked from a near-duplicate page
+    Template and param name counts are updated on every scored
+    url, so novelty is judged at discovery time.
+
+__init__
+    weights - dict overriding any of the DEFAULT_WEIGHTS
+
+score - score a (url, depth, ...) item (from_form and from_duplicate describe the page it was linked from)
+'''
+class FrontierScorer:
+    def __init__(self, weights=None):
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            for name in weights:
+                if name not in DEFAULT_WEIGHTS:
+                    raise ValueError(f"Unknown frontier weight '{name}', must be one of {', '.join(DEFAULT_WEIGHTS)}")
+            self.weights.update(weights)
+
+        self.templates = {}
+        self.param_names = set()
+        self.lock = threading.Lock()
+
+    def score(self, item, from_form=False, from_duplicate=False):
+        url, depth = item[0], item[1]
+        weights = self.weights
+        parsed_url = urlparse(url)
+
+        template = url_template(url)
+        names = set(name for name, _ in parse_qsl(parsed_url.query, keep_blank_values=True))
+        with self.lock:
+            seen = self.templates.get(template, 0)
+            self.templates[template] = seen + 1
+            new_names = len(names - self.param_names)
+            self.param_names.update(names)
+
+        score = -weights['depth'] * depth
+        score += weights['template'] / (1 + seen)
+        score += weights['params'] * new_names
+
+        last_segment = parsed_url.path.rsplit('/', 1)[-1]
+        extension = last_segment.rsplit('.', 1)[-1].lower() if '.' in last_segment else ''
+        if extension in DYNAMIC_EXTENSIONS:
+            score += weights['type']
+        elif extension in STATIC_EXTENSIONS:
+            score -= weights['type']
+
+        if from_form:
+            score += weights['form']
+        if from_duplicate:
+            score -= weights['duplicate']
+        return score
+
+
+'''
+Frontier
+    Drop-in replacement for the FIFO url_queue that hands out the
+    highest scoring url first. Items go in and come out as the same
+    (url, depth[, attempt]) tuples, they are kept in a heap of
+    (-score, sequence, item) so every put/get is O(log n) and
+    equal scores come out in FIFO order. Thread safe through
+    queue.Queue's own lock, like queue.PriorityQueue.
+
+__init__
+    tracker - the WorkTracker to count in
+    scorer - FrontierScorer (or anything with score(item, from_form, from_duplicate)) to rank urls with
+    maxsize - max number of urls (0 = no limit)
+
+put - same as TrackedQueue.put, from_form=True marks a url linked from a page with a form,
+      from_duplicate=True one linked from a near-duplicate page
+'''
+class Frontier(TrackedQueue):
+    def __init__(self, tracker=None, scorer=None, maxsize=0):
+        super().__init__(tracker=tracker, maxsize=maxsize)
+        self.scorer = scorer if scorer is not None else FrontierScorer()
+        self.sequence = itertools.count()
+
+    def put(self, item, block=True, timeout=None, force=False, from_form=False, from_duplicate=False):
+        # Wake up signals jump the queue
+        if item is STOP_SIGNAL:
+            priority = float('-inf')
+        else:
+            priority = -self.scorer.score(item, from_form=from_form, from_duplicate=from_duplicate)
+        entry = (priority, next(self.sequence), item)
+        super().put(entry, block=block, timeout=timeout, force=force)
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, entry):
+        heapq.heappush(self.queue, entry)
+
+    def _get(self):
+        # Sizes are all 0 here (no byte limit), BoundedQueue keeps
+        # them in a FIFO that order does not matter for
+        self.bytes -= self.sizes.popleft()
+        return heapq.heappop(self.queue)[2]
+
+    def snapshot(self, lock=True):
+        if not lock:
+            return [entry[2] for entry in self.queue]
+        with self.mutex:
+            return [entry[2] for entry in self.queue]
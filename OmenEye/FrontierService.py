@@ -0,0 +1,436 @@
+import hmac
+import json
+import secrets
+import socket
+import socketserver
+import sqlite3
+import threading
+from time import sleep, time
+
+
+QUEUED = 0
+LEASED = 1
+DONE = 2
+
+
+'''
+FrontierService
+    Shares one frontier, visited set and scope between several
+    OmenEye nodes (eg. on different egress machines) crawling the
+    same target. Nodes talk to it over TCP, one JSON object per line.
+    Its state is kept in SQLite, so a restarted service picks up
+    where it stopped. It listens on localhost unless told otherwise,
+    and every request has to carry the shared token (a connection
+    with a wrong one is dropped).
+
+    Every url is in the urls table once (that is the shared seen and
+    visited set). Nodes lease queued urls in batches and report
+    them done once their responses are stored, a lease that is not
+    reported back within lease_timeout (eg. the node died) goes back
+    in the queue. The crawl is over once nothing is queued or leased,
+    the service stops once every node has disconnected after that.
+
+    Requests (op - fields -> reply), each with a token field:
+        hello - node -> node_id, config (url, max_depth, subdomains, js_grabbing)
+        add - urls [[url, depth], ...] -> added (or made shallower)
+        lease - node, n -> urls [[url, depth], ...]
+        done - urls [url, ...] -> ok
+        status - -> queued, leased, done, finished
+
+__init__
+    url - url to crawl (queued when the db is new)
+    db_path - SQLite file the frontier is kept in
+    host - address to listen on
+    port - port to listen on
+    token - shared secret the nodes send with every request (a random one if not given)
+    max_depth - crawl depth the nodes use
+    subdomains - scope option the nodes use
+    js_grabbing - scope option the nodes use
+    lease_timeout - seconds before a lease that was not reported goes back in the queue
+
+serve - run the service, blocks until the crawl is over
+get_status - get the counts of queued, leased and done urls
+'''
+class FrontierService:
+    def __init__(self,
+            url=None,
+            db_path=None,
+            host='127.0.0.1',
+            port=8750,
+            token=None,
+            max_depth=2,
+            subdomains=False,
+            js_grabbing=False,
+            lease_timeout=300,
+        ):
+        if url is None or not isinstance(url, str):
+            raise TypeError(f"url should be of type 'str', but got {type(url).__name__}")
+        if db_path is None or not isinstance(db_path, str):
+            raise TypeError(f"db_path should be of type 'str', but got {type(db_path).__name__}")
+        if not isinstance(port, int):
+            raise TypeError(f"port should be of type 'int', but got {type(port).__name__}")
+
+        if token is not None and not isinstance(token, str):
+            raise TypeError(f"token should be of type 'str', but got {type(token).__name__}")
+
+        self.host = host
+        self.port = port
+        self.token = token if token else secrets.token_urlsafe(24)
+        self.lease_timeout = lease_timeout
+        self.config = {
+            'url': url,
+            'max_depth': max_depth,
+            'subdomains': subdomains,
+            'js_grabbing': js_grabbing,
+        }
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                depth INTEGER,
+                state INTEGER,
+                node TEXT,
+                leased_at REAL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS urls_state ON urls (state, depth)')
+        # Leases of a service that was stopped are void
+        self.conn.execute('UPDATE urls SET state = ? WHERE state = ?', (QUEUED, LEASED))
+        self.conn.execute('INSERT OR IGNORE INTO urls VALUES (?, 0, ?, NULL, NULL)', (url, QUEUED))
+        self.conn.commit()
+
+        self.next_node_id = 0
+        self.connections = 0
+        self.done_event = threading.Event()
+
+    def serve(self):
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with service.lock:
+                    service.connections += 1
+                try:
+                    for line in self.rfile:
+                        request = json.loads(line)
+                        # Nothing is read or changed without the token
+                        if not service.check_token(request):
+                            self.wfile.write(json.dumps({'error': 'invalid token'}).encode() + b'\n')
+                            self.wfile.flush()
+                            break
+                        reply = service.handle_request(request)
+                        self.wfile.write(json.dumps(reply).encode() + b'\n')
+                        self.wfile.flush()
+                except (ConnectionError, ValueError):
+                    pass
+                finally:
+                    with service.lock:
+                        service.connections -= 1
+                        if service.connections == 0 and service.is_finished():
+                            service.done_event.set()
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        server = socketserver.ThreadingTCPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        print(f'[*] Frontier service for {self.config["url"]} listening on {self.host}:{self.port}')
+        print(f'[*] Nodes need the token {self.token}')
+
+        try:
+            last_report = time()
+            while not self.done_event.wait(1):
+                if time() - last_report >= 10:
+                    last_report = time()
+                    queued, leased, done = self.get_status()
+                    print(f'[*] {queued} queued, {leased} leased, {done} done, {self.connections} nodes connected')
+        except KeyboardInterrupt:
+            print('[*] Caught KeyboardInterrupt. Stopping the frontier service...')
+        server.shutdown()
+        server.server_close()
+        self.conn.close()
+
+    def check_token(self, request):
+        if not isinstance(request, dict) or not isinstance(request.get('token'), str):
+            return False
+        # Constant time, the token can not be guessed a byte at a time
+        return hmac.compare_digest(request['token'].encode(), self.token.encode())
+
+    def handle_request(self, request):
+        op = request.get('op')
+        with self.lock:
+            if op == 'hello':
+                self.next_node_id += 1
+                return {'node_id': self.next_node_id, 'config': self.config}
+            elif op == 'add':
+                before = self.conn.total_changes
+                # A url still queued that was found shallower takes
+                # the smaller depth (see ClaimTracker)
+                self.conn.executemany(
+                    '''INSERT INTO urls VALUES (?, ?, ?, NULL, NULL)
+                    ON CONFLICT (url) DO UPDATE SET depth = excluded.depth
+                    WHERE urls.state = ? AND excluded.depth < urls.depth''',
+                    ((url, depth, QUEUED, QUEUED) for url, depth in request['urls'])
+                )
+                self.conn.commit()
+                return {'added': self.conn.total_changes - before}
+            elif op == 'lease':
+                return {'urls': self.lease(request.get('node'), int(request.get('n', 1)))}
+            elif op == 'done':
+                self.conn.executemany('UPDATE urls SET state = ? WHERE url = ?', ((DONE, url) for url in request['urls']))
+                self.conn.commit()
+                return {'ok': True}
+            elif op == 'status':
+                queued, leased, done = self._status()
+                return {'queued': queued, 'leased': leased, 'done': done, 'finished': queued == 0 and leased == 0}
+            return {'error': f'unknown op {op}'}
+
+    # Called with self.lock held
+    def lease(self, node, n):
+        now = time()
+        self.conn.execute(
+            'UPDATE urls SET state = ? WHERE state = ? AND leased_at < ?',
+            (QUEUED, LEASED, now - self.lease_timeout)
+        )
+        # Shallowest first, the same order a single crawl goes in
+        rows = self.conn.execute(
+            'SELECT url, depth FROM urls WHERE state = ? ORDER BY depth, rowid LIMIT ?',
+            (QUEUED, n)
+        ).fetchall()
+        self.conn.executemany(
+            'UPDATE urls SET state = ?, node = ?, leased_at = ? WHERE url = ?',
+            ((LEASED, node, now, url) for url, _ in rows)
+        )
+        self.conn.commit()
+        return rows
+
+    # Called with self.lock held
+    def _status(self):
+        counts = dict(self.conn.execute('SELECT state, COUNT(*) FROM urls GROUP BY state').fetchall())
+        return counts.get(QUEUED, 0), counts.get(LEASED, 0), counts.get(DONE, 0)
+
+    # Called with self.lock held
+    def is_finished(self):
+        queued, leased, _ = self._status()
+        return queued == 0 and leased == 0
+
+    def get_status(self):
+        with self.lock:
+            return self._status()
+
+
+'''
+FrontierClient
+    Connection to a FrontierService, one request at a time.
+    Reconnects (a few tries) if the service went away. An error
+    reply (eg. a wrong token) raises RuntimeError.
+
+__init__
+    address - "host:port" of the service
+    token - shared token of the service
+
+call - send a request, returns the reply
+close - close the connection
+'''
+class FrontierClient:
+    def __init__(self, address=None, token=None, retries=5):
+        if address is None or not isinstance(address, str):
+            raise TypeError(f"address should be of type 'str', but got {type(address).__name__}")
+        if token is None or not isinstance(token, str):
+            raise TypeError(f"token should be of type 'str', but got {type(token).__name__}")
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.token = token
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        self.sock = socket.create_connection(self.address, timeout=30)
+        self.file = self.sock.makefile('rwb')
+
+    def close(self):
+        if self.sock:
+            self.file.close()
+            self.sock.close()
+        self.sock = None
+        self.file = None
+
+    def call(self, op, **fields):
+        request = json.dumps(dict(op=op, token=self.token, **fields)).encode() + b'\n'
+        with self.lock:
+            for attempt in range(self.retries):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    self.file.write(request)
+                    self.file.flush()
+                    line = self.file.readline()
+                    if not line:
+                        raise ConnectionError('frontier service closed the connection')
+                    reply = json.loads(line)
+                    break
+                except OSError:
+                    self.close()
+                    if attempt == self.retries - 1:
+                        raise
+                    sleep(1 + attempt)
+        # Not retried, the same request would get the same answer
+        if 'error' in reply:
+            raise RuntimeError(f"frontier service: {reply['error']}")
+        return reply
+
+
+'''
+RemoteFrontier
+    The node side of a distributed crawl, plugged into OmenEye as its
+    partition: every url found is sent to the FrontierService, and
+    urls are leased from it into the local frontier whenever that
+    runs low. Urls are reported done once their responses are stored
+    (after the links found on them were sent), so the service knows
+    the crawl is over when nothing is queued or leased.
+
+    Urls found and urls done are buffered until the service took
+    them, a call that failed is tried again by the lease thread. If
+    the service can not be reached max_failures times in a row, the
+    node gives up on it: the crawl is marked finished and drains
+    what is already queued here.
+
+__init__
+    address - "host:port" of the FrontierService
+    token - shared token of the FrontierService
+    lease_size - number of urls to lease at once
+    max_failures - failed rounds of the lease thread in a row before giving up on the service
+
+seeding - (always True) every node sends its seeds, the service keeps each url once
+hello - register with the service, returns the shared config
+owns - (always False) every url goes through the service
+forward - send a url to the service (buffered)
+flush - send what is buffered, raises if the service can not be reached
+finish - report urls stored or dropped by this node (buffered)
+start - start the lease thread, feeding the given OmenEye
+wait_finished - wait for the whole crawl to be done
+stop - stop the lease thread
+'''
+class RemoteFrontier:
+    seeding = True
+
+    def __init__(self, address=None, token=None, lease_size=50, max_failures=10):
+        if not isinstance(lease_size, int):
+            raise TypeError(f"lease_size should be of type 'int', but got {type(lease_size).__name__}")
+        if not isinstance(max_failures, int):
+            raise TypeError(f"max_failures should be of type 'int', but got {type(max_failures).__name__}")
+        self.client = FrontierClient(address, token=token)
+        self.lease_size = lease_size
+        self.max_failures = max_failures
+        self.node = socket.gethostname()
+
+        self.buffer = []
+        self.done = []
+        self.lock = threading.Lock()
+        self.crawler = None
+        self.finished_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def hello(self):
+        reply = self.client.call('hello')
+        self.node = f'{self.node}-{reply["node_id"]}'
+        return reply['config']
+
+    def owns(self, url):
+        return False
+
+    def forward(self, url, depth, from_form=False):
+        with self.lock:
+            self.buffer.append((url, depth))
+            full = len(self.buffer) >= 500
+        if full:
+            self.try_flush()
+
+    def flush(self):
+        with self.lock:
+            urls, self.buffer = self.buffer, []
+            done, self.done = self.done, []
+        try:
+            # Links found on these pages go out first, or the service
+            # could see nothing queued or leased and call the crawl over
+            if urls:
+                self.client.call('add', urls=urls)
+            if done:
+                self.client.call('done', urls=done)
+        except (OSError, RuntimeError):
+            # Kept for the next try, in order (adding a url twice is a no-op)
+            with self.lock:
+                self.buffer[:0] = urls
+                self.done[:0] = done
+            raise
+
+    # From the crawler's threads, the lease thread tries again
+    def try_flush(self):
+        try:
+            self.flush()
+        except (OSError, RuntimeError) as e:
+            print(f'[!] RemoteFrontier: could not reach the frontier service, will try again: {e}')
+
+    def finish(self, urls):
+        with self.lock:
+            self.done.extend(urls)
+        self.try_flush()
+
+    def start(self, crawler):
+        self.crawler = crawler
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        try:
+            self.flush()
+        except (OSError, RuntimeError) as e:
+            print(f'[!] RemoteFrontier: {len(self.buffer)} urls found and {len(self.done)} done never reached the frontier service: {e}')
+        self.client.close()
+
+    def wait_finished(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+    def run(self):
+        failures = 0
+        while not self.stop_event.is_set():
+            try:
+                self.lease()
+                failures = 0
+            except (OSError, RuntimeError) as e:
+                failures += 1
+                print(f'[!] RemoteFrontier: frontier service error ({failures}/{self.max_failures}): {e}')
+                # The node drains what it has and exits instead of
+                # waiting on a service that is gone
+                if failures >= self.max_failures:
+                    print('[!] RemoteFrontier: giving up on the frontier service')
+                    self.finished_event.set()
+                    return
+                self.stop_event.wait(5)
+
+    # One round of the lease thread
+    def lease(self):
+        self.flush()
+
+        # A spent budget stops the leasing, this node is done
+        # once what it has left drains
+        if self.crawler.budget.is_spent():
+            self.finished_event.set()
+
+        urls = []
+        if not self.crawler.budget.is_spent() and self.crawler.url_queue.qsize() < self.lease_size:
+            urls = self.client.call('lease', node=self.node, n=self.lease_size)['urls']
+            for url, depth in urls:
+                self.crawler.url_queue.put((url, depth))
+
+        if not urls:
+            if self.client.call('status')['finished']:
+                self.finished_event.set()
+            self.stop_event.wait(0.5)
@@ -0,0 +1,186 @@
+from .RequestUtils import PageParser, extract_tag, add_link, LIST_ATTRIBUTES
+
+
+# Elements the C parsers read as text (HTML5 raw text / RCDATA) but
+# html.parser reads markup in as tags, eg. a <textarea> prefilled
+# with html. Their text is run through PageParser, so the links and
+# inputs in it are found the same.
+RAW_TEXT_TAGS = {'textarea', 'title', 'xmp', 'iframe', 'noembed', 'noframes', 'plaintext'}
+
+# Where the C backends still differ from html.parser (see
+# tests/test_html_parsers.py):
+#   duplicate attributes - the first one wins (HTML5), not the last
+#   entities in <textarea>/<title> - &lt;a&gt; is decoded before the
+#       text is read for tags, so it counts as a tag
+#   malformed markup (eg. an unclosed quote or tag) - each parser
+#       recovers its own way
+
+
+# Attributes the way BeautifulSoup and PageParser read them (no
+# value = '', class and co. split into words)
+def read_attributes(attributes):
+    attrs = {}
+    for key, value in attributes.items():
+        if value is None:
+            value = ''
+        elif key in LIST_ATTRIBUTES:
+            value = value.split()
+        attrs[key] = value
+    return attrs
+
+
+def extract_raw_text(text, base_url, links, inputs):
+    if '<' not in text:
+        return
+    parser = PageParser(base_url)
+    parser.feed(text)
+    parser.close()
+    links.update(parser.links)
+    inputs.extend(parser.inputs)
+
+
+'''
+PythonHtmlParser
+    The html.parser backend (pure python, always there), see PageParser.
+
+extract - get (set of links, list of inputs) of a decoded html page
+'''
+class PythonHtmlParser:
+    name = 'html.parser'
+
+    def extract(self, text, base_url):
+        parser = PageParser(base_url)
+        parser.feed(text)
+        parser.close()
+        return parser.links, parser.inputs
+
+
+'''
+LxmlTarget
+    Parser target (SAX-like events) of LxmlHtmlParser, no tree is
+    built. Unlike the tree, the events give a bare boolean attribute
+    as '' and keep disabled="disabled" as written.
+
+__init__
+    base_url - url links are resolved against
+'''
+class LxmlTarget:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.links = set()
+        self.inputs = []
+        # Text of every <loc> still open (sitemap links in an html page)
+        self.locs = []
+        # Text of the raw text element that is open
+        self.raw_text = None
+
+    def start(self, tag, attrib):
+        extract_tag(tag, read_attributes(attrib), self.base_url, self.links, self.inputs)
+        if tag == 'loc':
+            self.locs.append([])
+        elif tag in RAW_TEXT_TAGS:
+            self.raw_text = []
+
+    def end(self, tag):
+        if tag == 'loc' and self.locs:
+            add_link(self.links, self.base_url, ''.join(self.locs.pop()))
+        elif tag in RAW_TEXT_TAGS and self.raw_text is not None:
+            extract_raw_text(''.join(self.raw_text), self.base_url, self.links, self.inputs)
+            self.raw_text = None
+
+    def data(self, data):
+        for loc in self.locs:
+            loc.append(data)
+        if self.raw_text is not None:
+            self.raw_text.append(data)
+
+    def close(self):
+        while self.locs:
+            add_link(self.links, self.base_url, ''.join(self.locs.pop()))
+        return self.links, self.inputs
+
+
+'''
+LxmlHtmlParser
+    The lxml (libxml2) backend. Tags are streamed from C to a
+    LxmlTarget. Raises ImportError if lxml is not installed.
+
+extract - get (set of links, list of inputs) of a decoded html page
+'''
+class LxmlHtmlParser:
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.etree
+        self.etree = lxml.etree
+
+    def extract(self, text, base_url):
+        target = LxmlTarget(base_url)
+        # One parser per page, a target parser can not be reused
+        parser = self.etree.HTMLParser(target=target, encoding='utf-8')
+        try:
+            # As utf-8 bytes, lxml refuses str with an encoding declaration
+            parser.feed(text.encode('utf-8', errors='replace'))
+            return parser.close()
+        except (self.etree.ParserError, self.etree.XMLSyntaxError):
+            # Whatever was read up to the error
+            return target.close()
+
+
+'''
+SelectolaxHtmlParser
+    The selectolax (lexbor) backend, an HTML5 parser in C. The
+    content of a <template> is not part of the tree lexbor walks, it
+    is read from its html by PageParser. Raises ImportError if
+    selectolax is not installed.
+
+extract - get (set of links, list of inputs) of a decoded html page
+'''
+class SelectolaxHtmlParser:
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self.parse = LexborHTMLParser
+
+    def extract(self, text, base_url):
+        links = set()
+        inputs = []
+        root = self.parse(text).root
+        if root is None:
+            return links, inputs
+
+        for node in root.traverse():
+            tag = node.tag
+            if tag == 'template':
+                extract_raw_text(node.html, base_url, links, inputs)
+                continue
+            extract_tag(tag, read_attributes(node.attributes), base_url, links, inputs)
+            if tag == 'loc':
+                add_link(links, base_url, node.text())
+            elif tag in RAW_TEXT_TAGS:
+                extract_raw_text(node.text(), base_url, links, inputs)
+        return links, inputs
+
+
+HTML_PARSERS = {
+    'html.parser': PythonHtmlParser,
+    'lxml': LxmlHtmlParser,
+    'selectolax': SelectolaxHtmlParser,
+}
+# A backend that is not installed falls back to the next one,
+# html.parser is always there
+FALLBACK_ORDER = ('selectolax', 'lxml', 'html.parser')
+
+
+# Get the backend called name, or the next one in FALLBACK_ORDER if
+# it is not installed
+def get_html_parser(name='html.parser'):
+    if name not in HTML_PARSERS:
+        raise ValueError(f"Unknown html parser '{name}', must be one of {', '.join(HTML_PARSERS)}")
+
+    for candidate in FALLBACK_ORDER[FALLBACK_ORDER.index(name):]:
+        try:
+            return HTML_PARSERS[candidate]()
+        except ImportError:
+            print(f'[!] HTML parser {candidate} is not installed, falling back')
@@ -0,0 +1,120 @@
+import hashlib
+import re
+import threading
+
+
+# Markup that never shows on the page, then every other tag
+HIDDEN_MARKUP = re.compile(r'<(script|style|noscript)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+TAGS = re.compile(r'<[^>]*>')
+# Words in any script, not only ASCII ones, or a Cyrillic or CJK
+# site would be compared on its (shared) English nav alone
+WORDS = re.compile(r'\w+')
+
+# Pages with fewer shingles than this are too short to compare
+MIN_SHINGLES = 16
+SHINGLE_SIZE = 3
+# Only the start of a huge page is fingerprinted, it is plenty to
+# tell pages apart and keeps the lanes below from overflowing
+MAX_CHARS = 1024*1024
+
+# Every bit of a fingerprint is summed in its own 24 bit lane of one
+# big int, so a page is 8 table lookups and one add per shingle
+# instead of a loop over 64 bits. SPREAD[j][b] is byte b of a
+# fingerprint at byte position j, spread out over its lanes.
+LANE_BITS = 24
+LANE_MASK = (1 << LANE_BITS) - 1
+SPREAD = [
+    [
+        sum(1 << ((j * 8 + bit) * LANE_BITS) for bit in range(8) if value >> bit & 1)
+        for value in range(256)
+    ]
+    for j in range(8)
+]
+
+
+def page_simhash(text):
+    # 64 bit SimHash of the visible words of a decoded html page
+    # (see get_text), pages that differ by a few words differ by a
+    # few bits. None if the page is too short to say.
+    if not text:
+        return None
+    text = TAGS.sub(' ', HIDDEN_MARKUP.sub(' ', text[:MAX_CHARS])).lower()
+    words = WORDS.findall(text)
+    if len(words) < MIN_SHINGLES + SHINGLE_SIZE - 1:
+        return None
+
+    shingles = {}
+    for i in range(len(words) - SHINGLE_SIZE + 1):
+        shingle = ' '.join(words[i:i + SHINGLE_SIZE]).encode(errors='surrogatepass')
+        shingles[shingle] = shingles.get(shingle, 0) + 1
+
+    spread = SPREAD
+    lanes = 0
+    for shingle, count in shingles.items():
+        d = hashlib.blake2b(shingle, digest_size=8).digest()
+        lanes += count * (
+            spread[0][d[0]] + spread[1][d[1]] + spread[2][d[2]] + spread[3][d[3]]
+            + spread[4][d[4]] + spread[5][d[5]] + spread[6][d[6]] + spread[7][d[7]]
+        )
+
+    # A bit is set when it was set in more than half of the (weighted) shingles
+    half = (len(words) - SHINGLE_SIZE + 1) // 2
+    simhash = 0
+    for bit in range(64):
+        if (lanes >> (bit * LANE_BITS)) & LANE_MASK > half:
+            simhash |= 1 << bit
+    return simhash
+
+
+'''
+NearDuplicateIndex
+    Finds pages that are near-duplicates of a page already crawled
+    (eg. one page served under endless url variants) by the Hamming
+    distance of their page_simhash fingerprints. Fingerprints are
+    indexed by max_distance+1 bands of their bits, two fingerprints
+    max_distance bits apart or less always share a whole band
+    (pigeonhole), so only the pages in the same bucket of one of the
+    bands are compared instead of every page.
+    Only the first page of a group of near-duplicates is indexed.
+
+__init__
+    max_distance - max number of differing bits for two pages to be near-duplicates
+
+check - get the url of the page a fingerprint duplicates (None if it is new, then it is indexed)
+get_counts - get the number of pages indexed and of near-duplicates found
+'''
+class NearDuplicateIndex:
+    def __init__(self, max_distance=3):
+        if not isinstance(max_distance, int):
+            raise TypeError(f"max_distance should be of type 'int', but got {type(max_distance).__name__}")
+        if not 0 <= max_distance < 16:
+            raise ValueError(f"max_distance should be between 0 and 15, but got {max_distance}")
+
+        self.max_distance = max_distance
+        self.num_bands = max_distance + 1
+        # Bands as even as 64 bits split
+        bounds = [64 * i // self.num_bands for i in range(self.num_bands + 1)]
+        self.bands = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self.buckets = [{} for _ in self.bands]
+
+        self.indexed = 0
+        self.duplicates = 0
+        self.lock = threading.Lock()
+
+    def check(self, url, simhash):
+        keys = [(simhash >> start) & mask for start, mask in self.bands]
+        with self.lock:
+            for buckets, key in zip(self.buckets, keys):
+                for other_simhash, other_url in buckets.get(key, ()):
+                    if bin(simhash ^ other_simhash).count('1') <= self.max_distance:
+                        self.duplicates += 1
+                        return other_url
+
+            for buckets, key in zip(self.buckets, keys):
+                buckets.setdefault(key, []).append((simhash, url))
+            self.indexed += 1
+            return None
+
+    def get_counts(self):
+        with self.lock:
+            return self.indexed, self.duplicates
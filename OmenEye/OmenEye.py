@@ -1,5 +1,6 @@
 import queue
 import curses
+from array import array
 import requests
 import time
 import threading
@@ -10,6 +11,22 @@ from .CooldownLock import CooldownLock
 from .Canaries import BasicWAFCanary, AdaptiveWAFCanary
 from .GetAuthSession import get_auth_session
 from .DriverUtils import DriverCheckoutManager, create_webdriver, create_auth_webdriver, get_rendered_content
+from .PooledAdapter import mount_pooled_adapter
+from .AsyncRequestEngine import AsyncRequestEngine
+from .RetryPolicy import RetryPolicy, BackoffRetryPolicy, RetryScheduler
+from .WorkTracker import WorkTracker, TrackedQueue, STOP_SIGNAL
+from .BoundedQueue import BoundedQueue
+from .AutoScaler import AutoScaler
+from .Frontier import Frontier, FrontierScorer
+from .CrawlBudget import CrawlBudget
+from .ParserPool import ParserPool
+from .Checkpoint import CrawlCheckpoint
+from .Canonicalizer import UrlCanonicalizer, DEFAULT_RULES
+from .ClaimTracker import ClaimTracker, VISITED
+from .TrapDetector import TrapDetector
+from .NearDuplicateIndex import NearDuplicateIndex
+from .Soft404Detector import Soft404Detector
+from .HtmlParsers import get_html_parser, HTML_PARSERS
 
 from .RequestUtils import *
 #Functions imported from RequestUtils
@@ -27,6 +44,44 @@ from .RequestUtils import *
 #    check_urls_list
 #    is_valid_url
 #    standardize_url
+#    FetchPolicy
+
+
+# Avoid any logouts that could kill the session.
+LOGOUT_PATTERNS = [
+    "logout",
+    "log-out",
+    "log_out",
+    "log%20out",
+    "log%2520out",
+    "log out",
+    "signout",
+    "sign-out",
+    "sign_out",
+    "sign%20out",
+    "sign%2520out",
+    "sign out",
+]
+
+def is_logout(url):
+    url = url.lower()
+    for l in LOGOUT_PATTERNS:
+        if l in url:
+            return True
+    return False
+
+
+# Sizes used to bound the queues by body bytes
+def response_item_size(item):
+    if isinstance(item, tuple) and item[1] is not None:
+        return len(item[1])
+    return 0
+
+def result_item_size(item):
+    content = getattr(item, 'content', None)
+    if content is not None:
+        return len(content)
+    return 0
 
 
 class OmenEye:
@@ -39,6 +94,9 @@ class OmenEye:
 
             mitm_port=None,
             max_depth=2, # depth
+            max_requests=None,
+            max_time=None, # seconds
+            max_bytes=None,
             delay=None,
             jitter=None,
 
@@ -58,6 +116,7 @@ class OmenEye:
 
             canary=None,
             proxy=None,
+            keep_alive=False,
 
             render=None,
             headless=None,
@@ -67,6 +126,53 @@ class OmenEye:
             num_request_workers=5, # workers
             num_response_parsers=2, # parsers
             num_db_workers=3, # db-workers
+            num_parser_processes=0, # parser-processes
+            batch_size=None,
+
+            autoscale=False,
+            autoscale_max=32,
+
+            priority_frontier=False,
+            frontier_weights=None,
+
+            queue_size=500,
+            queue_bytes=1024*1024*256, # 256 MB
+
+            engine='threads',
+            concurrency=100,
+            fuse_stages=True,
+
+            max_size=1024*1024*250, # 250 MB
+            chunk_size=1024*64, # 64 KB
+            spill_size=1024*1024*8, # 8 MB
+
+            fetch_policy=False,
+            fetch_policy_file=None,
+            truncate_size=1024*64, # 64 KB
+
+            retry_policy=None,
+            max_retries=3,
+            retry_budget=50,
+
+            follow_redirects=0,
+
+            resume=False,
+            checkpoint_interval=300, # seconds
+
+            partition=None,
+
+            canonical_rules=DEFAULT_RULES,
+            ignored_params=None,
+
+            spill_fingerprints=False,
+
+            template_budget=None,
+            max_segment_repeats=None,
+
+            near_duplicates='off', # off, deprioritize or prune
+            soft_404='off', # off, directory or host
+
+            html_parser='html.parser', # html.parser, lxml or selectolax
 
         ):
 
@@ -88,55 +194,220 @@ class OmenEye:
         NumResponseParsers = num_response_parsers
         NumDBWorkers = num_db_workers
 
-        self.url_queue = queue.Queue()
-        self.request_queue = queue.Queue()
-        self.response_queue = queue.Queue()
-        self.results_queue = queue.Queue()
+        # The crawl state that only lives in memory is saved next to
+        # the output DB, so a crawl that crashed or was stopped can
+        # pick up where it left off
+        self.checkpoint = CrawlCheckpoint(db_name + '.checkpoint')
+        self.checkpoint_interval = checkpoint_interval if not partition else 0
+        if resume and not self.checkpoint.exists():
+            print(f"No checkpoint to resume from. Expected '{self.checkpoint.path}'")
+            exit(1)
+
+        # Html pages can be parsed by a C backend, one that is not
+        # installed falls back to the next (see HtmlParsers)
+        if html_parser not in HTML_PARSERS:
+            print('Invalid html parser. Must be one of ' + ', '.join(HTML_PARSERS) + '. Got ' + str(html_parser))
+            exit(1)
+        self.html_parser = get_html_parser(html_parser)
+
+        # Parser threads only hand bodies to the processes and wait,
+        # so there must be at least one per process to keep them busy
+        if num_parser_processes:
+            self.parser_pool = ParserPool(num_processes=num_parser_processes, html_parser=self.html_parser.name)
+            NumResponseParsers = max(NumResponseParsers, num_parser_processes)
+        else:
+            self.parser_pool = None
+
+        # Every url, request and response in flight is counted in
+        # one tracker so the end of the crawl is an event, not a poll
+        self.pipeline = WorkTracker()
+        # Every queue after the frontier is bounded by items and
+        # body bytes, so a slow stage blocks the ones before it all
+        # the way up to the fetch stage instead of piling bodies up
+        # in memory. The url_queue is left unbounded, the parsers
+        # feed it and blocking them there could deadlock the loop.
+        # Pages served under endless url variants are fingerprinted and
+        # flagged, their links go to the back of a priority frontier
+        # (deprioritize) or are not followed (prune)
+        if near_duplicates not in ('off', 'deprioritize', 'prune'):
+            print('Invalid near duplicates mode. Must be "off", "deprioritize" or "prune". Got ' + str(near_duplicates))
+            exit(1)
+        self.near_duplicates = near_duplicates
+        if near_duplicates != 'off':
+            self.near_duplicate_index = NearDuplicateIndex()
+        else:
+            self.near_duplicate_index = None
+
+        # Catch-all "not found" pages served with a 200 are spotted by
+        # probing a random path once per directory (or host)
+        if soft_404 in ('directory', 'host'):
+            self.soft_404_detector = Soft404Detector(fetch_func=self.probe_url, per=soft_404)
+        elif soft_404 == 'off':
+            self.soft_404_detector = None
+        else:
+            print('Invalid soft 404 mode. Must be "off", "directory" or "host". Got ' + str(soft_404))
+            exit(1)
 
-        self.RequestBuilders = WorkerManager(
-            worker_func=self.request_builder,
-            num_threads=NumRequestBuilders,
-            input_queue=self.url_queue,
-            output_queue=self.request_queue
-        )
-        self.RequestWorkers = WorkerManager(
-            worker_func=self.request_worker,
-            num_threads=NumRequestWorkers,
-            input_queue=self.request_queue,
-            output_queue=self.response_queue
+        if priority_frontier or near_duplicates == 'deprioritize':
+            # Highest value urls first instead of BFS order
+            self.url_queue = Frontier(self.pipeline, scorer=FrontierScorer(weights=frontier_weights))
+        else:
+            self.url_queue = TrackedQueue(self.pipeline)
+        self.request_queue = TrackedQueue(self.pipeline, maxsize=queue_size)
+        self.response_queue = TrackedQueue(
+            self.pipeline,
+            maxsize=queue_size,
+            max_bytes=queue_bytes,
+            size_func=response_item_size
         )
-        self.ResponseParsers = WorkerManager(
-            worker_func=self.response_parser,
-            num_threads=NumResponseParsers,
-            input_queue=self.response_queue,
-            output_queue=self.results_queue
+        self.results_queue = BoundedQueue(
+            maxsize=queue_size,
+            max_bytes=queue_bytes,
+            size_func=result_item_size
         )
+
+        # Building a request is only a visited check, so by default
+        # it runs in the Request Workers themselves instead of paying
+        # a queue hop per url (the request_queue then sits unused)
+        self.fuse_stages = fuse_stages
+        if self.fuse_stages:
+            self.RequestBuilders = None
+            self.RequestWorkers = WorkerManager(
+                worker_func=[self.request_builder, self.request_worker],
+                num_threads=NumRequestWorkers,
+                input_queue=self.url_queue,
+                output_queue=self.response_queue,
+                multi_output=True
+            )
+        else:
+            self.RequestBuilders = WorkerManager(
+                worker_func=self.request_builder,
+                num_threads=NumRequestBuilders,
+                input_queue=self.url_queue,
+                output_queue=self.request_queue
+            )
+            self.RequestWorkers = WorkerManager(
+                worker_func=self.request_worker,
+                num_threads=NumRequestWorkers,
+                input_queue=self.request_queue,
+                output_queue=self.response_queue,
+                multi_output=True
+            )
+        # In batch mode parsers and DB workers take up to batch_size
+        # items at a time (one process pool submit / one transaction each)
+        if batch_size and batch_size > 1:
+            self.ResponseParsers = WorkerManager(
+                worker_func=self.response_parser_batch,
+                num_threads=NumResponseParsers,
+                input_queue=self.response_queue,
+                output_queue=self.results_queue,
+                batch_size=batch_size
+            )
+        else:
+            batch_size = None
+            self.ResponseParsers = WorkerManager(
+                worker_func=self.response_parser,
+                num_threads=NumResponseParsers,
+                input_queue=self.response_queue,
+                output_queue=self.results_queue
+            )
         self.DBWorkers = ResponseDBManager(
             db_name=db_name,
             num_threads=NumDBWorkers,
-            input_queue=self.results_queue
+            input_queue=self.results_queue,
+            batch_size=batch_size,
+            resume=resume,
+            commit_func=self.finish_in_flight
         )
         #---------------------------------------
         self.url = url
 
-        self.url_queue.put((url, 0))
-        
-        self.visited = set()
+        # Every url is canonicalized once, when it is discovered, and
+        # claims/seen are keyed on that form
+        self.canonicalizer = UrlCanonicalizer(rules=canonical_rules, ignored_params=ignored_params)
+        self.canonicalize = self.canonicalizer.canonicalize
+
+        # Queued, in flight and visited urls, claimed at discovery so
+        # each one is queued and fetched once. Fragments cause way too
+        # many requests, so they are ignored even when the canonical
+        # form keeps them.
+        # Kept as 64 bit fingerprints, not url strings.
+        if self.canonicalizer.strip_fragment:
+            self.claims = ClaimTracker(spill=spill_fingerprints)
+        else:
+            self.claims = ClaimTracker(key_func=lambda url: url.split('#')[0], spill=spill_fingerprints)
+        # Seen urls are only ever read back to record them as
+        # unvisited, so the strings are only kept when asked for
+        self.unvisited = unvisited
         self.seen = set()
+        # What the next checkpoint appends, seen urls and the
+        # fingerprints of the urls committed since the last one
+        self.new_seen = []
+        self.seen_lock = threading.Lock()
+        self.new_visited = array('Q')
+
+        # Calendars, faceted search and endless pagination are cut off
+        # at template_budget urls per url template
+        if template_budget is not None or max_segment_repeats is not None:
+            self.traps = TrapDetector(template_budget=template_budget, max_segment_repeats=max_segment_repeats)
+        else:
+            self.traps = None
+
+        # Urls claimed for fetching whose responses are not committed
+        # to a DB yet, a resumed crawl has to fetch them again
+        self.in_flight = {}
+        self.in_flight_lock = threading.Lock()
+
+        # Frontier urls never fetched because the budget was spent
+        self.unfetched = {}
+        self.unfetched_lock = threading.Lock()
 
-        self.unvisited = unvisited
 
+        # One process of a sharded crawl (HostPartition) or one node of
+        # a distributed one (RemoteFrontier), urls it does not own
+        # are forwarded instead of queued here
+        self.partition = partition
+        # Of a sharded crawl, only the process owning the url's host
+        # takes the seeds and fetches robots.txt
+        seeding = not partition or partition.seeding
 
-        if seed_file:
+        if resume:
+            self.resume_from_checkpoint()
+        elif seeding:
+            self.put_seed(url)
+
+
+        if seed_file and seeding and not resume:
             with open(seed_file, 'r') as sf:
                 url_list = sf.read().strip().split('\n')
             url_list = filter_invalid_urls(url_list)
             for seed_url in url_list:
-                self.url_queue.put((seed_url, 0))
+                self.put_seed(seed_url)
 
 
         self.MaxDepth = max_depth
 
+        # Also spent by the first Ctrl-C, so the crawl drains cleanly
+        self.budget = CrawlBudget(
+            max_requests=max_requests,
+            max_time=max_time,
+            max_bytes=max_bytes
+        )
+
+
+        # Response body limits
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.spill_size = spill_size
+
+        # Skip/truncate bodies that will never be parsed
+        if fetch_policy_file:
+            self.fetch_policy = FetchPolicy.from_file(fetch_policy_file, truncate_size=truncate_size)
+        elif fetch_policy:
+            self.fetch_policy = FetchPolicy(truncate_size=truncate_size)
+        else:
+            self.fetch_policy = None
+
 
         if canary:
             if canary.lower() == 'basic':
@@ -168,12 +439,12 @@ class OmenEye:
         )
 
 
-        if robots:
+        if robots and seeding:
             self.scope.add_rules_from_robots()
-        if sitemaps:
+        if sitemaps and seeding and not resume:
             self.scope.get_sitemaps_from_robots()
             for smap in self.scope.sitemaps:
-                self.url_queue.put((smap, 0))
+                self.put_seed(smap)
 
 
         if blacklist_file:
@@ -185,7 +456,15 @@ class OmenEye:
             self.session = get_auth_session(port=mitm_port)
         else:
             self.session = requests.Session()
-        self.session.keep_alive = False
+
+        # Keep-alive pools sized so every request worker can hold
+        # a connection to the same host, instead of paying a fresh
+        # TCP+TLS handshake per request
+        if keep_alive:
+            self.pool_stats = mount_pooled_adapter(self.session, num_workers=NumRequestWorkers)
+        else:
+            self.session.keep_alive = False
+            self.pool_stats = None
         user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/42.0.2311.135 Safari/537.36 Edge/12.246'
         self.session.headers.update({'User-Agent': user_agent})
 
@@ -240,133 +519,545 @@ class OmenEye:
         else:
             self.timing_lock = None
 
+        # Requests on the wire at once, the fetch workers' and the
+        # soft-404 probes' together (the async engine keeps its own)
+        self.fetch_slots = threading.BoundedSemaphore(autoscale_max if autoscale else NumRequestWorkers)
 
-        
 
-    def request_builder(self, item):
-        url, depth = item
-        if not url in self.visited and not url.split('#')[0] in self.visited and not url.split('#')[0] + '#' in self.visited:
-            self.visited.add(url)
-            request = requests.Request('GET', url)
-            return (request, depth)
+        # Retries go back through the url_queue after a delay
+        # instead of being retried on the spot by the worker
+        if retry_policy == 'backoff':
+            self.retry_policy = BackoffRetryPolicy(max_retries=max_retries, host_budget=retry_budget)
+        elif isinstance(retry_policy, RetryPolicy):
+            self.retry_policy = retry_policy
+        elif retry_policy is None or retry_policy == 'immediate':
+            self.retry_policy = None
+        else:
+            print('Invalid retry policy. Must be "immediate" or "backoff". Got ' + str(retry_policy))
+            exit(1)
+
+        if self.retry_policy:
+            self.retry_scheduler = RetryScheduler(output_queue=self.url_queue, tracker=self.pipeline)
+            self.fetch_retries = 0
+        else:
+            self.retry_scheduler = None
+            # max_retries counts the first try, there is always one
+            self.fetch_retries = max(max_retries - 1, 0)
+        self.retry_attempts = {}
+
+
+        # Max redirect hops to follow inside the fetch stage
+        self.follow_redirects = follow_redirects
+
+
+        # Swap the RequestWorkers thread pool for a single event loop
+        # that keeps up to `concurrency` requests in flight
+        if engine == 'async':
+            if self.driver_manager or self.auth_driver_manager:
+                render_func = self.render_content
+            else:
+                render_func = None
+            self.RequestWorkers = AsyncRequestEngine(
+                session=self.session,
+                input_queue=self.url_queue if self.fuse_stages else self.request_queue,
+                output_queue=self.response_queue,
+                concurrency=concurrency,
+                canary=self.canary,
+                delay=delay,
+                jitter=jitter,
+                render_func=render_func,
+                max_size=self.max_size,
+                chunk_size=self.chunk_size,
+                spill_size=self.spill_size,
+                fetch_policy=self.fetch_policy,
+                retries=self.fetch_retries,
+                result_func=self.handle_fetch_result,
+                redirect_func=self.next_redirect_request,
+                build_func=self.request_builder if self.fuse_stages else None,
+                error_func=self.fetch_error,
+            )
+        elif engine != 'threads':
+            print('Invalid engine type. Must be "threads" or "async". Got ' + str(engine))
+            exit(1)
+
+
+        # Move threads between stages as the work shifts mid-crawl,
+        # the counts given above are the starting points
+        if autoscale:
+            stages = [
+                ('RequestBuilders', self.RequestBuilders),
+                ('RequestWorkers', self.RequestWorkers),
+                ('ResponseParsers', self.ResponseParsers),
+                ('DBWorkers', self.DBWorkers),
+            ]
+            # The async engine scales by concurrency, not threads
+            stages = [(name, manager) for name, manager in stages if manager and hasattr(manager, 'scale_to')]
+            self.autoscaler = AutoScaler(
+                stages=stages,
+                min_threads=1,
+                max_threads=autoscale_max,
+            )
         else:
+            self.autoscaler = None
+
+
+    # Seeds of other partitions are theirs to fetch
+    def put_seed(self, url):
+        url = self.canonicalize(url)
+        claimed = self.claim_url(url, 0)
+        if not claimed:
+            if claimed is None:
+                self.add_seen(url)
+            return
+        if self.partition and not self.partition.owns(url):
+            self.partition.forward(url, 0)
+            return
+        self.url_queue.put((url, 0))
+
+    # Claim a discovered url at a depth. A new one is counted against
+    # its template (see TrapDetector) in the same step, so a link two
+    # parsers find at once only counts once. True if claimed (or
+    # still queued and found shallower, it is queued again), False if
+    # already known, None if it is a trap.
+    def claim_url(self, url, depth):
+        return self.claims.claim(url, admit_func=self.traps.admit if self.traps else None, depth=depth)
+
+    # A url queued more than once is fetched at the smallest depth
+    # it was found at, whichever of its entries comes out first
+    def claimed_depth(self, url, depth):
+        claimed = self.claims.get_depth(url)
+        if claimed is not None and claimed < depth:
+            return claimed
+        return depth
+
+    def add_seen(self, url):
+        if self.unvisited:
+            with self.seen_lock:
+                if url not in self.seen:
+                    self.seen.add(url)
+                    self.new_seen.append(url)
+
+    def enqueue_url(self, url, depth, from_form=False, from_duplicate=False):
+        # No more intake once the budget is spent
+        if self.budget.is_spent():
+            self.add_seen(url)
+            return
+        if self.partition and not self.partition.owns(url):
+            self.partition.forward(url, depth, from_form)
+            return
+        if isinstance(self.url_queue, Frontier):
+            self.url_queue.put((url, depth), from_form=from_form, from_duplicate=from_duplicate)
+        else:
+            self.url_queue.put((url, depth))
+
+    # Every claimed url is in flight until its response is committed.
+    # The claimed url is kept along, the entry may get re-keyed to
+    # the url requests actually sent.
+    def claim_in_flight(self, url, depth):
+        with self.in_flight_lock:
+            self.in_flight[url] = (depth, url)
+
+    # Called by the DB workers after every commit
+    def finish_in_flight(self, urls):
+        finished = []
+        with self.in_flight_lock:
+            for url in urls:
+                entry = self.in_flight.pop(url, None)
+                if entry:
+                    finished.append(entry[1])
+            # A process of a sharded crawl never keeps a checkpoint
+            if not self.partition:
+                self.new_visited.extend(self.claims.fingerprint(url) for url in finished)
+        for url in finished:
+            self.claims.finish(url)
+        # A shared frontier only hears about urls once they are on disk
+        if self.partition and finished:
+            self.partition.finish(finished)
+
+    def add_unfetched(self, url, depth):
+        with self.unfetched_lock:
+            self.unfetched[url] = depth
+        # Maybe a retry that will not happen any more
+        with self.in_flight_lock:
+            entry = self.in_flight.pop(url, None)
+        if entry:
+            self.claims.release(url)
+        # Never fetched, but done as far as a shared frontier goes
+        if self.partition:
+            self.partition.finish([entry[1] if entry else url])
+
+    def request_builder(self, item):
+        url, depth = item[0], item[1]
+        # Retries come back as (url, depth, attempt) and are
+        # still in flight from the first time around
+        is_retry = len(item) > 2
+        # Atomic, so two workers never both fetch a url that got
+        # queued twice (seeds, leases from a shared frontier)
+        if not is_retry:
+            if not self.claims.start(url):
+                # Handed out by a shared frontier again (eg. after its
+                # lease ran out), it has to hear that it is done
+                if self.partition:
+                    self.partition.finish([url])
+                return None
+            depth = self.claimed_depth(url, depth)
+
+        # What is left of the frontier once the budget is spent
+        # drains through here and is recorded as unvisited
+        if not self.budget.claim_request():
+            self.claims.release(url)
+            self.add_unfetched(url, depth)
             return None
+
+        self.claim_in_flight(url, depth)
+        request = requests.Request('GET', url)
+        return (request, depth)
         
     def request_worker(self, item):
         request, depth = item
-        url = request.url
+        results = []
+        hops = 0
+
+        # Each redirect hop is fetched here and emitted as its own
+        # response, instead of going back around through the queues
+        while request is not None:
+            # Canary Blocking
+            if self.canary:
+                while self.canary.is_blocked:
+                    time.sleep(1)
 
-        # Canary Blocking
+            if self.timing_lock:
+                self.timing_lock.acquire()
+            
+
+            with self.fetch_slots:
+                response, content = get_url_w_request_and_session(
+                    request,
+                    self.session,
+                    max_size=self.max_size,
+                    chunk_size=self.chunk_size,
+                    spill_size=self.spill_size,
+                    fetch_policy=self.fetch_policy,
+                    retries=self.fetch_retries,
+                )
+            result = self.handle_fetch_result(request, depth, response, content)
+            if result and (self.driver_manager or self.auth_driver_manager): # If we are rendering
+                response, content, depth = result
+                content = self.render_content(response, content)
+                result = (response, content, depth)
+            
+            if self.timing_lock:
+                self.timing_lock.release()
+
+            if result:
+                results.append(result)
+            request = self.next_redirect_request(result, hops)
+            hops += 1
+        
+        return results
+
+    # A fetch that raised instead of giving a result (async engine),
+    # recorded as failed so its in-flight claim is released
+    def fetch_error(self, url):
+        self.retry_attempts.pop(url, None)
+        self.results_queue.put(DummyResponse().failed_w_url(url))
+
+    # Soft-404 probes go through the same pacing as the fetch stage:
+    # counted in the budget, held while the canary says blocked, and
+    # under the same timing lock and limit on requests in flight (the
+    # async engine fetches them on its own loop). Parsers in other
+    # processes never probe, the check runs in this one.
+    def probe_url(self, url):
+        if not self.budget.claim_request():
+            return None, None
+        request = requests.Request('GET', url)
+        if isinstance(self.RequestWorkers, AsyncRequestEngine):
+            response, content = self.RequestWorkers.fetch_request(request)
+        else:
+            response, content = self.fetch_probe(request)
+
+        if content is not None:
+            self.budget.add_bytes(len(content))
+        # A throttled probe (eg. a 429) says nothing about the site,
+        # it is not cached and the next page asks again
+        if self.retry_policy and self.retry_policy.should_retry(response):
+            return None, None
+        return response, content
+
+    def fetch_probe(self, request):
         if self.canary:
             while self.canary.is_blocked:
                 time.sleep(1)
-
         if self.timing_lock:
             self.timing_lock.acquire()
-        
+        try:
+            with self.fetch_slots:
+                return get_url_w_request_and_session(
+                    request,
+                    self.session,
+                    max_size=self.max_size,
+                    chunk_size=self.chunk_size,
+                    spill_size=self.spill_size,
+                    fetch_policy=self.fetch_policy,
+                    retries=self.fetch_retries,
+                )
+        finally:
+            if self.timing_lock:
+                self.timing_lock.release()
+
+    # Get the request for the next hop of a redirect chain, or None
+    # if it should not be followed here (the parser still sees the
+    # Location link and handles it the usual way)
+    def next_redirect_request(self, result, hops):
+        if not result or hops >= self.follow_redirects:
+            return None
+        response = result[0]
+        if not response.is_redirect or not 'Location' in response.headers:
+            return None
 
-        response, content = get_url_w_request_and_session(request, self.session)
-        if self.driver_manager or self.auth_driver_manager: # If we are rendering
-            if not response.is_redirect: # If not a redirect
-                if 'Content-Type' in response.headers:
-                    content_type = response.headers['Content-Type'].lower()
-                elif 'content-type' in response.headers:
-                    content_type = response.headers['content-type'].lower()
-                else:
-                    content_type = ''
-                if 'html' in content_type.lower(): # If it should be rendered (html)
+        url = self.canonicalize(urljoin(response.url, response.headers['Location']))
+        # Same checks the parser would do before queueing it
+        if not self.scope.in_scope(url) or is_logout(url):
+            return None
+        # Another process's host, the parser forwards it
+        if self.partition and not self.partition.owns(url):
+            return None
+        started = self.claims.start(url, admit_func=self.traps.admit if self.traps else None)
+        if not started:
+            # A trap is recorded like any other link the parser skips
+            if started is None:
+                self.add_seen(url)
+            return None
+        depth = self.claimed_depth(url, result[2])
+        if not self.budget.claim_request():
+            self.claims.release(url)
+            self.add_unfetched(url, depth)
+            return None
+        self.claim_in_flight(url, depth)
+        return requests.Request('GET', url)
 
-                    used_auth = False
-                    if same_domain(response.url, self.url):
-                        if self.auth_driver_manager:
-                            used_auth = True
-                            driver = self.auth_driver_manager.checkout()
-                        else:
-                            driver = self.driver_manager.checkout()
+    # Decide what happens to a fetched request: retry it later,
+    # record it as failed, or pass it on to the parsers
+    def handle_fetch_result(self, request, depth, response, content):
+        url = request.url
+        attempt = self.retry_attempts.pop(url, 0)
+
+        if content is not None:
+            self.budget.add_bytes(len(content))
+
+        if self.retry_policy and not self.budget.is_spent():
+            delay = self.retry_policy.schedule(url, attempt, response)
+            if delay is not None:
+                self.retry_attempts[url] = attempt + 1
+                self.retry_scheduler.schedule((url, depth, attempt + 1), delay)
+                return None
+
+        if response is None:
+            # Record it instead of letting it silently disappear
+            self.results_queue.put(DummyResponse().failed_w_url(url))
+            return None
+
+        # The response gets stored under the url requests sent
+        # (eg. a '/' added to a bare host), follow it in in_flight
+        sent_url = response.request.url
+        if sent_url != url:
+            with self.in_flight_lock:
+                if url in self.in_flight:
+                    self.in_flight[sent_url] = self.in_flight.pop(url)
+
+        return (response, content, depth)
+
+    # Render html responses with a webdriver
+    def render_content(self, response, content):
+        if response is None:
+            return content
+        if not response.is_redirect: # If not a redirect
+            if 'Content-Type' in response.headers:
+                content_type = response.headers['Content-Type'].lower()
+            elif 'content-type' in response.headers:
+                content_type = response.headers['content-type'].lower()
+            else:
+                content_type = ''
+            if 'html' in content_type.lower(): # If it should be rendered (html)
+
+                used_auth = False
+                if same_domain(response.url, self.url):
+                    if self.auth_driver_manager:
+                        used_auth = True
+                        driver = self.auth_driver_manager.checkout()
                     else:
                         driver = self.driver_manager.checkout()
+                else:
+                    driver = self.driver_manager.checkout()
+
+                try: # ALWAYS free the driver after use, no matter what
+                    str_content = get_rendered_content(response.url, driver)
+                except:
+                    str_content = ''
+                finally:
+                    if used_auth:
+                        self.auth_driver_manager.checkin(driver)
+                    else:
+                        self.driver_manager.checkin(driver)
 
-                    try: # ALWAYS free the driver after use, no matter what
-                        str_content = get_rendered_content(response.url, driver)
-                    except:
-                        strcontent = ''
-                    finally:
-                        if used_auth:
-                            self.auth_driver_manager.checkin(driver)
-                        else:
-                            self.driver_manager.checkin(driver)
-
-                    #str_content = get_rendered_content(response.url, self.driver)
-                    encoding = response.encoding if response.encoding else 'ISO-8859-1'
+                #str_content = get_rendered_content(response.url, self.driver)
+                encoding = response.encoding if response.encoding else 'ISO-8859-1'
 
-                    content = str_content.encode(encoding, errors='replace')
+                content = str_content.encode(encoding, errors='replace')
         # This structure is necessary to juggle render, auth, and subdomains
         # since drivers with cookies error out on domains that are not
         # the same as the cookies
-        
-        if self.timing_lock:
-            self.timing_lock.release()
-        
-        return (response, content, depth)
+        return content
+
+    # Batch mode: the whole batch is parsed in one process pool round trip
+    def response_parser_batch(self, items):
+        dropped = [item[0].request.url for item in items if not item[0]]
+        if dropped:
+            self.finish_in_flight(dropped)
+        items = [item for item in items if item[0]]
+        if self.parser_pool and items:
+            parsed = self.parser_pool.parse_batch([(response, content) for response, content, _ in items])
+        else:
+            parsed = [None] * len(items)
+        return [self.response_parser(item, parsed=p) for item, p in zip(items, parsed)]
 
-    def response_parser(self, item):
+    # parsed - optional (links, inputs) already extracted by a ParserPool
+    def response_parser(self, item, parsed=None):
         response, content, depth = item
         if response:
             # Do not increase depth it was a redirect
             if response.is_redirect:
                 depth -= 1
 
-            result_response = DummyResponse(response, content)
-
-            # Avoid any logouts that could kill the session.
-            lo = [
-                "logout",
-                "log-out",
-                "log_out",
-                "log%20out",
-                "log%2520out",
-                "log out",
-                "signout",
-                "sign-out",
-                "sign_out",
-                "sign%20out",
-                "sign%2520out"
-                "sign out",
-            ]
-
-            #if in_scope and not visited and in_depth
-            #   add to url_queue
-            #if in_scope and not visited but out of depth
+            # Stored flagged, but not parsed and nothing on it is followed
+            if self.soft_404_detector and self.soft_404_detector.is_soft_404(response, content):
+                result_response = DummyResponse(response, content, links=[], inputs=[])
+                result_response.soft_404 = True
+                return result_response
+
+            get_simhash = self.near_duplicate_index is not None
+            if parsed:
+                links, inputs = parsed
+                result_response = DummyResponse(response, content, links=links, inputs=inputs, get_simhash=get_simhash)
+            elif self.parser_pool:
+                links, inputs = self.parser_pool.parse(response, content)
+                result_response = DummyResponse(response, content, links=links, inputs=inputs, get_simhash=get_simhash)
+            else:
+                result_response = DummyResponse(response, content, get_simhash=get_simhash, html_parser=self.html_parser)
+
+            from_duplicate = False
+            if result_response.simhash is not None:
+                result_response.near_duplicate = self.near_duplicate_index.check(result_response.url, result_response.simhash)
+                from_duplicate = result_response.near_duplicate is not None
+                # Stored flagged, but nothing on it is followed
+                if from_duplicate and self.near_duplicates == 'prune':
+                    return result_response
+
+            #if a soft-404 or a pruned near-duplicate
+            #   store it, follow nothing
+            #if in_scope and not claimed and in_depth
+            #   claim and add to url_queue
+            #if in_scope and not claimed but out of depth
+            #   add to seen
+            #if in_scope and not claimed but a trap (template over budget)
             #   add to seen
-            #if in_scope but visited
+            #if in_scope but claimed (queued, in flight or visited)
             #   trash
             #if not in scope but in domain
             #   add to seen
             #if not in scope and not in domain
             #   trash
+            # Links from pages with forms rank higher in a priority frontier
+            from_form = bool(result_response.inputs)
             for link in result_response.links:
-                is_lo = False
-                for l in lo:
-                    if l in link.lower():
-                        is_lo = True
+                link = self.canonicalize(link)
+                is_lo = is_logout(link)
 
                 if self.scope.in_scope(link):
-                    # Avoids fragments - fragments cause way too many requests
-                    if not link in self.visited and not link.split('#')[0] in self.visited and not link.split('#')[0] + '#' in self.visited:
-                        if is_lo:
-                            self.seen.add(link)
-                        elif depth+1 <= self.MaxDepth:
-                            self.url_queue.put((link, depth+1))
-                        else:
-                            self.seen.add(link)
+                    if is_lo or depth+1 > self.MaxDepth:
+                        if not self.claims.is_known(link):
+                            self.add_seen(link)
+                    else:
+                        # One atomic check-and-claim, a link found on
+                        # every page is only queued the first time, and
+                        # only new links count against their template
+                        claimed = self.claim_url(link, depth+1)
+                        if claimed:
+                            self.enqueue_url(link, depth+1, from_form=from_form, from_duplicate=from_duplicate)
+                        elif claimed is None:
+                            self.add_seen(link)
                 else:
                     if self.scope.in_domain(link):
-                        self.seen.add(link)
+                        self.add_seen(link)
             return result_response
         else:
+            # Never stored, nothing to wait for
+            self.finish_in_flight([response.request.url])
             return None
 
+    # Retries waiting out a delay when the budget is spent are
+    # recorded as unfetched instead of being waited for
+    def drain_retries(self, stdscr=None):
+        if not stdscr:
+            print(f'Crawl budget spent ({self.budget.get_reason()}). Draining in-flight work...')
+        if self.retry_scheduler:
+            for item in self.retry_scheduler.drain():
+                self.add_unfetched(item[0], item[1])
+
+    def save_checkpoint(self):
+        # The frontier and the in-flight urls are copied at the same
+        # instant. A page leaves in_flight only once it is committed,
+        # after its links were queued, so none of its links can fall
+        # between the two copies. A url a worker took off the queue
+        # but has not claimed yet can still be missed, that window
+        # is only a few instructions wide.
+        # Only what was committed and seen since the last checkpoint
+        # is appended to it, the rest is rewritten.
+        with self.url_queue.mutex:
+            frontier = self.url_queue.snapshot(lock=False)
+            with self.in_flight_lock:
+                in_flight = [(url, entry[0]) for url, entry in self.in_flight.items()]
+                new_visited, self.new_visited = self.new_visited, array('Q')
+        with self.seen_lock:
+            new_seen, self.new_seen = self.new_seen, []
+        frontier = [(item[0], item[1]) for item in frontier if item is not STOP_SIGNAL]
+        # Unfetched urls are owed a fetch just like in-flight ones
+        with self.unfetched_lock:
+            in_flight += list(self.unfetched.items())
+
+        self.checkpoint.save(
+            meta={'url': self.url},
+            frontier=frontier,
+            in_flight=in_flight,
+            visited=new_visited,
+            seen=new_seen,
+            counters=self.DBWorkers.get_counters(),
+        )
+
+    # Pick up the frontier of an interrupted crawl. Urls already
+    # stored are not fetched again, urls that were in flight are.
+    def resume_from_checkpoint(self):
+        state = self.checkpoint.load()
+        # Stored and in-flight urls are in the form requests sent
+        stored = set(self.canonicalize(url) for url in self.DBWorkers.get_stored_urls())
+        self.DBWorkers.resume_counters(state['counters'])
+
+        in_flight = [(self.canonicalize(url), depth) for url, depth in state['in_flight']]
+        # Claimed but never stored, so not visited after all
+        in_flight_fingerprints = set(self.claims.fingerprint(url) for url, _ in in_flight)
+        for fingerprint in state['visited'] - in_flight_fingerprints:
+            self.claims.set_state_fp(fingerprint, VISITED)
+        for url in stored:
+            self.claims.set_state(url, VISITED)
+        if self.unvisited:
+            self.seen = state['seen']
+
+        for url, depth in in_flight + state['frontier']:
+            if self.claims.claim(url, depth=depth):
+                self.url_queue.put((url, depth))
+
     def run(self, stdscr=None):
+        finished = False
         try:
             if self.canary:
                 if stdscr:
@@ -375,14 +1066,27 @@ class OmenEye:
                     stdscr.addstr(1, 0, 'Canary establishing baseline. Please wait 180-300 seconds...')
                     stdscr.refresh()
                 self.canary.start()
-            self.RequestBuilders.start_threads()
+            if self.retry_scheduler:
+                self.retry_scheduler.start()
+            if self.autoscaler:
+                # Decisions show on the dashboard, or get printed when silent
+                if not stdscr:
+                    self.autoscaler.log_func = print
+                self.autoscaler.start()
+            if self.RequestBuilders:
+                self.RequestBuilders.start_threads()
             self.RequestWorkers.start_threads()
             self.ResponseParsers.start_threads()
             self.DBWorkers.start_threads()
+            if self.partition:
+                self.partition.start(self)
             
 
-            closed_request_threads = False
-            finished = False
+            budget_spent = False
+            interrupted = False
+            status_row = 17
+            self.budget.start()
+            last_checkpoint = time.time()
 
             # Variables to track previous task counts
             prev_url_tasks = self.url_queue.unfinished_tasks
@@ -393,77 +1097,139 @@ class OmenEye:
 
             # Wait for all queue tasks to be finished
             while not finished:
-
-                # Display Information
-                if stdscr:
-                    stdscr.clear()
-                    # Current task counts
-                    current_url_tasks = self.url_queue.unfinished_tasks
-                    current_request_tasks = self.request_queue.unfinished_tasks
-                    current_response_tasks = self.response_queue.unfinished_tasks
-                    current_results_tasks = self.results_queue.unfinished_tasks
-                    current_time = time.time()
+                try:
+                    # Stop claiming requests once the budget is spent, what is
+                    # in flight drains and the rest of the frontier is recorded
+                    if not budget_spent and self.budget.is_spent():
+                        budget_spent = True
+                        self.drain_retries(stdscr)
+
+                    # Display Information
+                    if stdscr:
+                        stdscr.clear()
+                        # Current task counts
+                        current_url_tasks = self.url_queue.unfinished_tasks
+                        current_request_tasks = self.request_queue.unfinished_tasks
+                        current_response_tasks = self.response_queue.unfinished_tasks
+                        current_results_tasks = self.results_queue.unfinished_tasks
+                        current_time = time.time()
                     
-                    # Calculate time elapsed
-                    time_elapsed = current_time - prev_time
+                        # Calculate time elapsed
+                        time_elapsed = current_time - prev_time
                     
-                    # Calculate the rate of consumption
-                    url_rate = -((prev_url_tasks - current_url_tasks) / time_elapsed)
-                    request_rate = -((prev_request_tasks - current_request_tasks) / time_elapsed)
-                    response_rate = -((prev_response_tasks - current_response_tasks) / time_elapsed)
-                    results_rate = -((prev_results_tasks - current_results_tasks) / time_elapsed)
+                        # Calculate the rate of consumption
+                        url_rate = -((prev_url_tasks - current_url_tasks) / time_elapsed)
+                        request_rate = -((prev_request_tasks - current_request_tasks) / time_elapsed)
+                        response_rate = -((prev_response_tasks - current_response_tasks) / time_elapsed)
+                        results_rate = -((prev_results_tasks - current_results_tasks) / time_elapsed)
                     
-                    # Display the counts and rates
-                    builder_input_rate, builder_output_rate = self.RequestBuilders.get_rates()
-                    worker_input_rate, worker_output_rate = self.RequestWorkers.get_rates()
-                    parser_input_rate, parser_output_rate = self.ResponseParsers.get_rates()
-                    dbworker_input_rate, dbworker_output_rate = self.DBWorkers.get_rates()
-                    #stdscr.addstr(0, 0, '----------[OMEN EYE]----------')
-                    #---------------------------
-                    #===========================
-                    stdscr.addstr(0, 0, '===========================[ OMEN EYE ]===========================')
-                    stdscr.addstr(1, 0, f' URL Queue Tasks Left        : {current_url_tasks:9} ({url_rate:+9.2f} tasks/sec)')
-                    stdscr.addstr(2, 0, f' Request Queue Tasks Left    : {current_request_tasks:9} ({request_rate:+9.2f} tasks/sec)')
-                    stdscr.addstr(3, 0, f' Response Queue Tasks Left   : {current_response_tasks:9} ({response_rate:+9.2f} tasks/sec)')
-                    stdscr.addstr(4, 0, f' Results Queue Tasks Left    : {current_results_tasks:9} ({results_rate:+9.2f} tasks/sec)')
-
-                    stdscr.addstr(6, 0, f' RequestBuilders\' Intake Rate  : {builder_input_rate:9.2f} tasks/sec')
-                    stdscr.addstr(7, 0, f' RequestBuilders\' Output Rate  : {builder_output_rate:9.2f} tasks/sec')
-                    stdscr.addstr(8, 0, f' RequestWorkers\' Intake Rate   : {worker_input_rate:9.2f} tasks/sec')
-                    stdscr.addstr(9, 0, f' RequestWorkers\' Output Rate   : {worker_output_rate:9.2f} tasks/sec')
-                    stdscr.addstr(10, 0, f' ResponseParsers\' Intake Rate  : {parser_input_rate:9.2f} tasks/sec')
-                    stdscr.addstr(11, 0, f' ResponseParsers\' Output Rate  : {parser_output_rate:9.2f} tasks/sec')
-                    stdscr.addstr(12, 0, f' DBWorkers\' Intake Rate        : {dbworker_input_rate:9.2f} tasks/sec')                    
-                    stdscr.addstr(13, 0, f' DBWorkers\' Output Rate        : {dbworker_output_rate:9.2f} tasks/sec')
-                    stdscr.addstr(14, 0, f'                                                                     ')
-                    if self.canary:
-                        if self.canary.is_blocked:
-                            stdscr.addstr(15, 0, f' Canary says Blocked!                                                ')
-                            stdscr.addstr(16, 0, f'                                                                     ')
+                        # Display the counts and rates
+                        if self.fuse_stages:
+                            builder_input_rate, builder_output_rate = self.RequestWorkers.get_rates(stage=0)
+                            worker_input_rate, worker_output_rate = self.RequestWorkers.get_rates(stage=1)
                         else:
-                            stdscr.addstr(15, 0, f'                                                                     ')
-                    # Refresh the screen to update the changes
-                    stdscr.refresh()
-
-                    # Update previous task counts and time
-                    prev_url_tasks = current_url_tasks
-                    prev_request_tasks = current_request_tasks
-                    prev_response_tasks = current_response_tasks
-                    prev_results_tasks = current_results_tasks
-                    prev_time = current_time
-
-                url_q = self.url_queue.unfinished_tasks == 0
-                request_q = self.request_queue.unfinished_tasks == 0
-                response_q = self.response_queue.unfinished_tasks == 0
-                results_q = self.results_queue.unfinished_tasks == 0
-
-                # Close request threads when finished, save resources
-                if not closed_request_threads:
-                    if url_q and request_q and response_q:
-                        self.RequestBuilders.stop_threads()
+                            builder_input_rate, builder_output_rate = self.RequestBuilders.get_rates()
+                            worker_input_rate, worker_output_rate = self.RequestWorkers.get_rates()
+                        parser_input_rate, parser_output_rate = self.ResponseParsers.get_rates()
+                        dbworker_input_rate, dbworker_output_rate = self.DBWorkers.get_rates()
+                        #stdscr.addstr(0, 0, '----------[OMEN EYE]----------')
+                        #---------------------------
+                        #===========================
+                        lines = [
+                            '===========================[ OMEN EYE ]===========================',
+                            f' URL Queue Tasks Left        : {current_url_tasks:9} ({url_rate:+9.2f} tasks/sec)',
+                            f' Request Queue Tasks Left    : {current_request_tasks:9} ({request_rate:+9.2f} tasks/sec)',
+                            f' Response Queue Tasks Left   : {current_response_tasks:9} ({response_rate:+9.2f} tasks/sec)',
+                            f' Results Queue Tasks Left    : {current_results_tasks:9} ({results_rate:+9.2f} tasks/sec)',
+                            '',
+                            f' RequestBuilders\' Intake Rate  : {builder_input_rate:9.2f} tasks/sec',
+                            f' RequestBuilders\' Output Rate  : {builder_output_rate:9.2f} tasks/sec',
+                            f' RequestWorkers\' Intake Rate   : {worker_input_rate:9.2f} tasks/sec',
+                            f' RequestWorkers\' Output Rate   : {worker_output_rate:9.2f} tasks/sec',
+                            f' ResponseParsers\' Intake Rate  : {parser_input_rate:9.2f} tasks/sec',
+                            f' ResponseParsers\' Output Rate  : {parser_output_rate:9.2f} tasks/sec',
+                            f' DBWorkers\' Intake Rate        : {dbworker_input_rate:9.2f} tasks/sec',
+                            f' DBWorkers\' Output Rate        : {dbworker_output_rate:9.2f} tasks/sec',
+                        ]
+                        lines.append('')
+                        lines.append(f' Response Queue Depth/Bytes   : {self.response_queue.qsize():9} / {self.response_queue.get_bytes()/(1024*1024):9.2f} MB')
+                        lines.append(f' Results Queue Depth/Bytes    : {self.results_queue.qsize():9} / {self.results_queue.get_bytes()/(1024*1024):9.2f} MB')
+                        lines.append(f' In-Flight Work Items         : {self.pipeline.get_count():9}')
+                        claimed, suppressed = self.claims.get_counts()
+                        lines.append(f' URLs Queued/In-Flight/Stored : {claimed["queued"]:9} / {claimed["in_flight"]:9} / {claimed["visited"]:9}')
+                        lines.append(f' Duplicates Suppressed        : {sum(suppressed.values()):9} ({suppressed["queued"]} queued, {suppressed["in_flight"]} in flight, {suppressed["visited"]} visited)')
+                        lines.append(f' URL Table Size               : {self.claims.get_bytes()/(1024*1024):9.2f} MB')
+                        if self.near_duplicate_index:
+                            indexed, duplicates = self.near_duplicate_index.get_counts()
+                            lines.append(f' Pages Indexed/Near-Duplicate : {indexed:9} / {duplicates:9} ({self.near_duplicates})')
+                        if self.soft_404_detector:
+                            probes, soft_404s = self.soft_404_detector.get_counts()
+                            lines.append(f' Soft-404 Probes/Pages        : {probes:9} / {soft_404s:9}')
+                        if self.traps:
+                            trapped, top_traps = self.traps.get_counts()
+                            lines.append(f' Trap URLs Skipped            : {trapped:9}')
+                            for template, count in top_traps:
+                                lines.append(f'   {count:9} {template[:60]}')
+                        budget_requests, budget_bytes, budget_time = self.budget.get_counts()
+                        lines.append(f' Requests/Bytes/Time          : {budget_requests:9} / {budget_bytes/(1024*1024):9.2f} MB / {budget_time:7.0f} s')
+                        if self.checkpoint_interval:
+                            lines.append(f' Last Checkpoint              : {time.time() - last_checkpoint:9.0f} s ago')
+                        if budget_spent:
+                            lines.append(f' Budget spent ({self.budget.get_reason()}), draining {self.pipeline.get_count()} items...')
+                        if self.autoscaler:
+                            lines.append('')
+                            lines.append(' Autoscaled Threads           :')
+                            lines.append('   ' + '  '.join(f'{name} {manager.num_threads}' for name, manager in self.autoscaler.stages))
+                            for message in self.autoscaler.get_history(3):
+                                lines.append(f'   {message}')
+                        if self.retry_policy:
+                            retried, gave_up = self.retry_policy.get_counts()
+                            lines.append('')
+                            lines.append(f' Retries Scheduled/Given Up   : {retried:9} / {gave_up:<9} ({self.retry_scheduler.pending()} waiting)')
+                        if self.pool_stats:
+                            pool_hits, pool_misses = self.pool_stats.get_counts()
+                            lines.append('')
+                            lines.append(f' Connection Pool Hits/Misses  : {pool_hits:9} / {pool_misses:<9} ({self.pool_stats.get_reuse_rate():6.1%} reused)')
+                        lines.append('')
+                        if self.canary:
+                            if self.canary.is_blocked:
+                                lines.append(' Canary says Blocked!')
+                            else:
+                                lines.append('')
+                        for row, line in enumerate(lines):
+                            stdscr.addstr(row, 0, f'{line:69}')
+                        status_row = len(lines) + 1
+
+                        # Refresh the screen to update the changes
+                        stdscr.refresh()
+
+                        # Update previous task counts and time
+                        prev_url_tasks = current_url_tasks
+                        prev_request_tasks = current_request_tasks
+                        prev_response_tasks = current_response_tasks
+                        prev_results_tasks = current_results_tasks
+                        prev_time = current_time
+
+                    if self.checkpoint_interval and time.time() - last_checkpoint >= self.checkpoint_interval:
+                        self.save_checkpoint()
+                        last_checkpoint = time.time()
+
+                    # Close request threads when finished, save resources.
+                    # Blocks on the pipeline's completion event, so this
+                    # fires the moment the last item drains (the timeout
+                    # is only the OUTPUT REFRESH RATE). In a sharded crawl
+                    # links can still come in from the other processes until
+                    # the coordinator says the whole crawl is done.
+                    if self.pipeline.wait(timeout=0.5) and (not self.partition or self.partition.wait_finished(timeout=0.5)):
+                        if not budget_spent and self.budget.is_spent():
+                            budget_spent = True
+                            self.drain_retries(stdscr)
+                        if self.autoscaler:
+                            self.autoscaler.stop()
+                        if self.RequestBuilders:
+                            self.RequestBuilders.stop_threads()
                         self.RequestWorkers.stop_threads()
                         self.ResponseParsers.stop_threads()
-                        closed_request_threads = True
 
                         if self.canary:
                             self.canary.stop()
@@ -472,28 +1238,38 @@ class OmenEye:
                             self.auth_driver_manager.stop_drivers()
                         if self.driver_manager:
                             self.driver_manager.stop_drivers()
-                        
+                    
+                        # What was left of the frontier when the budget ran out
+                        for url in self.unfetched:
+                            self.results_queue.put(DummyResponse().blank_w_url(url))
+
                         # Add all of the ones that were seen but
                         # where never visited for some reason
                         if self.unvisited:
                             for seen in self.seen:
-                                if not seen in self.visited:
+                                if not self.claims.is_fetched(seen) and not seen in self.unfetched:
                                     if self.scope.subdomains:
                                         self.results_queue.put(DummyResponse().blank_w_url(seen))
                                     else:
                                         if same_domain(self.url, seen):
                                             self.results_queue.put(DummyResponse().blank_w_url(seen))
 
-                
-                if url_q and request_q and response_q and results_q:
-                    finished = True
-
-                # OUTPUT REFRESH RATE
-                time.sleep(0.5)
+                        # DBWorkers.join_threads waits out the results queue
+                        finished = True
+                except KeyboardInterrupt:
+                    # The first Ctrl-C drains like a spent budget,
+                    # a second one stops right away
+                    if interrupted:
+                        raise
+                    interrupted = True
+                    self.budget.stop('interrupted')
+                    if stdscr:
+                        stdscr.addstr(status_row, 0, f' Caught KeyboardInterrupt. Draining, press Ctrl-C again to stop now...')
+                        stdscr.refresh()
         except KeyboardInterrupt:
             if stdscr:
                 #stdscr.clear()
-                stdscr.addstr(17, 0, f' Caught KeyboardInterrupt. Shutting down...')
+                stdscr.addstr(status_row, 0, f' Caught KeyboardInterrupt. Shutting down...')
                 stdscr.refresh()
 
         if self.canary:
@@ -502,11 +1278,31 @@ class OmenEye:
             self.auth_driver_manager.stop_drivers()
         if self.driver_manager:
             self.driver_manager.stop_drivers()
-        self.RequestBuilders.stop_threads()
+        if self.retry_scheduler:
+            self.retry_scheduler.stop()
+        if self.autoscaler:
+            self.autoscaler.stop()
+        if self.partition:
+            self.partition.stop()
+        if self.RequestBuilders:
+            self.RequestBuilders.stop_threads()
         self.RequestWorkers.stop_threads()
         self.ResponseParsers.stop_threads()
+        if self.parser_pool:
+            self.parser_pool.shutdown()
         self.DBWorkers.join_threads()
 
+        # A crawl that ran to the end has nothing to resume, one that
+        # was cut short (budget, Ctrl-C) keeps a checkpoint for --resume
+        # (a process of a sharded crawl has its DB merged away, so
+        # there is nothing it could be resumed from)
+        if self.partition or (finished and not self.budget.is_spent()):
+            self.checkpoint.remove()
+        else:
+            self.save_checkpoint()
+            if not stdscr:
+                print(f'Checkpoint saved to {self.checkpoint.path}, continue the crawl with --resume {self.DBWorkers.db_name}')
+
         
 
     def run_live(self):
@@ -0,0 +1,126 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import requests
+
+from .RequestUtils import build_response, parse_page
+from .HtmlParsers import get_html_parser
+
+
+'''
+ParserPool
+    Runs the CPU heavy part of response parsing (parse_page, ie.
+    the html parsing) in a pool of processes
+    so it is not serialized by the GIL.
+    The body is copied once into a shared memory block and only
+    its name is sent to the child, which parses it in place.
+    Only the extracted links and inputs are pickled back.
+
+__init__
+    num_processes - number of parser processes
+    html_parser - name of the html parser backend the children use (see HtmlParsers)
+
+parse - get (links, inputs) of a response, blocks until parsed
+parse_batch - get [(links, inputs), ...] of a list of (response, content), in one child
+shutdown - stop the parser processes
+'''
+class ParserPool:
+    def __init__(self, num_processes=None, html_parser='html.parser'):
+        if num_processes is None or not isinstance(num_processes, int):
+            raise TypeError(f"num_processes should be of type 'int', but got {type(num_processes).__name__}")
+
+        self.num_processes = num_processes
+        self.html_parser = html_parser
+        # Forking a process full of running threads can deadlock
+        # the child on a lock some other thread was holding
+        self.executor = ProcessPoolExecutor(
+            max_workers=num_processes,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def parse(self, response, content):
+        return self.parse_batch([(response, content)])[0]
+
+    # Every body of the batch goes into one shared memory block,
+    # handed to a single child in one submit
+    def parse_batch(self, items):
+        parts = []
+        offset = 0
+        for response, content in items:
+            size = len(content) if content is not None else 0
+            parts.append((
+                offset,
+                size,
+                response.request.url,
+                response.url,
+                response.status_code,
+                dict(response.headers),
+            ))
+            offset += size
+
+        shm = None
+        if offset:
+            shm = shared_memory.SharedMemory(create=True, size=offset)
+            for (response, content), part in zip(items, parts):
+                if part[1]:
+                    shm.buf[part[0]:part[0] + part[1]] = content
+
+        try:
+            future = self.executor.submit(
+                parse_in_process,
+                shm.name if shm else None,
+                parts,
+                self.html_parser,
+            )
+            return future.result()
+        except BrokenProcessPool:
+            # A child died (eg. OOM killed), parse them here instead
+            # of losing the responses
+            html_parser = get_html_parser(self.html_parser)
+            return [parse_page(response, content, html_parser=html_parser)[:2] for response, content in items]
+        finally:
+            if shm:
+                shm.close()
+                shm.unlink()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Backends of a parser process, made once per process
+html_parsers = {}
+
+# Runs in the parser process, returns [(links, inputs), ...]
+def parse_in_process(shm_name, parts, html_parser_name='html.parser'):
+    # The name the parent resolved its backend to, so it is installed
+    if html_parser_name not in html_parsers:
+        html_parsers[html_parser_name] = get_html_parser(html_parser_name)
+    html_parser = html_parsers[html_parser_name]
+
+    # Spawned children share the parent's resource tracker, so
+    # attaching here does not take the block away from the parent,
+    # which unlinks it once the result is back
+    shm = shared_memory.SharedMemory(name=shm_name) if shm_name else None
+    results = []
+    try:
+        for offset, size, request_url, url, status_code, headers in parts:
+            request = requests.Request('GET', request_url).prepare()
+            if not size:
+                response = build_response(request, status_code, headers, url=url, content=b'')
+                results.append(parse_page(response, b'', html_parser=html_parser)[:2])
+                continue
+
+            content = shm.buf[offset:offset + size]
+            try:
+                response = build_response(request, status_code, headers, url=url, content=content)
+                results.append(parse_page(response, content, html_parser=html_parser)[:2])
+            finally:
+                # Every view has to be gone before the block can be closed
+                response = None
+                content.release()
+    finally:
+        if shm:
+            shm.close()
+    return results
@@ -0,0 +1,134 @@
+import threading
+
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+'''
+PoolStats
+    Thread safe hit/miss counters for the keep-alive connection pools.
+    A hit is a request that was sent over a connection pulled
+    out of a pool, a miss is a request that had to open a new
+    TCP (and TLS) connection.
+
+record_hit - count a reused connection for a host
+record_miss - count a new connection for a host
+get_counts - get the total (hits, misses)
+get_host_counts - get {host: (hits, misses)}
+get_reuse_rate - get the fraction of requests that reused a connection
+'''
+class PoolStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def record_hit(self, host):
+        with self.lock:
+            self.hits += 1
+            hits, misses = self.hosts.get(host, (0, 0))
+            self.hosts[host] = (hits + 1, misses)
+
+    def record_miss(self, host):
+        with self.lock:
+            self.misses += 1
+            hits, misses = self.hosts.get(host, (0, 0))
+            self.hosts[host] = (hits, misses + 1)
+
+    def get_counts(self):
+        with self.lock:
+            return self.hits, self.misses
+
+    def get_host_counts(self):
+        with self.lock:
+            return dict(self.hosts)
+
+    def get_reuse_rate(self):
+        with self.lock:
+            total = self.hits + self.misses
+            if total == 0:
+                return 0.0
+            return self.hits / total
+
+
+# urllib3 hands out a pooled connection from _get_conn and
+# only calls _new_conn when the pool has nothing to give,
+# so counting both tells us hits and misses per pool.
+def make_counting_pool_class(pool_class, stats):
+    # Several workers share a pool, so the "opened a new
+    # connection" flag has to be per thread
+    local = threading.local()
+
+    class CountingConnectionPool(pool_class):
+        def _get_conn(self, timeout=None):
+            local.new_conn = False
+            conn = super()._get_conn(timeout=timeout)
+            if local.new_conn:
+                stats.record_miss(self.host)
+            else:
+                stats.record_hit(self.host)
+            return conn
+
+        def _new_conn(self):
+            local.new_conn = True
+            return super()._new_conn()
+
+    CountingConnectionPool.__name__ = 'Counting' + pool_class.__name__
+    return CountingConnectionPool
+
+
+'''
+PooledHTTPAdapter
+    HTTPAdapter that keeps one keep-alive pool per host, sized so
+    every request worker can hold a connection to the same host
+    at once without connections being discarded, and counts
+    pool hits/misses in a PoolStats.
+
+__init__
+    num_workers - number of request workers sharing the session (pool_maxsize)
+    num_hosts - number of per-host pools to keep cached (pool_connections)
+    stats - optional PoolStats to record into
+'''
+class PooledHTTPAdapter(HTTPAdapter):
+    def __init__(self, num_workers=DEFAULT_POOLSIZE, num_hosts=DEFAULT_POOLSIZE, stats=None, **kwargs):
+        self.stats = stats if stats is not None else PoolStats()
+        self.pool_classes = {
+            'http': make_counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': make_counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+        super().__init__(
+            pool_connections=max(num_hosts, 1),
+            pool_maxsize=max(num_workers, 1),
+            **kwargs
+        )
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = self.pool_classes
+        return manager
+
+    # Needed to keep the counting pools when an adapter is
+    # unpickled (eg. a session handed to another process)
+    def __setstate__(self, state):
+        self.stats = PoolStats()
+        self.pool_classes = {
+            'http': make_counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': make_counting_pool_class(HTTPSConnectionPool, self.stats),
+        }
+        super().__setstate__(state)
+
+
+def mount_pooled_adapter(session, num_workers, num_hosts=DEFAULT_POOLSIZE):
+    adapter = PooledHTTPAdapter(
+        num_workers=num_workers,
+        num_hosts=max(num_hosts, num_workers),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return adapter.stats
+
@@ -1,4 +1,6 @@
 import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
 
 try:
     import chardet
@@ -10,43 +12,107 @@ from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, urljoin, pa
 import gzip
 import io
 import re
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup
 import feedparser
 
+from .BodyBuffer import BodyBuffer
+
 from requests.packages.urllib3.exceptions import InsecureRequestWarning
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 
-def standardize_url(url):
+# Reduce the spellings of one url to one form. Every rule can be
+# turned off, the defaults are the original behaviour (the fragment
+# is kept and a trailing slash is stripped).
+#   strip_fragment - drop #fragment
+#   sort_params - sort the query params (kept as they were encoded)
+#   default_ports - drop :80 for http and :443 for https
+#   lowercase - lowercase the scheme and host (the path is case sensitive)
+#   strip_trailing_slash - drop trailing slashes from the path
+#   ignored_params - set of query param names to drop (eg. utm_source)
+def standardize_url(
+        url,
+        strip_fragment=False,
+        sort_params=True,
+        default_ports=True,
+        lowercase=True,
+        strip_trailing_slash=True,
+        ignored_params=None,
+    ):
     # Parse the URL into components
     parsed_url = urlparse(url)
-    
-    # Convert scheme and netloc to lowercase
-    scheme = parsed_url.scheme.lower()
-    netloc = parsed_url.netloc.lower()
-    
+
+    scheme = parsed_url.scheme
+    netloc = parsed_url.netloc
+    # Convert scheme and host to lowercase (not the user info)
+    if lowercase:
+        scheme = scheme.lower()
+        userinfo, at, host = netloc.rpartition('@')
+        netloc = userinfo + at + host.lower()
+
     # Handle default ports
-    if (scheme == "http" and netloc.endswith(":80")):
-        netloc = netloc[:-3]
-    elif (scheme == "https" and netloc.endswith(":443")):
-        netloc = netloc[:-4]
-    
-    # Sort query parameters
+    if default_ports:
+        if (scheme == "http" and netloc.endswith(":80")):
+            netloc = netloc[:-3]
+        elif (scheme == "https" and netloc.endswith(":443")):
+            netloc = netloc[:-4]
+
+    # Sort query parameters, as they are, re-encoding them could
+    # change what the server gets
     query = parsed_url.query
-    if query:
-        query_params = parse_qsl(query)
-        sorted_query = sorted(query_params)
-        query = urlencode(sorted_query)
-    
+    if query and (sort_params or ignored_params):
+        query_params = [param for param in query.split('&') if param]
+        if ignored_params:
+            query_params = [param for param in query_params if param.split('=', 1)[0] not in ignored_params]
+        if sort_params:
+            query_params.sort()
+        query = '&'.join(query_params)
+
     # Rebuild the URL without trailing slashes for path
-    path = parsed_url.path.rstrip('/')
-    
+    path = parsed_url.path
+    if strip_trailing_slash:
+        path = path.rstrip('/')
+
+    fragment = '' if strip_fragment else parsed_url.fragment
+
     # Reconstruct the URL
-    standardized_url = urlunparse((scheme, netloc, path, parsed_url.params, query, parsed_url.fragment))
-    
+    standardized_url = urlunparse((scheme, netloc, path, parsed_url.params, query, fragment))
+
     return standardized_url
 
 
+# Path segments that are ids rather than names
+NUMERIC_SEGMENT = re.compile(r'^\d+$')
+UUID_SEGMENT = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE)
+HEX_SEGMENT = re.compile(r'^[0-9a-f]{8,}$', re.IGNORECASE)
+DATE_SEGMENT = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$')
+
+def url_template(url):
+    # Reduce a url to the shape of its path and the names of its
+    # query params, eg. https://a.com/user/42/posts?id=7&sort=new
+    # -> a.com/user/{int}/posts?id&sort
+    parsed_url = urlparse(url)
+    segments = []
+    for segment in parsed_url.path.split('/'):
+        if NUMERIC_SEGMENT.match(segment):
+            segments.append('{int}')
+        elif DATE_SEGMENT.match(segment):
+            segments.append('{date}')
+        elif UUID_SEGMENT.match(segment):
+            segments.append('{uuid}')
+        elif HEX_SEGMENT.match(segment):
+            segments.append('{hex}')
+        else:
+            segments.append(segment)
+    template = parsed_url.netloc.lower() + '/'.join(segments)
+
+    param_names = sorted(set(name for name, _ in parse_qsl(parsed_url.query, keep_blank_values=True)))
+    if param_names:
+        template += '?' + '&'.join(param_names)
+    return template
+
+
 def is_valid_url(url):
     # Regular expression to validate URLs
     url_regex = re.compile(
@@ -77,16 +143,20 @@ def filter_invalid_urls(url_list):
     return valid_urls
 
 
-def get_content_with_max_size(response, max_size):
-    total_size = 0
-    content = b''  # Initialize an empty byte string to store the content
-    for chunk in response.iter_content(chunk_size=1024):  # Adjust chunk size as needed
-        total_size += len(chunk)
-        content += chunk  # Append the chunk to the content
-        if total_size > max_size:
+def get_content_with_max_size(response, max_size, chunk_size=1024*64, spill_size=None, truncate=False):
+    # Grows in place (or on disk past spill_size) instead of
+    # re-copying the whole body with every chunk
+    body = BodyBuffer(spill_size=spill_size)
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if len(body) + len(chunk) > max_size:
+            if truncate: # Keep what fits and hang up on the rest
+                body.write(chunk[:max_size - len(body)])
+                response.close()
+                break
             response.close()  # Close the connection
             raise ValueError("Response size exceeds maximum size")
-    return content
+        body.write(chunk)
+    return body.getbuffer()
 
 def get_text(response, content):
     text = None
@@ -96,7 +166,11 @@ def get_text(response, content):
     else:
         # Fallback to auto-detected encoding.
         if response.encoding is None:
-            encoding = chardet.detect(content)["encoding"]
+            # Some detectors only take bytes/bytearray, not memoryviews
+            if not isinstance(content, (bytes, bytearray)):
+                encoding = chardet.detect(bytes(content))["encoding"]
+            else:
+                encoding = chardet.detect(content)["encoding"]
             #encoding = response.apparent_encoding
 
         try: # Decode unicode from given encoding.
@@ -112,6 +186,120 @@ def get_text(response, content):
     return text
 
 
+FETCH_FULL = 'full'
+FETCH_TRUNCATE = 'truncate'
+FETCH_SKIP = 'skip'
+
+'''
+FetchPolicy
+    Decides, once the response headers are in, how much of a body
+    to download based on its Content-Type. Bodies get_links and
+    get_inputs will never look at (images, fonts, media) are
+    skipped, big binary ones are truncated to the first few KB so
+    there is still something to look at in the DB, and everything
+    else is downloaded in full.
+    Rules are (content-type prefix, action[, limit in bytes]) and
+    the longest matching prefix wins.
+    Bodies whose path ends in .gz are never truncated, nested
+    sitemaps (.xml.gz, .txt.gz) are often served with a generic
+    binary type and can not be inflated once cut short.
+
+__init__
+    rules - list of rules to use instead of the defaults
+    truncate_size - bytes to keep for truncate rules without a limit
+    default - action for content types no rule matches
+
+decide - get (action, limit) for a response's headers (and url)
+drain_skipped - read out a small skipped body so its connection can be reused
+from_file - load rules from a file of "<content-type prefix> <full|skip|truncate[:KB]>" lines
+'''
+class FetchPolicy:
+    default_rules = [
+        ('image/', FETCH_SKIP),
+        ('image/svg+xml', FETCH_FULL), # XML, gets parsed for links
+        ('video/', FETCH_SKIP),
+        ('audio/', FETCH_SKIP),
+        ('font/', FETCH_SKIP),
+        ('application/font', FETCH_SKIP),
+        ('application/x-font', FETCH_SKIP),
+        ('application/vnd.ms-fontobject', FETCH_SKIP),
+        ('application/pdf', FETCH_TRUNCATE),
+        ('application/zip', FETCH_TRUNCATE),
+        ('application/x-tar', FETCH_TRUNCATE),
+        ('application/x-7z-compressed', FETCH_TRUNCATE),
+        ('application/x-rar-compressed', FETCH_TRUNCATE),
+        ('application/vnd.rar', FETCH_TRUNCATE),
+        ('application/x-bzip2', FETCH_TRUNCATE),
+        ('application/x-xz', FETCH_TRUNCATE),
+        ('application/x-msdownload', FETCH_TRUNCATE),
+        ('application/x-iso9660-image', FETCH_TRUNCATE),
+        ('application/vnd.', FETCH_TRUNCATE), # Office docs, apks, etc.
+        ('application/wasm', FETCH_TRUNCATE),
+    ]
+
+    def __init__(self, rules=None, truncate_size=1024*64, default=FETCH_FULL):
+        self.truncate_size = truncate_size
+        self.default = default
+        self.rules = []
+        for rule in (rules if rules is not None else self.default_rules):
+            prefix, action = rule[0].lower(), rule[1]
+            limit = rule[2] if len(rule) > 2 else None
+            if action not in (FETCH_FULL, FETCH_TRUNCATE, FETCH_SKIP):
+                raise ValueError(f"Invalid fetch policy action '{action}' for '{prefix}'")
+            self.rules.append((prefix, action, limit))
+        # Longest prefix first so the most specific rule wins
+        self.rules.sort(key=lambda rule: len(rule[0]), reverse=True)
+
+    @classmethod
+    def from_file(cls, file, truncate_size=1024*64):
+        rules = []
+        with open(file, 'r') as rf:
+            lines = rf.read().strip().split('\n')
+        for line in lines:
+            line = line.split('#', 1)[0].strip()
+            if line == '':
+                continue
+            prefix, action = line.split()
+            limit = None
+            if ':' in action:
+                action, kb = action.split(':', 1)
+                limit = int(float(kb) * 1024)
+            rules.append((prefix, action, limit))
+        return cls(rules=rules, truncate_size=truncate_size)
+
+    def decide(self, headers, url=None):
+        content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        action = self.default
+        limit = None
+        for prefix, rule_action, rule_limit in self.rules:
+            if content_type.startswith(prefix):
+                action = rule_action
+                limit = rule_limit
+                break
+
+        if action == FETCH_SKIP:
+            return FETCH_SKIP, 0
+        if action == FETCH_TRUNCATE and url and urlparse(str(url)).path.lower().endswith('.gz'):
+            action = FETCH_FULL
+        if action == FETCH_TRUNCATE:
+            return FETCH_TRUNCATE, limit if limit is not None else self.truncate_size
+        return FETCH_FULL, float('inf')
+
+    def drain_skipped(self, response, chunk_size):
+        # Reading a small body is cheaper than a new TCP+TLS
+        # handshake, anything bigger (or unknown) gets hung up on
+        try:
+            length = int(response.headers.get('Content-Length', ''))
+        except ValueError:
+            length = None
+        if length is not None and length <= chunk_size:
+            for _ in response.iter_content(chunk_size=chunk_size):
+                pass
+            return True
+        response.close()
+        return False
+
+
 def get_url(url):
     user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/42.0.2311.135 Safari/537.36 Edge/12.246'
     request = requests.Request('GET', url, headers={'User-Agent': user_agent})
@@ -140,28 +328,78 @@ def get_url(url):
     return response, content
 
 
-def get_url_w_request_and_session(request, session):
+def get_url_w_request_and_session(request, session, max_size=1024*1024*250, chunk_size=1024*64, spill_size=None, fetch_policy=None, retries=2):
     prepped = session.prepare_request(request)
 
+    # (None, None) if no try got a response
+    response = None
+    content = None
     retry_count = 0
-    while retry_count <= 2:
+    while retry_count <= retries:
         try:
             while True:
                 #https://stackoverflow.com/questions/10115126/python-requests-close-http-connection
                 response = session.send(prepped, stream=True, verify=False, allow_redirects=False, timeout=10)
-                content = get_content_with_max_size(response, max_size=1024*1024*250) # 250 MB
+
+                # Headers are in, decide how much of the body is worth having
+                if fetch_policy:
+                    decision, limit = fetch_policy.decide(response.headers, url=prepped.url)
+                else:
+                    decision, limit = FETCH_FULL, max_size
+                limit = min(limit, max_size)
+
+                drained = True
+                if decision == FETCH_SKIP:
+                    content = memoryview(b'')
+                    drained = fetch_policy.drain_skipped(response, chunk_size)
+                elif decision == FETCH_TRUNCATE:
+                    content = get_content_with_max_size(response, max_size=limit, chunk_size=chunk_size, spill_size=spill_size, truncate=True)
+                    drained = len(content) < limit
+                else:
+                    content = get_content_with_max_size(response, max_size=limit, chunk_size=chunk_size, spill_size=spill_size)
+                response.fetch_decision = decision
                 break
         except requests.RequestException as e:
             retry_count += 1
             response = None
             content = None
+        except ValueError as e:
+            # Over max_size, trying again will not help
+            response = None
+            content = None
+            break
         else:
             break
-    if response:
-        response.close()
+    if response is not None: # Error statuses are falsy too
+        # A fully drained body means the connection can go
+        # back to the session's keep-alive pool
+        release_connection(response, drained=drained)
 
     return response, content
 
+def build_response(request, status_code, headers, url=None, reason=None, content=None):
+    # Rebuild a requests.Response from its parts (eg. a response
+    # fetched with aiohttp) so DummyResponse, get_links and
+    # get_inputs keep working against the same interface
+    response = requests.Response()
+    response.status_code = int(status_code)
+    response.headers = CaseInsensitiveDict(headers)
+    response.url = str(url) if url else request.url
+    response.reason = reason
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.request = request
+    if content is not None:
+        response._content = content
+        response._content_consumed = True
+    return response
+
+def release_connection(response, drained=True):
+    # A connection with unread body bytes on the wire can not be
+    # reused and has to be closed instead of returned to the pool
+    if drained and response.raw is not None:
+        response.raw.release_conn()
+    response.close()
+
 def is_gz_file(binary_content):
     # Check the magic number for gzip files (1f 8b)
     return binary_content[:2] == b'\x1f\x8b'
@@ -179,8 +417,160 @@ def unpack_gz_content(binary_content):
         return b""
 
 # Takes DummyResponse.response
-def get_links(response, content, get_rendered=False):
+# Tags and the attributes of theirs that hold links
+LINK_ATTRIBUTES = {
+    'a': ('href',),
+    'img': ('src', 'href'),
+    'link': ('href',),
+    'script': ('src', 'href'),
+    'source': ('src', 'srcset', 'href'),
+    'video': ('src', 'href'),
+    'form': ('action', 'href'),
+    'iframe': ('src', 'href'),
+    'object': ('data', 'href'),
+    'embed': ('src', 'href'),
+    'audio': ('src', 'href'),
+    'base': ('href',),
+    'area': ('href',),
+    'input': ('src', 'href'),
+    'param': ('value', 'href'),
+    'blockquote': ('cite', 'href'),
+    'q': ('cite', 'href'),
+    'del': ('cite', 'href'),
+    'ins': ('cite', 'href'),
+    'track': ('src', 'href'),
+}
+# An href on any other tag is a link too
+OTHER_LINK_ATTRIBUTES = ('href',)
+
+INPUT_TAGS = {'input', 'textarea', 'select', 'option', 'button', 'datalist'}
+# Tags BeautifulSoup prints as <tag/> (the only one of INPUT_TAGS
+# that can not have contents)
+VOID_TAGS = {'input'}
+
+# Attribute values BeautifulSoup keeps as lists of words
+LIST_ATTRIBUTES = {'class', 'accesskey', 'dropzone'}
+ESCAPED_CHARACTERS = re.compile(r'[&<>]')
+ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+
+
+# The opening tag of an element, as str(element) prints it up to
+# its first '>' (attributes sorted, values escaped and quoted the
+# way BeautifulSoup does, void elements closed with '/'), without
+# printing everything inside the element
+def format_start_tag(name, attrs):
+    parts = ['<', name]
+    for key, value in sorted(attrs.items()):
+        if isinstance(value, list):
+            value = ' '.join(value)
+        value = ESCAPED_CHARACTERS.sub(lambda match: ESCAPES[match.group()], value)
+        if '"' in value:
+            if "'" in value:
+                value = '"' + value.replace('"', '&quot;') + '"'
+            else:
+                value = "'" + value + "'"
+        else:
+            value = '"' + value + '"'
+        parts.append(' ' + key + '=' + value)
+    parts.append('/>' if name in VOID_TAGS else '>')
+    return ''.join(parts)
+
+
+def add_link(links, base_url, link):
+    full_url = urljoin(base_url, link)
+    # Validate the URL
+    parsed_url = urlparse(full_url)
+    if parsed_url.scheme and parsed_url.netloc:
+        links.add(full_url)
+
+
+# Everything taken from one tag, its links and (if inputs is a
+# list) the tag itself if it is an input
+def extract_tag(name, attrs, base_url, links, inputs):
+    for attribute in LINK_ATTRIBUTES.get(name, OTHER_LINK_ATTRIBUTES):
+        if attribute in attrs:
+            add_link(links, base_url, attrs[attribute])
+    if inputs is not None and name in INPUT_TAGS:
+        inputs.append((format_start_tag(name, attrs), attrs.get('name', ''), attrs.get('value', '')))
+
+
+# One walk over every element of a tree (xml pages), instead of one
+# find_all per kind of tag
+def walk_soup(soup, base_url, links, inputs=None):
+    for element in soup.find_all(True):
+        extract_tag(element.name, element.attrs, base_url, links, inputs)
+        if element.name == 'loc':
+            add_link(links, base_url, element.get_text())
+
+
+'''
+PageParser
+    Takes the links and inputs of an html page in one pass of
+    html.parser (the parser under BeautifulSoup's 'html.parser'),
+    straight from its tag events, instead of building a tree and
+    searching it. Attributes are read the way BeautifulSoup reads
+    them (no value = '', the last of a duplicate wins, class and
+    co. split into words), so both give the same links and inputs.
+
+__init__
+    base_url - url relative links are resolved against
+
+feed - parse (more of) the page
+close - finish the page
+links - set of links found
+inputs - list of (tag, name, value) of the inputs found
+'''
+class PageParser(HTMLParser):
+    def __init__(self, base_url):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = set()
+        self.inputs = []
+        # Text of every <loc> still open (sitemap links in an html page)
+        self.locs = []
+
+    def handle_starttag(self, tag, attrs):
+        attr_dict = {}
+        for key, value in attrs:
+            if value is None:
+                value = ''
+            elif key in LIST_ATTRIBUTES:
+                value = value.split()
+            attr_dict[key] = value
+        extract_tag(tag, attr_dict, self.base_url, self.links, self.inputs)
+        if tag == 'loc':
+            self.locs.append([])
+
+    def handle_endtag(self, tag):
+        if tag == 'loc' and self.locs:
+            add_link(self.links, self.base_url, ''.join(self.locs.pop()))
+
+    def handle_data(self, data):
+        for loc in self.locs:
+            loc.append(data)
+
+    def close(self):
+        super().close()
+        while self.locs:
+            add_link(self.links, self.base_url, ''.join(self.locs.pop()))
+
+
+def get_content_type(response):
+    if 'Content-Type' in response.headers:
+        return response.headers['Content-Type'].lower()
+    elif 'content-type' in response.headers:
+        return response.headers['content-type'].lower()
+    return ''
+
+
+# Everything the crawl takes from a page, with one decode and one
+# pass over its tags: returns (links, inputs, text), text being the
+# decoded body if it had to be decoded (else None)
+#   html_parser - backend for html pages (see HtmlParsers, Default PageParser)
+def parse_page(response, content, html_parser=None):
     links = set()  # Using a set to avoid duplicate links
+    inputs = []
+    text = None
     soup = None
     parsed = urlparse(response.url)
 
@@ -190,19 +580,7 @@ def get_links(response, content, get_rendered=False):
         full_url = urljoin(original_url, location)
         links.add(full_url)
 
-    elif response.is_redirect and 'location' in response.headers:
-        original_url = response.request.url
-        location = response.headers['location']
-        full_url = urljoin(original_url, location)
-
-
-    if 'Content-Type' in response.headers:
-        content_type = response.headers['Content-Type'].lower()
-    elif 'content-type' in response.headers:
-        content_type = response.headers['content-type'].lower()
-    else:
-        content_type = ''
-
+    content_type = get_content_type(response)
 
     # Get all Links in Link headers
     for key, value in response.links.items():
@@ -219,101 +597,51 @@ def get_links(response, content, get_rendered=False):
                 parsed_url = urlparse(full_url)
                 if parsed_url.scheme and parsed_url.netloc:
                     links.add(full_url)
-        
+
         elif 'xml' in content_type:
-            soup = BeautifulSoup(get_text(response, content), 'xml')
+            text = get_text(response, content)
+            soup = BeautifulSoup(text, 'xml')
 
         elif 'html' in content_type:
-            soup = BeautifulSoup(get_text(response, content), 'html.parser')
+            text = get_text(response, content)
+            if html_parser:
+                page_links, inputs = html_parser.extract(text, response.url)
+            else:
+                parser = PageParser(response.url)
+                parser.feed(text)
+                parser.close()
+                page_links, inputs = parser.links, parser.inputs
+            links.update(page_links)
 
         # For Plaintext Sitemaps
         elif 'text/plain' in content_type:
-            if check_urls_list(get_text(response, content)):
-                links.update(filter_invalid_urls(list(set(get_text(response, content).strip().split('\n')))))
-            
-        # For Sitemaps 
-        elif parsed.path.endswith('.txt.gz') and is_gz_file(content):
-            content = unpack_gz_content(content)
-            text = str(content, errors="replace")
+            text = get_text(response, content)
             if check_urls_list(text):
                 links.update(filter_invalid_urls(list(set(text.strip().split('\n')))))
-            
-        elif parsed.path.endswith('.gz') and is_gz_file(content):
-            content = unpack_gz_content(content)
-            text = str(content, errors="replace")
-            soup = BeautifulSoup(text, 'xml')
-
-        if soup:
-            # Define the tags and attributes to look for
-            tags_attributes = {
-                'a': 'href',
-                'img': 'src',
-                'link': 'href',
-                'script': 'src',
-                'source': ['src', 'srcset'],
-                'video': 'src',
-                'form': 'action',
-                'iframe': 'src',
-                'object': 'data',
-                'embed': 'src',
-                'audio': 'src',
-                'base': 'href',
-                'area': 'href',
-                'input': 'src',
-                'param': 'value',
-                'blockquote': 'cite',
-                'q': 'cite',
-                'del': 'cite',
-                'ins': 'cite',
-                'track': 'src',
-            }
-
-            # Iterate over the defined tags and attributes and extract links
-            for tag, attributes in tags_attributes.items():
-                if not isinstance(attributes, list):
-                    attributes = [attributes]
-                for attribute in attributes:
-                    for element in soup.find_all(tag, **{attribute: True}):
-                        # Additional conditions for specific tags
-                        #if tag == 'meta' and element.get('http-equiv', '').lower() == 'refresh':
-                        #    continue
-                        #if tag == 'input' and element.get('type', '').lower() != 'image':
-                        #    continue
-                        #if tag == 'param' and element.get('name', '').lower() != 'movie':
-                        #    continue
-
-                        link = element[attribute]
-                        full_url = urljoin(response.url, link)
-
-                        # Validate the URL
-                        parsed_url = urlparse(full_url)
-                        if parsed_url.scheme and parsed_url.netloc:
-                            links.add(full_url)
-
-
-            for element in soup.find_all(href=True):
-                link = element['href']
-                full_url = urljoin(response.url, link)
 
-                # Validate the URL
-                parsed_url = urlparse(full_url)
-                if parsed_url.scheme and parsed_url.netloc:
-                    links.add(full_url)
-
-            for element in soup.find_all('loc'):
-                link = element.get_text()
-                full_url = urljoin(response.url, link)
+        # For Sitemaps
+        elif parsed.path.endswith('.txt.gz') and is_gz_file(content):
+            unpacked = str(unpack_gz_content(content), errors="replace")
+            if check_urls_list(unpacked):
+                links.update(filter_invalid_urls(list(set(unpacked.strip().split('\n')))))
 
-                # Validate the URL
-                parsed_url = urlparse(full_url)
-                if parsed_url.scheme and parsed_url.netloc:
-                    links.add(full_url)
+        elif parsed.path.endswith('.gz') and is_gz_file(content):
+            unpacked = str(unpack_gz_content(content), errors="replace")
+            soup = BeautifulSoup(unpacked, 'xml')
 
+        if soup:
+            # Only (x)html pages have inputs worth storing
+            walk_soup(soup, response.url, links, inputs if 'html' in content_type else None)
 
     except Exception as e:
         print(f"An error occurred: {e}")
 
-    return list(links)
+    return list(links), inputs, text
+
+
+# Both parse the whole page, use parse_page to get links and inputs together
+def get_links(response, content, get_rendered=False):
+    return parse_page(response, content)[0]
 
 def get_qps(url):
     qps = []
@@ -327,28 +655,8 @@ def get_qps(url):
     return qps
 
 def get_inputs(response, content):
-    inputs = []
+    return parse_page(response, content)[1]
 
-    if 'Content-Type' in response.headers:
-        content_type = response.headers['Content-Type'].lower()
-    elif 'content-type' in response.headers:
-        content_type = response.headers['content-type'].lower()
-    else:
-        content_type = ''
-
-    if 'html' in content_type:
-        soup = BeautifulSoup(get_text(response, content), 'html.parser')
-        
-        # Query the tags: 'input', 'textarea', 'select', 'option', 'button', and 'datalist'
-        elements = soup.select('input, textarea, select, option, button, datalist')
-        inputs = []
-        input_tags = []
-        for element in elements:
-            tag = str(element).split('>')[0] + '>'
-            tag_name = element.get('name', '')
-            tag_value = element.get('value', '')
-            inputs.append((tag, tag_name, tag_value))
-    return inputs
 
 def same_domain(url1, url2):
     netloc1 = urlparse(url1).netloc
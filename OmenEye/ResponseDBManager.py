@@ -9,46 +9,94 @@ import requests
 
 #from RequestUtils import *
 from .RequestUtils import *
+from .WorkTracker import STOP_SIGNAL, wake_workers
+from .BoundedQueue import get_batch, finish_batch
+from .NearDuplicateIndex import page_simhash
 
 
 #https://peps.python.org/pep-0703/
 
 class DummyResponse:
-    def __init__(self, response=None, content=b'', get_rendered=False):
+    # get_simhash - fingerprint the page for near-duplicate detection (see page_simhash)
+    # html_parser - backend to parse html pages with (see HtmlParsers)
+    def __init__(self, response=None, content=b'', get_rendered=False, links=None, inputs=None, get_simhash=False, html_parser=None):
         if response:
             self.url = str(response.request.url)
             self.visited = True
             self.status_code = int(response.status_code)
-            self.content = bytes(content)
+            # Kept as the fetched buffer (usually a memoryview), not copied
+            self.content = content if content is not None else b''
             self.headers = dict(response.headers)
-            self.text = get_text(response, content)
-
-            if get_rendered:
-                self.links = get_links(response, content)
+            self._text = None
+            self._text_response = response
+
+            # links/inputs can be handed in already parsed (eg. by a
+            # ParserPool), else the page is decoded and parsed once for
+            # both, and the decoded text is kept for self.text
+            if links is None or inputs is None:
+                parsed_links, parsed_inputs, text = parse_page(response, content, html_parser=html_parser)
+                if text is not None:
+                    self._text = text
+                    self._text_response = None
+                self.links = links if links is not None else parsed_links
+                self.inputs = inputs if inputs is not None else parsed_inputs
             else:
-                self.links = get_links(response, content)
+                self.links = links
+                self.inputs = inputs
 
             self.query_params = get_qps(self.url)
-            self.inputs = get_inputs(response, content)
             self.is_redirect = bool(response.is_redirect)
+            self.fetch_decision = getattr(response, 'fetch_decision', FETCH_FULL)
+
+            # Only pages have words worth comparing
+            content_type = self.headers.get('Content-Type', self.headers.get('content-type', ''))
+            if get_simhash and (not content_type or 'html' in content_type.lower()):
+                # On the decoded text (already there if parse_page made it)
+                self.simhash = page_simhash(self.text)
+            else:
+                self.simhash = None
+            # Url of the page this one is a near-duplicate of
+            self.near_duplicate = None
+            # A "not found" page served with a 2xx (see Soft404Detector)
+            self.soft_404 = False
         else:
             self.url = None
             self.visited = False
             self.status_code = None
             self.content = None
             self.headers = {}
-            self.text = None
+            self._text = None
+            self._text_response = None
             self.links = []
             self.query_params = []
             self.inputs = []
             self.is_redirect = None
+            self.fetch_decision = None
+            self.simhash = None
+            self.near_duplicate = None
+            self.soft_404 = None
     
+    # Decoded on first use only, bodies can be hundreds of MB
+    @property
+    def text(self):
+        if self._text is None and self._text_response is not None:
+            self._text = get_text(self._text_response, self.content)
+            self._text_response = None
+        return self._text
+
     '''Use for urls that have been seen but are unvisited'''
     def blank_w_url(self, url):
         self.url = str(url)
         self.query_params = get_qps(self.url)
         return self
 
+    '''Use for urls that were requested but never got a response'''
+    def failed_w_url(self, url):
+        self.blank_w_url(url)
+        self.visited = True
+        self.fetch_decision = 'failed'
+        return self
+
 
 '''
 ThreadSafeCounter
@@ -73,6 +121,16 @@ class ThreadSafeCounter:
             self.value += 1
             return self.value
 
+    # Last value handed out (eg. to checkpoint it)
+    def peek_value(self):
+        with self.lock:
+            return self.value
+
+    # Continue counting after value (eg. when resuming)
+    def set_value(self, value):
+        with self.lock:
+            self.value = max(self.value, value)
+
 
 '''
 ResponseDBManager
@@ -84,22 +142,38 @@ __init__
     db_name - Name of the DB to make
     num_threads - number of threads to run with
     input_queue - a queue of responses to pull from
+    batch_size - if set, workers take up to batch_size responses at once and
+                 write each batch in one transaction
+    resume - keep writing to the dbs of an interrupted crawl instead of new ones
+    commit_func - optional func(urls) called with the urls of the responses
+                  in every commit, once they are safely on disk
 
 start_threads - start the threads
 stop_threads - kill threads, use in emergencies
 join_threads - join the threads when input queue is empty
+scale_to - grow or shrink the number of running workers (each new worker gets its own db)
 combine_dbs - (Dont call) Combine the dbs
 worker - (Dont call) Worker thread used to get responses from queue and write to db
+batch_worker - (Dont call) Worker thread used in batch mode
 create_dbs - (Dont call)
 init_tables - (Dont call)
 write_response_to_db - (Dont call) Write a response to a db, called in worker
+write_responses_to_db - (Dont call) Write a list of responses to a db
 get_rates - get intake and output rates of workers
+get_processed - get the number of responses written so far
+get_stored_urls - get the urls of every visited response already on disk
+drop_unvisited - (Dont call) remove the unvisited rows of an interrupted crawl
+resume_counters - (Dont call) continue the primary keys of an interrupted crawl
+get_counters - get the primary key counter values
 '''
 class ResponseDBManager:
     def __init__(self,
             db_name=None,
             num_threads=None,
             input_queue=None,
+            batch_size=None,
+            resume=False,
+            commit_func=None,
         ):
 
         if db_name is None or not isinstance(db_name, str):
@@ -108,6 +182,8 @@ class ResponseDBManager:
             raise TypeError(f"num_threads should be of type 'int', but got {type(num_threads).__name__}")
         if input_queue is None or not isinstance(input_queue, queue.Queue):
             raise TypeError(f"input_queue should be of type 'queue.Queue', but got {type(input_queue).__name__}")
+        if batch_size is not None and not isinstance(batch_size, int):
+            raise TypeError(f"batch_size should be of type 'int', but got {type(batch_size).__name__}")
 
         self.responses_pk = ThreadSafeCounter()
         self.headers_pk = ThreadSafeCounter()
@@ -118,14 +194,29 @@ class ResponseDBManager:
         self.db_name = db_name
         self.num_threads = num_threads
         self.input_queue = input_queue
+        self.batch_size = batch_size
+        self.commit_func = commit_func
 
         self.db_list = []
+        if resume:
+            # Every db left behind by the interrupted crawl (autoscaled
+            # crawls can leave more than num_threads of them)
+            i = 0
+            while os.path.exists(f"{db_name}_{i}"):
+                self.db_list.append(f"{db_name}_{i}")
+                i += 1
+            resumed_dbs = list(self.db_list)
         for i in range(0, self.num_threads):
-            self.db_list.append(f"{db_name}_{i}")
+            if f"{db_name}_{i}" not in self.db_list:
+                self.db_list.append(f"{db_name}_{i}")
 
         self.threads = []
         self.stop_threads_event = threading.Event()
 
+        # Workers still to be retired by scale_to
+        self.retire_count = 0
+        self.processed = 0
+
         self.last_output_time = 0
         self.last_input_time = 0
         self.input_ema = 0.0
@@ -137,16 +228,59 @@ class ResponseDBManager:
         self.lock = threading.Lock()
 
 
-        self.create_dbs()
-        self.init_tables()
+        if resume:
+            new_dbs = [db for db in self.db_list if db not in resumed_dbs]
+            if new_dbs:
+                self.init_tables(dbs=new_dbs)
+            self.drop_unvisited()
+            self.resume_counters()
+        else:
+            self.create_dbs()
+            self.init_tables()
 
     def start_threads(self):
-        worker_id = 0
         for _ in range(self.num_threads):
-            thread = threading.Thread(target=self.worker, args=(worker_id,))
-            thread.start()
-            self.threads.append(thread)
-            worker_id += 1
+            self.start_thread()
+
+    def start_thread(self):
+        worker_id = len(self.threads)
+        # Workers added by scale_to write to a db of their own,
+        # it is merged with the rest at the end
+        db = f"{self.db_name}_{worker_id}"
+        if db not in self.db_list:
+            self.db_list.append(db)
+            self.init_tables(dbs=[db])
+        target = self.batch_worker if self.batch_size else self.worker
+        thread = threading.Thread(target=target, args=(worker_id,))
+        thread.start()
+        self.threads.append(thread)
+
+    # Workers are retired between items, never in the middle of one
+    def scale_to(self, num_threads):
+        with self.lock:
+            current = self.num_threads
+            self.num_threads = num_threads
+            if num_threads < current:
+                self.retire_count += current - num_threads
+                retire_count = self.retire_count
+            else:
+                # Cancel pending retirements before starting new threads
+                cancelled = min(self.retire_count, num_threads - current)
+                self.retire_count -= cancelled
+                to_start = num_threads - current - cancelled
+        if num_threads < current:
+            # Wake idle workers so they retire right away
+            wake_workers(self.input_queue, retire_count)
+        else:
+            for _ in range(to_start):
+                self.start_thread()
+
+    def should_retire(self):
+        with self.lock:
+            if self.retire_count > 0:
+                self.retire_count -= 1
+                return True
+        return False
 
     # Useful for situations where you want to keep threads up
     # while the input queue is empty
@@ -154,6 +288,7 @@ class ResponseDBManager:
     #  you want to stop them)
     def stop_threads(self):
         self.stop_threads_event.set()
+        wake_workers(self.input_queue, len(self.threads))
 
         for thread in self.threads:
             thread.join()
@@ -164,19 +299,25 @@ class ResponseDBManager:
     # done on the input queue
     # Otherwise, wait for more input on the input queue
     def join_threads(self):
-        while self.input_queue.unfinished_tasks > 0:
-            sleep(5)
+        # Wakes up the moment the last response is written, no polling
+        self.input_queue.join()
         self.stop_threads()
 
     def worker(self, worker_id):
         commit_counter = 1
+        uncommitted_urls = []
         db_name = f"{self.db_name}_{worker_id}"
         with sqlite3.connect(db_name) as conn:
             cursor = conn.cursor()
 
             while not self.stop_threads_event.is_set():
+                if self.should_retire():
+                    break
                 try:
                     item = self.input_queue.get(timeout=1)
+                    if item is STOP_SIGNAL:
+                        self.input_queue.task_done()
+                        continue
 
                     if not self.stop_threads_event.is_set():
                         with self.lock:
@@ -185,11 +326,15 @@ class ResponseDBManager:
                             self.output_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.output_ema
                             self.last_output_time = current_time
                         self.write_response_to_db(cursor, item)
+                        uncommitted_urls.append(item.url)
 
                     # Push changes every 500 items
                     if commit_counter % 500 == 0:
                         conn.commit()
                         #print(f'[*] DBWorkerManager-W{worker_id}: Committed')
+                        if self.commit_func:
+                            self.commit_func(uncommitted_urls)
+                        uncommitted_urls = []
                         commit_counter = 0
                     commit_counter += 1
 
@@ -200,9 +345,58 @@ class ResponseDBManager:
                         time_diff = current_time - self.last_input_time
                         self.input_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.input_ema
                         self.last_input_time = current_time
+                        self.processed += 1
                     self.input_queue.task_done()
                 except queue.Empty:
-                    pass
+                    # Commit when the queue runs dry too, so finished
+                    # urls do not wait on the 500 mark to be reported
+                    if uncommitted_urls:
+                        conn.commit()
+                        if self.commit_func:
+                            self.commit_func(uncommitted_urls)
+                        uncommitted_urls = []
+                        commit_counter = 1
+
+            conn.commit()
+            if self.commit_func:
+                self.commit_func(uncommitted_urls)
+
+    # Same as worker, but one transaction, one rate update and one
+    # task_done round trip per batch instead of per response
+    def batch_worker(self, worker_id):
+        db_name = f"{self.db_name}_{worker_id}"
+        with sqlite3.connect(db_name) as conn:
+            cursor = conn.cursor()
+
+            while not self.stop_threads_event.is_set():
+                if self.should_retire():
+                    break
+                try:
+                    batch = get_batch(self.input_queue, self.batch_size, timeout=1, stop_item=STOP_SIGNAL)
+                except queue.Empty:
+                    continue
+
+                items = [item for item in batch if item is not STOP_SIGNAL]
+                if items and not self.stop_threads_event.is_set():
+                    self.write_responses_to_db(cursor, items)
+                    conn.commit()
+                    if self.commit_func:
+                        self.commit_func([item.url for item in items])
+
+                with self.lock:
+                    current_time = time()
+                    if items:
+                        time_diff = current_time - self.last_input_time
+                        if time_diff > 0:
+                            self.input_ema = self.alpha * (len(items) / time_diff) + (1 - self.alpha) * self.input_ema
+                            self.output_ema = self.alpha * (len(items) / time_diff) + (1 - self.alpha) * self.output_ema
+                        self.last_input_time = current_time
+                        self.last_output_time = current_time
+                        self.processed += len(items)
+                num_items = len(batch)
+                del items
+                del batch
+                finish_batch(self.input_queue, num_items)
 
             conn.commit()
 
@@ -218,14 +412,18 @@ class ResponseDBManager:
             except sqlite3.Error as e:
                 raise Exception(f"Error creating SQLite database: {e}")
             
-    def init_tables(self):
+    def init_tables(self, dbs=None):
         create_responses_table = '''
                 CREATE TABLE responses (
                     response_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     url TEXT,
                     visited INTEGER,
                     status_code INTEGER,
-                    body BLOB
+                    body BLOB,
+                    fetch_decision TEXT,
+                    simhash INTEGER,
+                    near_duplicate TEXT,
+                    soft_404 INTEGER
                 )
             '''
         create_headers_table = '''
@@ -265,7 +463,9 @@ class ResponseDBManager:
             )
         '''
 
-        for db in self.db_list:
+        if dbs is None:
+            dbs = self.db_list
+        for db in dbs:
             with sqlite3.connect(db) as conn:
                 conn.execute(create_responses_table)
                 conn.execute(create_headers_table)
@@ -275,72 +475,96 @@ class ResponseDBManager:
                 conn.commit()
         
     def write_response_to_db(self, cursor, response):
+        return self.write_responses_to_db(cursor, [response])
+
+    # Rows of every response are gathered per table first, so a
+    # whole batch goes in with one executemany per table
+    def write_responses_to_db(self, cursor, responses):
         #self.responses_pk = ThreadSafeCounter()
         #self.headers_pk = ThreadSafeCounter()
         #self.links_pk = ThreadSafeCounter()
         #self.query_params_pk = ThreadSafeCounter()
         #self.inputs_pk = ThreadSafeCounter()
-
-        #----------------------------------------------------
-        # RESPONSE
-        response_id = self.responses_pk.get_value()
-
-        url = response.url
-        visited = response.visited
-        status_code = response.status_code
-        body = response.content
+        response_rows = []
+        header_rows = []
+        link_rows = []
+        qp_rows = []
+        input_rows = []
+
+        for response in responses:
+            #----------------------------------------------------
+            # RESPONSE
+            response_id = self.responses_pk.get_value()
+
+            url = response.url
+            visited = response.visited
+            status_code = response.status_code
+            body = response.content
+            fetch_decision = response.fetch_decision
+            # SQLite integers are signed
+            simhash = response.simhash
+            if simhash is not None and simhash >= (1 << 63):
+                simhash -= 1 << 64
+            near_duplicate = response.near_duplicate
+            soft_404 = response.soft_404
+
+            response_rows.append((response_id, url, visited, status_code, body, fetch_decision, simhash, near_duplicate, soft_404))
+
+            #----------------------------------------------------
+            # HEADERS
+            for header_name in response.headers:
+                header_id = self.headers_pk.get_value()
+                header_value = response.headers[header_name]
+                header_rows.append((header_id, response_id, header_name, header_value))
+
+            #----------------------------------------------------
+            # LINKS
+            links = response.links
+            for link in links:
+                link_id = self.links_pk.get_value()
+                link_rows.append((link_id, response_id, link))
+
+            #----------------------------------------------------
+            # QUERY PARAMS
+            qps = response.query_params
+            for qp in qps:
+                param_id = self.query_params_pk.get_value()
+                qp_rows.append((param_id, response_id, qp[0], qp[1]))
+
+            #----------------------------------------------------
+            # INPUTS
+            inputs = response.inputs
+            for inp in inputs:
+                tag, tag_name, tag_value = inp
+                input_id = self.inputs_pk.get_value()
+                input_rows.append((input_id, response_id, tag, tag_name, tag_value))
 
         insert_reponse = '''
-            INSERT INTO responses (response_id, url, visited, status_code, body)
+            INSERT INTO responses (response_id, url, visited, status_code, body, fetch_decision, simhash, near_duplicate, soft_404)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        '''
+        insert_header = '''
+            INSERT INTO headers (header_id, response_id, header_name, header_value)
+            VALUES (?, ?, ?, ?)
+        '''
+        insert_links = '''
+            INSERT INTO links (link_id, response_id, link)
+            VALUES (?, ?, ?)
+        '''
+        insert_qp = '''
+            INSERT INTO query_params (param_id, response_id, param_name, param_value)
+            VALUES (?, ?, ?, ?)
+        '''
+        insert_inputs = '''
+            INSERT INTO inputs (input_id, response_id, tag, tag_name, tag_value)
             VALUES (?, ?, ?, ?, ?)
         '''
-        
-        cursor.execute(insert_reponse, (response_id, url, visited, status_code, body))
-
-        #----------------------------------------------------
-        # HEADERS
-        for header_name in response.headers:
-            header_id = self.headers_pk.get_value()
-            header_value = response.headers[header_name]
-            insert_header = '''
-                INSERT INTO headers (header_id, response_id, header_name, header_value)
-                VALUES (?, ?, ?, ?)
-            '''
-            cursor.execute(insert_header, (header_id, response_id, header_name, header_value))
-
-        #----------------------------------------------------
-        # LINKS
-        links = response.links
-        for link in links:
-            link_id = self.links_pk.get_value()
-            insert_links = '''
-                INSERT INTO links (link_id, response_id, link)
-                VALUES (?, ?, ?)
-            '''
-            cursor.execute(insert_links, (link_id, response_id, link))
-
-        #----------------------------------------------------
-        # QUERY PARAMS
-        qps = response.query_params
-        for qp in qps:
-            param_id = self.query_params_pk.get_value()
-            insert_qp = '''
-                INSERT INTO query_params (param_id, response_id, param_name, param_value)
-                VALUES (?, ?, ?, ?)
-            '''
-            cursor.execute(insert_qp, (param_id, response_id, qp[0], qp[1]))
-
-        #----------------------------------------------------
-        # INPUTS
-        inputs = response.inputs
-        for inp in inputs:
-            tag, tag_name, tag_value = inp
-            input_id = self.inputs_pk.get_value()
-            insert_inputs = '''
-                INSERT INTO inputs (input_id, response_id, tag, tag_name, tag_value)
-                VALUES (?, ?, ?, ?, ?)
-            '''
-            cursor.execute(insert_inputs, (input_id, response_id, tag, tag_name, tag_value))
+
+        cursor.executemany(insert_reponse, response_rows)
+        cursor.executemany(insert_header, header_rows)
+        cursor.executemany(insert_links, link_rows)
+        cursor.executemany(insert_qp, qp_rows)
+        cursor.executemany(insert_inputs, input_rows)
 
         return None
 
@@ -398,4 +622,126 @@ class ResponseDBManager:
         with self.lock:
             input_rate = self.input_ema
             output_rate = self.output_ema
-        return input_rate, output_rate
\ No newline at end of file
+        return input_rate, output_rate
+
+    def get_processed(self):
+        with self.lock:
+            return self.processed
+
+    # The dbs of this crawl that hold responses, including the
+    # merged db of an earlier run that was resumed
+    def get_written_dbs(self):
+        dbs = [db for db in self.db_list if os.path.exists(db)]
+        if os.path.exists(self.db_name):
+            dbs.append(self.db_name)
+        return dbs
+
+    def get_stored_urls(self):
+        urls = set()
+        for db in self.get_written_dbs():
+            with sqlite3.connect(db) as conn:
+                for url, in conn.execute('SELECT url FROM responses WHERE visited'):
+                    urls.add(url)
+            conn.close()
+        return urls
+
+    def get_counters(self):
+        return {
+            'responses': self.responses_pk.peek_value(),
+            'headers': self.headers_pk.peek_value(),
+            'links': self.links_pk.peek_value(),
+            'query_params': self.query_params_pk.peek_value(),
+            'inputs': self.inputs_pk.peek_value(),
+        }
+
+    # Unvisited rows of the interrupted crawl are written again at
+    # the end of the resumed one (some of them get visited by then)
+    def drop_unvisited(self):
+        for db in self.get_written_dbs():
+            with sqlite3.connect(db) as conn:
+                conn.execute('DELETE FROM query_params WHERE response_id IN (SELECT response_id FROM responses WHERE NOT visited)')
+                conn.execute('DELETE FROM responses WHERE NOT visited')
+                conn.commit()
+            conn.close()
+
+    # Carry on from the highest key on disk, so the dbs still
+    # merge without primary key collisions
+    def resume_counters(self, counters=None):
+        tables = {
+            'responses': ('response_id', self.responses_pk),
+            'headers': ('header_id', self.headers_pk),
+            'links': ('link_id', self.links_pk),
+            'query_params': ('param_id', self.query_params_pk),
+            'inputs': ('input_id', self.inputs_pk),
+        }
+        for db in self.get_written_dbs():
+            with sqlite3.connect(db) as conn:
+                for table, (key, counter) in tables.items():
+                    max_id = conn.execute(f'SELECT MAX({key}) FROM {table}').fetchone()[0]
+                    if max_id:
+                        counter.set_value(max_id)
+            conn.close()
+        if counters:
+            for table, (key, counter) in tables.items():
+                if table in counters:
+                    counter.set_value(int(counters[table]))
+
+
+# Primary key of every table, responses' is also the foreign key
+# of all the others
+TABLE_KEYS = {
+    'responses': 'response_id',
+    'headers': 'header_id',
+    'links': 'link_id',
+    'query_params': 'param_id',
+    'inputs': 'input_id',
+}
+
+'''
+Merge the output DBs of separate crawls (eg. the processes of a
+sharded crawl) into destination_db. Unlike combine_dbs, their keys
+were not handed out by one shared counter and all start at 1, so
+the keys of every source are shifted past the ones already in the
+destination (and response_id along with them).
+A url seen by one crawl may have been visited by another, or seen
+by several of them, so only one row is kept per url.
+'''
+def merge_shard_dbs(destination_db, source_dbs):
+    with sqlite3.connect(destination_db) as conn:
+        for source_db in source_dbs:
+            conn.execute('ATTACH DATABASE ? AS source', (source_db,))
+
+            # Tables are taken from the first source, so columns
+            # added later to the schema come along
+            tables = conn.execute("SELECT sql FROM source.sqlite_master WHERE type='table' AND name!='sqlite_sequence'").fetchall()
+            for sql, in tables:
+                conn.execute(sql.replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS', 1))
+
+            offsets = {}
+            for table, key in TABLE_KEYS.items():
+                offsets[table] = conn.execute(f'SELECT COALESCE(MAX({key}), 0) FROM main.{table}').fetchone()[0]
+
+            for table, key in TABLE_KEYS.items():
+                columns = [row[1] for row in conn.execute(f'PRAGMA source.table_info({table})')]
+                values = []
+                for column in columns:
+                    if column == key:
+                        values.append(f'{column} + {offsets[table]}')
+                    elif column == 'response_id':
+                        values.append(f'{column} + {offsets["responses"]}')
+                    else:
+                        values.append(column)
+                conn.execute(f'INSERT INTO main.{table} ({", ".join(columns)}) SELECT {", ".join(values)} FROM source.{table}')
+            conn.commit()
+            conn.execute('DETACH DATABASE source')
+
+        unvisited_dupes = '''
+            SELECT response_id FROM responses WHERE NOT visited AND (
+                url IN (SELECT url FROM responses WHERE visited)
+                OR response_id NOT IN (SELECT MIN(response_id) FROM responses WHERE NOT visited GROUP BY url)
+            )
+        '''
+        conn.execute(f'DELETE FROM query_params WHERE response_id IN ({unvisited_dupes})')
+        conn.execute(f'DELETE FROM responses WHERE response_id IN ({unvisited_dupes})')
+        conn.commit()
+    conn.close()
@@ -0,0 +1,194 @@
+import heapq
+import random
+import threading
+from time import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+'''
+RetryPolicy
+    Base class for pluggable retry policies. A policy looks at the
+    outcome of a single attempt (a response, or None if the request
+    errored out) and decides if and when the url should be tried
+    again. Subclass it and override should_retry/get_delay to plug
+    in a different strategy.
+
+__init__
+    max_retries - max number of retries per url
+    retry_statuses - status codes that are worth retrying
+    host_budget - max number of retries per host over the whole crawl (None = no limit)
+
+should_retry - True if the outcome is a failure worth retrying
+get_delay - seconds to wait before the given retry attempt
+schedule - get the delay for the next retry, or None to give up
+get_counts - get (retries scheduled, retries given up on)
+'''
+class RetryPolicy:
+    def __init__(self,
+            max_retries=3,
+            retry_statuses=(429, 502, 503, 504),
+            host_budget=None,
+        ):
+        self.max_retries = max_retries
+        self.retry_statuses = set(retry_statuses)
+        self.host_budget = host_budget
+
+        self.host_retries = {}
+        self.retried = 0
+        self.gave_up = 0
+        self.lock = threading.Lock()
+
+    def should_retry(self, response):
+        if response is None:
+            return True
+        return response.status_code in self.retry_statuses
+
+    def get_delay(self, attempt, response):
+        return 0
+
+    def schedule(self, url, attempt, response):
+        if not self.should_retry(response):
+            return None
+
+        host = urlparse(url).netloc
+        with self.lock:
+            if attempt >= self.max_retries:
+                self.gave_up += 1
+                return None
+            # A host that keeps failing stops getting retries
+            # instead of eating the crawl
+            if self.host_budget is not None and self.host_retries.get(host, 0) >= self.host_budget:
+                self.gave_up += 1
+                return None
+            self.host_retries[host] = self.host_retries.get(host, 0) + 1
+            self.retried += 1
+
+        return self.get_delay(attempt, response)
+
+    def get_counts(self):
+        with self.lock:
+            return self.retried, self.gave_up
+
+
+'''
+BackoffRetryPolicy
+    Exponential backoff with full jitter (a random delay between 0
+    and base_delay * 2^attempt, capped at max_delay). A Retry-After
+    header on a 429/503 is honored instead, capped at max_retry_after.
+'''
+class BackoffRetryPolicy(RetryPolicy):
+    def __init__(self,
+            max_retries=3,
+            retry_statuses=(429, 502, 503, 504),
+            host_budget=50,
+            base_delay=1.0,
+            max_delay=60.0,
+            max_retry_after=600.0,
+        ):
+        super().__init__(
+            max_retries=max_retries,
+            retry_statuses=retry_statuses,
+            host_budget=host_budget,
+        )
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def get_delay(self, attempt, response):
+        if response is not None and response.status_code in (429, 503):
+            retry_after = get_retry_after(response)
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def get_retry_after(response):
+    # Retry-After is either delta-seconds or an HTTP-date
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+'''
+RetryScheduler
+    Holds items that are waiting out a retry delay and puts them back
+    on the frontier (the output queue) once they are due, so no
+    worker thread sits blocked in a sleep.
+    Every waiting item is counted in the pipeline's WorkTracker, so
+    the crawl never looks finished while retries are pending.
+
+__init__
+    output_queue - queue to put items on when they are due
+    tracker - the WorkTracker to count waiting items in
+
+start - start the scheduler thread
+stop - stop the scheduler thread (items still waiting are dropped)
+schedule - put an item on the output queue after delay seconds
+pending - number of items still waiting
+drain - remove and return every item still waiting
+'''
+class RetryScheduler:
+    def __init__(self, output_queue=None, tracker=None):
+        self.output_queue = output_queue
+        self.tracker = tracker
+        self.heap = []
+        self.counter = 0
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def schedule(self, item, delay):
+        if self.tracker:
+            self.tracker.add()
+        with self.condition:
+            self.counter += 1
+            heapq.heappush(self.heap, (time() + delay, self.counter, item))
+            self.condition.notify_all()
+
+    def pending(self):
+        with self.condition:
+            return len(self.heap)
+
+    def drain(self):
+        with self.condition:
+            items = [item for _, _, item in self.heap]
+            self.heap = []
+        if self.tracker and items:
+            self.tracker.finish(len(items))
+        return items
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                if not self.heap:
+                    self.condition.wait(timeout=1)
+                    continue
+                due, _, item = self.heap[0]
+                wait = due - time()
+                if wait > 0:
+                    self.condition.wait(timeout=wait)
+                    continue
+                heapq.heappop(self.heap)
+            # Put it back before it stops being counted so the
+            # crawl never looks finished in between
+            self.output_queue.put(item)
+            if self.tracker:
+                self.tracker.finish()
@@ -0,0 +1,275 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+from time import sleep, time
+from urllib.parse import urlparse
+
+from .ResponseDBManager import merge_shard_dbs
+
+
+# Stable across processes, unlike hash() (randomized per process)
+def host_partition(url, num_partitions):
+    host = (urlparse(url).hostname or '').lower()
+    digest = hashlib.blake2b(host.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % num_partitions
+
+
+'''
+HostPartition
+    The crawler process side of a sharded crawl. Every host belongs
+    to exactly one process (see host_partition), so each process
+    keeps its own visited set and never fetches another one's urls.
+    Links to hosts of other partitions are forwarded to the owner's
+    inbox, and links forwarded here are fed into the local frontier
+    by a receiver thread.
+
+    The crawl is over when every process is idle and every
+    forwarded link was taken in. Each process publishes its state
+    as the number of links it had taken in when it last saw its
+    pipeline empty (-1 while busy), the coordinator compares the
+    total of those with the number of links sent.
+
+    Only the process that owns the seed url's host is seeding: it
+    alone takes the seeds (url, seed file, sitemaps) and fetches
+    robots.txt, the others start empty and get their urls forwarded.
+    Its robots.txt rules are applied to the links forwarded to it.
+
+__init__
+    index - the partition of this process
+    num_partitions - number of crawler processes
+    inboxes - one multiprocessing queue per partition
+    sent - shared count of forwarded links
+    states - shared array of the partitions' states
+    progress - shared array of the partitions' request counts
+    finished_event - set by the coordinator once the whole crawl is done
+    seeding - True for the process that owns the seed url's host
+
+owns - True if the url's host belongs to this partition
+forward - send a url to the partition that owns it
+finish - (no-op) urls stored or dropped by this process
+start - start the receiver thread, feeding the given OmenEye
+wait_finished - wait for the whole crawl to be done
+stop - stop the receiver thread
+'''
+class HostPartition:
+    def __init__(self,
+            index=None,
+            num_partitions=None,
+            inboxes=None,
+            sent=None,
+            states=None,
+            progress=None,
+            finished_event=None,
+            seeding=False,
+        ):
+        if not isinstance(index, int):
+            raise TypeError(f"index should be of type 'int', but got {type(index).__name__}")
+        if not isinstance(num_partitions, int):
+            raise TypeError(f"num_partitions should be of type 'int', but got {type(num_partitions).__name__}")
+
+        self.index = index
+        self.num_partitions = num_partitions
+        self.inboxes = inboxes
+        self.inbox = inboxes[index]
+        self.sent = sent
+        self.states = states
+        self.progress = progress
+        self.finished_event = finished_event
+        self.seeding = seeding
+
+        self.received = 0
+        self.crawler = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def owns(self, url):
+        return host_partition(url, self.num_partitions) == self.index
+
+    # Urls are claimed before they are forwarded, so each one is
+    # only sent once
+    def forward(self, url, depth, from_form=False):
+        # Counted before it is sent, so it is never in transit uncounted
+        with self.sent.get_lock():
+            self.sent.value += 1
+        self.inboxes[host_partition(url, self.num_partitions)].put((url, depth, from_form))
+
+    # Every url is owned by exactly one process and never handed
+    # out twice, nothing to report
+    def finish(self, urls):
+        pass
+
+    def start(self, crawler):
+        self.crawler = crawler
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def wait_finished(self, timeout=None):
+        return self.finished_event.wait(timeout)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                url, depth, from_form = self.inbox.get(timeout=0.1)
+                # The sender checked the scope without this process's
+                # robots.txt rules (only the seeding one has them)
+                if not self.crawler.scope.in_scope(url):
+                    if self.crawler.scope.in_domain(url):
+                        self.crawler.add_seen(url)
+                else:
+                    # The owner of a host has the final say on its traps
+                    claimed = self.crawler.claim_url(url, depth)
+                    if claimed:
+                        self.crawler.enqueue_url(url, depth, from_form=from_form)
+                    elif claimed is None:
+                        self.crawler.add_seen(url)
+                # Counted once it is queued, so it is never idle with
+                # a link taken in but not queued yet
+                self.received += 1
+            except queue.Empty:
+                pass
+
+            # Idle only counts once the pipeline is empty after taking
+            # in every link received so far
+            if self.crawler.pipeline.is_done():
+                self.states[self.index] = self.received
+            else:
+                self.states[self.index] = -1
+            self.progress[self.index] = self.crawler.budget.get_counts()[0]
+
+
+# Entry point of a crawler process (top level so spawn can pickle it)
+def run_partition(index, num_partitions, inboxes, sent, states, progress, finished_event, url, db_name, kwargs):
+    from .OmenEye import OmenEye
+
+    partition = HostPartition(
+        index=index,
+        num_partitions=num_partitions,
+        inboxes=inboxes,
+        sent=sent,
+        states=states,
+        progress=progress,
+        finished_event=finished_event,
+        seeding=host_partition(url, num_partitions) == index,
+    )
+    oe = OmenEye(url=url, db_name=db_name, partition=partition, **kwargs)
+    oe.run()
+
+
+'''
+ShardedCrawl
+    Runs one crawl as num_processes OmenEye processes, so a crawl
+    over many hosts (eg. --subdomains) is not held to one core by
+    the GIL. Each process owns a hash partition of the hosts and
+    writes its own DB, the DBs are merged into db_name at the end.
+    Every limit (threads, budget, delay) applies per process.
+
+__init__
+    url - url to crawl
+    db_name - output DB
+    num_processes - number of crawler processes
+    crawler_kwargs - dict of any other OmenEye arguments
+
+run - run the crawl and merge the DBs, blocks until done
+'''
+class ShardedCrawl:
+    def __init__(self, url=None, db_name=None, num_processes=2, crawler_kwargs=None):
+        if url is None or not isinstance(url, str):
+            raise TypeError(f"url should be of type 'str', but got {type(url).__name__}")
+        if db_name is None or not isinstance(db_name, str):
+            raise TypeError(f"db_name should be of type 'str', but got {type(db_name).__name__}")
+        if not isinstance(num_processes, int):
+            raise TypeError(f"num_processes should be of type 'int', but got {type(num_processes).__name__}")
+
+        self.url = url
+        self.db_name = db_name
+        self.num_processes = num_processes
+        self.crawler_kwargs = crawler_kwargs if crawler_kwargs else {}
+        self.part_dbs = [f'{db_name}.part{i}' for i in range(num_processes)]
+
+        # Children are spawned, forking this process would copy its
+        # threads' locks in whatever state they are in
+        self.context = multiprocessing.get_context('spawn')
+        self.inboxes = [self.context.Queue() for _ in range(num_processes)]
+        self.sent = self.context.Value('q', 0)
+        self.states = self.context.Array('q', [-1] * num_processes)
+        self.progress = self.context.Array('q', [0] * num_processes)
+        self.finished_event = self.context.Event()
+
+    def run(self):
+        processes = []
+        for i in range(self.num_processes):
+            process = self.context.Process(
+                target=run_partition,
+                args=(
+                    i,
+                    self.num_processes,
+                    self.inboxes,
+                    self.sent,
+                    self.states,
+                    self.progress,
+                    self.finished_event,
+                    self.url,
+                    self.part_dbs[i],
+                    self.crawler_kwargs,
+                ),
+            )
+            process.start()
+            processes.append(process)
+
+        # The crawler processes get every Ctrl-C too, the first one
+        # drains them and a second one stops them, either way they
+        # are waited for so the DBs can be merged
+        while True:
+            try:
+                self.wait_for_crawl(processes)
+                for process in processes:
+                    process.join()
+                break
+            except KeyboardInterrupt:
+                print('[*] Caught KeyboardInterrupt. Waiting for the crawler processes...')
+
+        self.merge()
+
+    def wait_for_crawl(self, processes):
+        stable = 0
+        last_report = time()
+        while not self.finished_event.is_set():
+            # A process that crashed (or was stopped with a second
+            # Ctrl-C) would never report idle again
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f'[!] Crawler process {i} stopped (exit code {process.exitcode}), stopping the crawl')
+                    self.finished_event.set()
+                    return
+
+            states = self.states[:]
+            if min(states) >= 0 and sum(states) == self.sent.value:
+                stable += 1
+            else:
+                stable = 0
+            # Twice in a row, so a state read just before a process
+            # picked up new work is not trusted
+            if stable >= 2:
+                self.finished_event.set()
+                return
+
+            if time() - last_report >= 5:
+                last_report = time()
+                busy = sum(1 for state in states if state < 0)
+                print(f'[*] {sum(self.progress[:])} requests, {self.sent.value} links forwarded, {busy}/{self.num_processes} crawler processes busy')
+            sleep(0.25)
+
+    def merge(self):
+        part_dbs = [db for db in self.part_dbs if os.path.exists(db)]
+        merge_shard_dbs(self.db_name, part_dbs)
+
+        for db in self.part_dbs:
+            for path in (db, db + '.checkpoint'):
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,181 @@
+import hashlib
+import re
+import threading
+import uuid
+from urllib.parse import urlparse, unquote, urljoin
+
+from .NearDuplicateIndex import page_simhash, MAX_CHARS
+from .RequestUtils import get_text
+
+
+DIGITS = re.compile(rb'\d+')
+# Only the start of a page is compared
+MAX_BYTES = 1024*64 # 64 KB
+
+
+# Digest of a page with what usually changes between two "not
+# found" pages taken out, the path asked for is often echoed back
+# and counters, timestamps and request ids differ every time
+def page_digest(content, url):
+    body = bytes(content[:MAX_BYTES])
+    path = urlparse(url).path
+    for token in (path, unquote(path), path.rsplit('/', 1)[-1]):
+        if token and token != '/':
+            body = body.replace(token.encode(errors='replace'), b'')
+    body = DIGITS.sub(b'', body)
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+# SimHash of the decoded start of a page, the probe and the pages
+# are cut the same way
+def page_text_simhash(response, content):
+    return page_simhash(get_text(response, content[:MAX_CHARS]))
+
+
+# Where a redirect goes, without its query (a catch-all often hands
+# the path it was asked for along, eg. /login?next=/missing)
+def redirect_target(response, url):
+    parsed_url = urlparse(urljoin(url, response.headers['Location']))
+    return f'{parsed_url.scheme}://{parsed_url.netloc}{parsed_url.path}'
+
+
+def is_redirect(response):
+    return 300 <= response.status_code < 400 and 'Location' in response.headers
+
+
+'''
+Soft404Detector
+    Spots pages that are really a "not found" page served with a
+    200 (catch-all routing). The first time a directory (or host) is
+    seen, a random path that can not exist in it is fetched once and
+    its fingerprint cached. A 2xx page that matches the fingerprint
+    of its directory's probe (SimHash within max_distance bits, or
+    the same digest for pages too short to SimHash) is a soft-404.
+    A probe that gets redirected means the catch-all is a redirect
+    (eg. to the home page), a 3xx page that goes to the same place
+    is a soft-404.
+    A probe that gets a real error status (4xx/5xx) means the
+    directory has no catch-all, nothing in it is a soft-404. A probe
+    that failed (or was not sent, the budget is spent) is not
+    cached, the next page of the directory probes again.
+    The index of a directory (a url ending in /) is never called a
+    soft-404, on a single page app it is the same shell the probe
+    gets, and it is where the crawl starts.
+
+__init__
+    fetch_func - func(url) -> (response, content), sends a probe
+    per - probe once per 'directory' or once per 'host'
+    max_distance - max number of differing SimHash bits for a page to match a probe
+
+is_soft_404 - True if a fetched page is a soft-404 (probes its directory the first time)
+get_counts - get the number of probes sent and of soft-404s found
+'''
+class Soft404Detector:
+    def __init__(self, fetch_func=None, per='directory', max_distance=3):
+        if not callable(fetch_func):
+            raise TypeError(f"fetch_func should be of type 'callable', but got {type(fetch_func).__name__}")
+        if per not in ('directory', 'host'):
+            raise ValueError(f"per should be 'directory' or 'host', but got {per}")
+
+        self.fetch_func = fetch_func
+        self.per = per
+        self.max_distance = max_distance
+
+        # probe key -> (simhash, digest, redirect target) of its
+        # probe, or None if it got a real error. Events make other
+        # threads wait on a probe that is already being sent instead
+        # of sending their own.
+        self.fingerprints = {}
+        self.pending = {}
+        self.probes = 0
+        self.soft_404s = 0
+        self.lock = threading.Lock()
+
+    def get_probe_key(self, url):
+        parsed_url = urlparse(url)
+        if self.per == 'host':
+            directory = '/'
+        else:
+            directory = parsed_url.path.rsplit('/', 1)[0] + '/'
+        return f'{parsed_url.scheme}://{parsed_url.netloc}{directory}'
+
+    def get_fingerprint(self, key):
+        with self.lock:
+            if key in self.fingerprints:
+                return self.fingerprints[key]
+            event = self.pending.get(key)
+            if event is None:
+                event = self.pending[key] = threading.Event()
+                is_prober = True
+            else:
+                is_prober = False
+
+        if not is_prober:
+            event.wait()
+            with self.lock:
+                return self.fingerprints.get(key)
+
+        fingerprint = None
+        # Only an answer that says what the catch-all is (or that
+        # there is none) is kept
+        cached = False
+        response = None
+        try:
+            token = 'omeneye-' + uuid.uuid4().hex
+            probe_url = key + token
+            response, content = self.fetch_func(probe_url)
+            if response is not None and 200 <= response.status_code < 300 and content is not None:
+                fingerprint = (page_text_simhash(response, content), page_digest(content, probe_url), None)
+                cached = True
+            # A redirect that keeps the path (eg. to https or to add a
+            # trailing /) is no catch-all, same as a real error status
+            elif response is not None and is_redirect(response):
+                target = redirect_target(response, probe_url)
+                if token not in target:
+                    fingerprint = (None, None, target)
+                cached = True
+            elif response is not None and response.status_code >= 400:
+                cached = True
+        finally:
+            with self.lock:
+                # A failed probe (or one the budget had no room for)
+                # says nothing, the next page of the directory probes again
+                if response is not None:
+                    self.probes += 1
+                if cached:
+                    self.fingerprints[key] = fingerprint
+                del self.pending[key]
+            event.set()
+        return fingerprint
+
+    def is_soft_404(self, response, content):
+        redirected = is_redirect(response)
+        if not redirected and (not 200 <= response.status_code < 300 or content is None):
+            return False
+        url = str(response.url)
+        path = urlparse(url).path
+        if not path or path.endswith('/'):
+            return False
+
+        fingerprint = self.get_fingerprint(self.get_probe_key(url))
+        if fingerprint is None:
+            return False
+
+        probe_simhash, probe_digest, probe_target = fingerprint
+        if redirected or probe_target is not None:
+            is_soft_404 = redirected and redirect_target(response, url) == probe_target
+        else:
+            simhash = page_text_simhash(response, content) if probe_simhash is not None else None
+            if simhash is not None:
+                is_soft_404 = bin(simhash ^ probe_simhash).count('1') <= self.max_distance
+            else:
+                is_soft_404 = page_digest(content, url) == probe_digest
+
+        if is_soft_404:
+            with self.lock:
+                self.soft_404s += 1
+        return is_soft_404
+
+    def get_counts(self):
+        with self.lock:
+            return self.probes, self.soft_404s
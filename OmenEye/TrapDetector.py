@@ -0,0 +1,84 @@
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+from .RequestUtils import url_template
+
+
+'''
+TrapDetector
+    Keeps crawler traps (calendars, faceted search, ?page=N
+    pagination, relative links that nest forever) from spending
+    the whole crawl on one kind of page. Every url is reduced to its
+    template (see url_template: ids in the path become slots, param
+    values are dropped so every param is a slot), and each template
+    only gets template_budget urls queued. Urls whose path has a run
+    of 1 to max_cycle_length segments repeated back to back more
+    than max_segment_repeats times (eg. /a/a/a or /a/b/a/b/a/b) are
+    turned down too, a path that only uses a name more than once
+    (eg. /docs/api/docs) is not. Urls turned down are counted per
+    template, so the worst traps can be shown.
+    Checked at discovery, before a url is claimed.
+
+__init__
+    template_budget - max number of urls queued per template (None = no limit)
+    max_segment_repeats - max number of times a run of path segments can repeat in a row (None = no limit)
+    max_cycle_length - longest run of segments looked for
+
+admit - count a discovered url against its template, False if it is a trap
+get_repeats - get the most times a run of path segments repeats in a row
+get_counts - get the number of urls turned down and the templates that turned down the most
+'''
+class TrapDetector:
+    def __init__(self, template_budget=None, max_segment_repeats=None, max_cycle_length=3):
+        if template_budget is not None and not isinstance(template_budget, int):
+            raise TypeError(f"template_budget should be of type 'int', but got {type(template_budget).__name__}")
+        if max_segment_repeats is not None and not isinstance(max_segment_repeats, int):
+            raise TypeError(f"max_segment_repeats should be of type 'int', but got {type(max_segment_repeats).__name__}")
+        if not isinstance(max_cycle_length, int):
+            raise TypeError(f"max_cycle_length should be of type 'int', but got {type(max_cycle_length).__name__}")
+
+        self.template_budget = template_budget
+        self.max_segment_repeats = max_segment_repeats
+        self.max_cycle_length = max_cycle_length
+
+        self.templates = Counter()
+        self.skipped = Counter()
+        self.lock = threading.Lock()
+
+    # Most times a run of up to max_cycle_length segments is repeated
+    # back to back. A run of length k repeats r times where segments
+    # keep matching the ones k before them for k*(r-1) segments.
+    def get_repeats(self, segments):
+        most = 1
+        for length in range(1, self.max_cycle_length + 1):
+            matched = 0
+            for i in range(length, len(segments)):
+                if segments[i] == segments[i - length]:
+                    matched += 1
+                    most = max(most, 1 + matched // length)
+                else:
+                    matched = 0
+        return most
+
+    def admit(self, url):
+        if self.max_segment_repeats is not None:
+            segments = [segment for segment in urlparse(url).path.split('/') if segment]
+            if self.get_repeats(segments) > self.max_segment_repeats:
+                with self.lock:
+                    self.skipped['repeating path segments'] += 1
+                return False
+
+        if self.template_budget is None:
+            return True
+        template = url_template(url)
+        with self.lock:
+            if self.templates[template] >= self.template_budget:
+                self.skipped[template] += 1
+                return False
+            self.templates[template] += 1
+            return True
+
+    def get_counts(self, num_templates=3):
+        with self.lock:
+            return sum(self.skipped.values()), self.skipped.most_common(num_templates)
@@ -0,0 +1,105 @@
+import threading
+import queue
+
+from .BoundedQueue import BoundedQueue
+
+
+'''
+WorkTracker
+    Counts the work items in flight across every stage of the
+    pipeline and sets an event the moment the count drops to zero,
+    so the crawl can be stopped as soon as the last item drains
+    instead of being found finished by polling queue sizes.
+
+    A stage must add its outputs before it finishes its input
+    (WorkerManager puts results before calling task_done), so the
+    count can never touch zero while a parser is still queueing
+    new urls.
+
+add - count new work items
+finish - count work items as done
+wait - block until there is no work left (or timeout), returns True if done
+get_count - number of work items in flight
+'''
+class WorkTracker:
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+        self.done_event = threading.Event()
+        self.done_event.set()
+
+    def add(self, n=1):
+        with self.lock:
+            self.count += n
+            self.done_event.clear()
+
+    def finish(self, n=1):
+        with self.lock:
+            self.count -= n
+            if self.count <= 0:
+                self.count = 0
+                self.done_event.set()
+
+    def wait(self, timeout=None):
+        return self.done_event.wait(timeout)
+
+    def is_done(self):
+        return self.done_event.is_set()
+
+    def get_count(self):
+        with self.lock:
+            return self.count
+
+
+'''
+TrackedQueue
+    BoundedQueue that counts every put/task_done in a WorkTracker,
+    so several queues can share one in-flight counter.
+
+__init__
+    tracker - the WorkTracker to count in
+    maxsize - max number of items (0 = no limit)
+    max_bytes - max total size of the items in bytes (None = no limit)
+    size_func - func(item) -> size of the item in bytes
+'''
+class TrackedQueue(BoundedQueue):
+    def __init__(self, tracker=None, maxsize=0, max_bytes=None, size_func=None):
+        if tracker is None or not isinstance(tracker, WorkTracker):
+            raise TypeError(f"tracker should be of type 'WorkTracker', but got {type(tracker).__name__}")
+        super().__init__(maxsize=maxsize, max_bytes=max_bytes, size_func=size_func)
+        self.tracker = tracker
+
+    def put(self, item, block=True, timeout=None, force=False):
+        # Counted before it is visible to a consumer, so it can
+        # never be finished before it was added
+        self.tracker.add()
+        try:
+            super().put(item, block=block, timeout=timeout, force=force)
+        except queue.Full:
+            self.tracker.finish()
+            raise
+
+    def task_done(self):
+        super().task_done()
+        self.tracker.finish()
+
+    def task_done_many(self, n):
+        super().task_done_many(n)
+        self.tracker.finish(n)
+
+
+# Put on a stage's input queue to wake up a worker blocked in get()
+# when its threads are being stopped
+STOP_SIGNAL = object()
+
+def wake_workers(input_queue, num_threads):
+    for _ in range(num_threads):
+        # A full bounded queue has to take them anyway, or the
+        # idle workers would only notice the stop on their timeout
+        if isinstance(input_queue, BoundedQueue):
+            input_queue.put(STOP_SIGNAL, force=True)
+            continue
+        try:
+            input_queue.put_nowait(STOP_SIGNAL)
+        except queue.Full:
+            pass
@@ -2,6 +2,9 @@ import threading
 import queue
 from time import time, sleep
 
+from .WorkTracker import STOP_SIGNAL, wake_workers
+from .BoundedQueue import get_batch, finish_batch
+
 
 '''
 # Nice way to "checkout" a resource with a block
@@ -35,16 +38,25 @@ class CheckoutManager:
 '''
 WorkerMangager
 __init__
-    worker_func - funtion to run as workers
+    worker_func - funtion to run as workers, or a list of functions to fuse
+                  adjacent stages into one worker (each gets the previous one's
+                  result, a stage returning nothing ends the chain, only the
+                  last one may return multiple results)
     num_threads - number of workers/threads to make
     input_queue - the queue workers get input from
     output_queue - the queue worker put their results
+    multi_output - worker_func returns a list of results to put one by one
+    batch_size - if set, workers take up to batch_size items at once and worker_func
+                 gets the list of items and returns a list of results to put
 
 start_threads - start the threads
 stop_threads - kill threads, use in emergencies
 join_threads - join the threads when input queue is empty
+scale_to - grow or shrink the number of running workers
 worker - (do not use) the worker wrapper used to run the worker func and handle input/output 
-get_rates - get intake and output rates of workers
+batch_worker - (do not use) the worker wrapper used in batch mode
+get_rates - get intake and output rates of workers (or of one fused stage)
+get_processed - get the number of input items processed so far
 '''
 class WorkerManager:
     def __init__(self,
@@ -52,26 +64,46 @@ class WorkerManager:
             num_threads=None,
             input_queue=None,
             output_queue=None,
+            multi_output=False,
+            batch_size=None,
         ):
         
-        if worker_func is None or not callable(worker_func):
-            raise TypeError(f"worker_func should be of type 'callable', but got {type(worker_func).__name__}")
+        if isinstance(worker_func, (list, tuple)):
+            stage_funcs = list(worker_func)
+        else:
+            stage_funcs = [worker_func]
+        if not stage_funcs:
+            raise TypeError(f"worker_func should be of type 'callable', but got an empty list")
+        for func in stage_funcs:
+            if func is None or not callable(func):
+                raise TypeError(f"worker_func should be of type 'callable', but got {type(func).__name__}")
         if num_threads is None or not isinstance(num_threads, int):
             raise TypeError(f"num_threads should be of type 'int', but got {type(num_threads).__name__}")
         if input_queue is None or not isinstance(input_queue, queue.Queue):
             raise TypeError(f"input_queue should be of type 'queue.Queue', but got {type(input_queue).__name__}")
         if output_queue is None or not isinstance(output_queue, queue.Queue):
             raise TypeError(f"output_queue should be of type 'queue.Queue', but got {type(output_queue).__name__}")
+        if batch_size is not None and not isinstance(batch_size, int):
+            raise TypeError(f"batch_size should be of type 'int', but got {type(batch_size).__name__}")
+        if batch_size and len(stage_funcs) > 1:
+            raise TypeError(f"worker_func should be a single batch function in batch mode, but got {len(stage_funcs)} functions")
 
         self.worker_func = worker_func
+        self.stage_funcs = stage_funcs
         self.num_threads = num_threads
         self.input_queue = input_queue
         self.output_queue = output_queue
+        self.multi_output = multi_output
+        self.batch_size = batch_size
 
         self.threads = []
         self.stop_threads_event = threading.Event()
         #self.mutex = threading.Lock()
 
+        # Workers still to be retired by scale_to
+        self.retire_count = 0
+        self.processed = 0
+
         self.last_output_time = 0
         self.last_input_time = 0
         self.input_ema = 0.0
@@ -80,15 +112,56 @@ class WorkerManager:
         #A higher alpha (e.g., 0.3) means the rate will adjust more quickly to recent changes.
         self.alpha = 0.01  # EMA smoothing factor
 
+        # Intake/output EMAs of each fused stage, so they can still
+        # be reported like separate stages
+        self.stage_rates = []
+        for _ in self.stage_funcs:
+            self.stage_rates.append({
+                'input_ema': 0.0,
+                'output_ema': 0.0,
+                'last_input_time': 0,
+                'last_output_time': 0,
+            })
+
         self.lock = threading.Lock()
 
     def start_threads(self):
-        worker_id = 0
         for _ in range(self.num_threads):
-            thread = threading.Thread(target=self.worker, args=(worker_id,))
-            thread.start()
-            self.threads.append(thread)
-            worker_id += 1
+            self.start_thread()
+
+    def start_thread(self):
+        worker_id = len(self.threads)
+        target = self.batch_worker if self.batch_size else self.worker
+        thread = threading.Thread(target=target, args=(worker_id,))
+        thread.start()
+        self.threads.append(thread)
+
+    # Workers are retired between items, never in the middle of one
+    def scale_to(self, num_threads):
+        with self.lock:
+            current = self.num_threads
+            self.num_threads = num_threads
+            if num_threads < current:
+                self.retire_count += current - num_threads
+                retire_count = self.retire_count
+            else:
+                # Cancel pending retirements before starting new threads
+                cancelled = min(self.retire_count, num_threads - current)
+                self.retire_count -= cancelled
+                to_start = num_threads - current - cancelled
+        if num_threads < current:
+            # Wake idle workers so they retire right away
+            wake_workers(self.input_queue, retire_count)
+        else:
+            for _ in range(to_start):
+                self.start_thread()
+
+    def should_retire(self):
+        with self.lock:
+            if self.retire_count > 0:
+                self.retire_count -= 1
+                return True
+        return False
 
     # Useful for situations where you want to keep threads up
     # while the input queue is empty
@@ -96,6 +169,7 @@ class WorkerManager:
     #  you want to stop them)
     def stop_threads(self):
         self.stop_threads_event.set()
+        wake_workers(self.input_queue, len(self.threads))
 
         for thread in self.threads:
             thread.join()
@@ -104,42 +178,120 @@ class WorkerManager:
     # done on the input queue
     # Otherwise, wait for more input on the input queue
     def join_threads(self):
-        size = 0
-
-        while self.input_queue.unfinished_tasks > 0:
-            sleep(1)
-            #size = self.input_queue.qsize()
-            #print('[*] WorkerManager: Items left in Input Queue -', size)
-            #print('[*] WorkerManager: Items left in Output Queue -', self.output_queue.qsize())
+        # Wakes up the moment the last task is done, no polling
+        self.input_queue.join()
+        #print('[*] WorkerManager: Items left in Output Queue -', self.output_queue.qsize())
         
         self.stop_threads()
 
     def worker(self, worker_id):
         while not self.stop_threads_event.is_set():
+            if self.should_retire():
+                break
             try:
                 item = self.input_queue.get(timeout=1)
+                if item is STOP_SIGNAL:
+                    self.input_queue.task_done()
+                    continue
 
+                results, produced = [], 0
                 if not self.stop_threads_event.is_set():
-                    result = self.worker_func(item)
+                    result, produced = self.run_stages(item)
                     if result:
-                        with self.lock:
-                            current_time = time()
-                            time_diff = current_time - self.last_output_time
-                            self.output_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.output_ema
-                            self.last_output_time = current_time
-                        self.output_queue.put(result)
+                        results = result if self.multi_output else [result]
+                        for result in results:
+                            with self.lock:
+                                current_time = time()
+                                time_diff = current_time - self.last_output_time
+                                self.output_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.output_ema
+                                self.last_output_time = current_time
+                            self.output_queue.put(result)
 
                 with self.lock:
                     current_time = time()
                     time_diff = current_time - self.last_input_time
                     self.input_ema = self.alpha * (1 / time_diff) + (1 - self.alpha) * self.input_ema
                     self.last_input_time = current_time
+                    self.processed += 1
+                    if len(self.stage_funcs) > 1:
+                        self.update_stage_rates(current_time, produced, results)
                 self.input_queue.task_done()
             except queue.Empty:
                 pass
 
-    def get_rates(self):
+    # Same as worker, but one worker_func call, one rate update and
+    # one task_done round trip per batch instead of per item
+    def batch_worker(self, worker_id):
+        while not self.stop_threads_event.is_set():
+            if self.should_retire():
+                break
+            try:
+                batch = get_batch(self.input_queue, self.batch_size, timeout=1, stop_item=STOP_SIGNAL)
+            except queue.Empty:
+                continue
+
+            items = [item for item in batch if item is not STOP_SIGNAL]
+            results = []
+            if items and not self.stop_threads_event.is_set():
+                results = [result for result in (self.worker_func(items) or []) if result]
+                for result in results:
+                    self.output_queue.put(result)
+
+            with self.lock:
+                current_time = time()
+                if items:
+                    time_diff = current_time - self.last_input_time
+                    if time_diff > 0:
+                        self.input_ema = self.alpha * (len(items) / time_diff) + (1 - self.alpha) * self.input_ema
+                    self.last_input_time = current_time
+                    self.processed += len(items)
+                if results:
+                    time_diff = current_time - self.last_output_time
+                    if time_diff > 0:
+                        self.output_ema = self.alpha * (len(results) / time_diff) + (1 - self.alpha) * self.output_ema
+                    self.last_output_time = current_time
+            finish_batch(self.input_queue, len(batch))
+
+    # Runs the item through every fused stage, returns the last
+    # stage's result (or None) and how many stages gave a result
+    def run_stages(self, item):
+        result = item
+        produced = 0
+        for func in self.stage_funcs:
+            result = func(result)
+            if not result:
+                return None, produced
+            produced += 1
+        return result, produced
+
+    # Called with self.lock held, once per input item
+    def update_stage_rates(self, current_time, produced, results):
+        for i, rates in enumerate(self.stage_rates):
+            if i > produced:
+                break
+            # Stage i took an input if every stage before it gave a result
+            time_diff = current_time - rates['last_input_time']
+            if time_diff > 0:
+                rates['input_ema'] = self.alpha * (1 / time_diff) + (1 - self.alpha) * rates['input_ema']
+            rates['last_input_time'] = current_time
+
+            if i < produced:
+                num_outputs = len(results) if i == len(self.stage_rates) - 1 else 1
+                time_diff = current_time - rates['last_output_time']
+                if time_diff > 0:
+                    rates['output_ema'] = self.alpha * (num_outputs / time_diff) + (1 - self.alpha) * rates['output_ema']
+                rates['last_output_time'] = current_time
+
+    def get_rates(self, stage=None):
+        with self.lock:
+            if stage is not None and len(self.stage_funcs) > 1:
+                input_rate = self.stage_rates[stage]['input_ema']
+                output_rate = self.stage_rates[stage]['output_ema']
+            else:
+                input_rate = self.input_ema
+                output_rate = self.output_ema
+        return input_rate, output_rate
+
+    def get_processed(self):
         with self.lock:
-            input_rate = self.input_ema
-            output_rate = self.output_ema
-        return input_rate, output_rate
\ No newline at end of file
+            return self.processed
\ No newline at end of file
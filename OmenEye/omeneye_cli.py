@@ -1,6 +1,12 @@
 import argparse
 import os
 from OmenEye import OmenEye
+from OmenEye.Frontier import DEFAULT_WEIGHTS
+from OmenEye.Canonicalizer import CANONICAL_RULES, DEFAULT_RULES
+from OmenEye.Checkpoint import CrawlCheckpoint
+from OmenEye.ShardedCrawl import ShardedCrawl
+from OmenEye.FrontierService import FrontierService, RemoteFrontier
+from OmenEye.ResponseDBManager import merge_shard_dbs
 
 
 def cli():
@@ -13,14 +19,28 @@ def cli():
     parser.add_argument(
         '--url',
         type=str,
-        required=True,  # The argument is required
-        help='Required URL to crawl'
+        required=False,  # Required, unless resuming
+        help='Required URL to crawl (unless resuming)'
     )
     parser.add_argument(
         '--output',
         type=str,
-        required=True,  # The argument is required
-        help='Required output DB name (Do not use an existing DB)'
+        required=False,  # Required, unless resuming
+        help='Required output DB name (Do not use an existing DB) (unless resuming)'
+    )
+    parser.add_argument(
+        '--resume',
+        type=str,
+        required=False,
+        help='Resume the interrupted crawl that was writing to DB from its checkpoint, without fetching stored URLs again (replaces --output, --url is optional)',
+        metavar='DB'
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        type=float,
+        default=300,  # Default value if the argument is not provided
+        help='Save a checkpoint of the crawl every SEC seconds, 0 only saves one when the crawl is cut short (Default 300)',
+        metavar='SEC'
     )
     parser.add_argument(
         '--seed-file',
@@ -44,6 +64,27 @@ def cli():
         default=2,  # Default value if the argument is not provided
         help='Optional depth, defaults to 2 when not explicitly set'
     )
+    parser.add_argument(
+        '--max-requests',
+        type=int,
+        default=None,  # Default value if the argument is not provided
+        help='Stop sending new requests after NUM requests, in-flight work drains and the rest of the queue is stored as unvisited (Default no limit)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--max-time',
+        type=float,
+        default=None,  # Default value if the argument is not provided
+        help='Stop sending new requests after SEC seconds, same as --max-requests (Default no limit)',
+        metavar='SEC'
+    )
+    parser.add_argument(
+        '--max-bytes',
+        type=float,
+        default=None,  # Default value if the argument is not provided
+        help='Stop sending new requests after MB megabytes of response bodies, same as --max-requests (Default no limit)',
+        metavar='MB'
+    )
     parser.add_argument(
         '--delay',
         type=float,
@@ -108,6 +149,141 @@ def cli():
         help='HTTP/S proxy to tunnel requests through',
         metavar='HOST:PORT'
     )
+    parser.add_argument(
+        '--max-size',
+        type=float,
+        default=250,  # Default value if the argument is not provided
+        help='Max response body size in MB, bigger responses are dropped (Default 250)',
+        metavar='MB'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=64,  # Default value if the argument is not provided
+        help='Size in KB of the chunks response bodies are streamed in (Default 64)',
+        metavar='KB'
+    )
+    parser.add_argument(
+        '--spill-size',
+        type=float,
+        default=8,  # Default value if the argument is not provided
+        help='Response bodies bigger than this many MB are kept in a temp file instead of memory (Default 8)',
+        metavar='MB'
+    )
+    parser.add_argument(
+        '--fetch-policy',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to skip media/font bodies and truncate binary/archive bodies based on Content-Type. Defaults to False.'
+    )
+    parser.add_argument(
+        '--fetch-policy-file',
+        type=str,
+        required=False, 
+        help='A file of "<content-type prefix> <full|skip|truncate[:KB]>" rules to use as the fetch policy',
+        metavar='FILE'
+    )
+    parser.add_argument(
+        '--truncate-size',
+        type=float,
+        default=64,  # Default value if the argument is not provided
+        help='KB of a body to keep when the fetch policy truncates it (Default 64)',
+        metavar='KB'
+    )
+    parser.add_argument(
+        '--retry-policy',
+        choices=['immediate', 'backoff'],  # The allowed values for the argument
+        default='immediate',
+        help='Retry failed requests on the spot, or later with exponential backoff/jitter that honors Retry-After on 429/503 (Default immediate)'
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=3,  # Default value if the argument is not provided
+        help='Max number of tries per request with the immediate policy, max number of retries with backoff (Default 3)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--retry-budget',
+        type=int,
+        default=50,  # Default value if the argument is not provided
+        help='Max number of backoff retries per host over the whole crawl (Default 50)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--follow-redirects',
+        type=int,
+        default=0,  # Default value if the argument is not provided
+        help='Max number of in-scope redirect hops a Request Worker follows itself, each hop is still stored (Default 0, send redirects back through the queues)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--priority-frontier',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to fetch the highest value URLs first (shallow, new path templates and param names, dynamic pages, links from forms) instead of in discovery order. Defaults to False.'
+    )
+    parser.add_argument(
+        '--frontier-weights',
+        type=str,
+        default=None,  # Default value if the argument is not provided
+        help='Comma separated weights for the priority frontier scores, any of depth, template, params, type, form and duplicate (eg. "depth=2,form=3")',
+        metavar='WEIGHTS'
+    )
+    parser.add_argument(
+        '--canonical',
+        type=str,
+        default=','.join(DEFAULT_RULES),  # Default value if the argument is not provided
+        help=f'Comma separated rules to reduce every discovered URL to one canonical form with, so its variants are only fetched once. Any of {", ".join(CANONICAL_RULES)}, or "none" (Default {",".join(DEFAULT_RULES)})',
+        metavar='RULES'
+    )
+    parser.add_argument(
+        '--ignored-params',
+        type=str,
+        default=None,  # Default value if the argument is not provided
+        help='Comma separated query param names the "tracking" canonical rule drops, instead of the built in list of tracking params (utm_source, gclid, fbclid, ...)',
+        metavar='NAMES'
+    )
+    parser.add_argument(
+        '--template-budget',
+        type=int,
+        default=None,  # Default value if the argument is not provided
+        help='Max number of URLs queued per URL template (ids in the path and param values ignored), so calendars, faceted search and pagination can not take the whole crawl. The rest are seen, not fetched (Default no limit)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--max-segment-repeats',
+        type=int,
+        default=None,  # Default value if the argument is not provided
+        help='Skip URLs whose path repeats a segment, or a run of up to 3 segments, more than NUM times in a row, eg. /a/b/a/b/a/b from relative links that nest forever (Default no limit)',
+        metavar='NUM'
+    )
+    parser.add_argument(
+        '--near-dup',
+        choices=['off', 'deprioritize', 'prune'],  # The allowed values for the argument
+        default='off',
+        help='Fingerprint every page (SimHash) and flag the ones that are near-duplicates of a page already crawled. Their links are fetched last (deprioritize, uses the priority frontier) or not followed at all (prune) (Default off)'
+    )
+    parser.add_argument(
+        '--soft-404',
+        choices=['off', 'directory', 'host'],  # The allowed values for the argument
+        default='off',
+        help='Probe a random path once per directory (or host) and flag the pages that match its catch-all "not found" page, they are stored but not parsed or followed (Default off)'
+    )
+    parser.add_argument(
+        '--html-parser',
+        choices=['html.parser', 'lxml', 'selectolax'],  # The allowed values for the argument
+        default='html.parser',
+        help='Backend to parse HTML pages with. lxml and selectolax are faster C parsers that must be installed, one that is missing falls back to the next (selectolax, lxml, html.parser). They differ from html.parser on duplicate attributes and malformed markup (Default html.parser)'
+    )
+    parser.add_argument(
+        '--spill-fingerprints',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to keep the table of known URL fingerprints in a memory mapped temp file the OS can page out, for crawls of tens of millions of URLs. Defaults to False.'
+    )
+    parser.add_argument(
+        '--keep-alive',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to reuse keep-alive connections from per-host pools sized from --workers. Defaults to False.'
+    )
     
     parser.add_argument(
         '--render',
@@ -131,9 +307,49 @@ def cli():
         '--builders',
         type=int,
         default=1,  # Default value if the argument is not provided
-        help='Number of Request Builders (Default 1)',
+        help='Number of Request Builders, only used with --no-fusion (Default 1)',
+        metavar="NUM"
+    )
+    parser.add_argument(
+        '--no-fusion',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to run the Request Builders as their own stage with their own queue instead of inside the Request Workers. Defaults to False.'
+    )
+    parser.add_argument(
+        '--processes',
+        type=int,
+        default=1,  # Default value if the argument is not provided
+        help='Number of crawler processes, each one crawls its own share of the hosts (eg. with --subdomains) with all of the thread counts below, and their DBs are merged at the end. Runs silent (Default 1)',
         metavar="NUM"
     )
+    parser.add_argument(
+        '--serve-frontier',
+        type=str,
+        default=None,  # Default value if the argument is not provided
+        help='Run a frontier service for --url on PORT (of 127.0.0.1, or of HOST to listen on) instead of crawling, for nodes started with --frontier to share. Its state is kept in --output, --depth, --subdomains and --js-grabbing are handed to the nodes',
+        metavar='[HOST:]PORT'
+    )
+    parser.add_argument(
+        '--frontier',
+        type=str,
+        default=None,  # Default value if the argument is not provided
+        help='Crawl as one node of the frontier service at HOST:PORT (takes the URL and scope from it) and write this node\'s share to --output',
+        metavar='HOST:PORT'
+    )
+    parser.add_argument(
+        '--frontier-token',
+        type=str,
+        default=os.environ.get('OMENEYE_FRONTIER_TOKEN'),  # Default value if the argument is not provided
+        help='Shared token of the frontier service, for --serve-frontier and --frontier (Default $OMENEYE_FRONTIER_TOKEN, the service makes up one and prints it if neither is set)',
+        metavar='TOKEN'
+    )
+    parser.add_argument(
+        '--merge',
+        nargs='+',
+        default=None,  # Default value if the argument is not provided
+        help='Merge the output DBs of the nodes of a distributed crawl into --output instead of crawling',
+        metavar='DB'
+    )
     parser.add_argument(
         '--workers',
         type=int,
@@ -148,6 +364,20 @@ def cli():
         help='Number of Response Parsers (Default 2)',
         metavar="NUM"
     )
+    parser.add_argument(
+        '--parser-processes',
+        type=int,
+        default=0,  # Default value if the argument is not provided
+        help='Number of processes to parse responses in, bypassing the GIL on HTML heavy targets (Default 0, parse in the Response Parser threads)',
+        metavar="NUM"
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=1,  # Default value if the argument is not provided
+        help='Number of responses a Response Parser or DB Worker takes at once, one process pool submit or DB transaction per batch (Default 1, no batching)',
+        metavar="NUM"
+    )
     parser.add_argument(
         '--db-workers',
         type=int,
@@ -155,19 +385,162 @@ def cli():
         help='Number of DB Workers (Default 3)',
         metavar="NUM"
     )
+    parser.add_argument(
+        '--autoscale',
+        action='store_true',  # The argument will be True if provided, False if not
+        help='Flag to grow and shrink the Builders, Workers, Parsers and DB Workers while crawling, starting from the counts above. Defaults to False.'
+    )
+    parser.add_argument(
+        '--autoscale-max',
+        type=int,
+        default=32,  # Default value if the argument is not provided
+        help='Max number of threads per stage when autoscaling (Default 32)',
+        metavar="NUM"
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=500,  # Default value if the argument is not provided
+        help='Max number of items in each queue after the URL queue, a full queue blocks the stages feeding it (Default 500)',
+        metavar="NUM"
+    )
+    parser.add_argument(
+        '--queue-bytes',
+        type=float,
+        default=256,  # Default value if the argument is not provided
+        help='Max total size of the response bodies held in each queue in MB (Default 256)',
+        metavar="MB"
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['threads', 'async'],  # The allowed values for the argument
+        default='threads',
+        help='Run the Request Workers as a pool of threads or on a single asyncio event loop (Default threads) (async requires aiohttp)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=100,  # Default value if the argument is not provided
+        help='Max number of in-flight requests with the async engine (Default 100)',
+        metavar="NUM"
+    )
     
     args = parser.parse_args()
 
-    if os.path.exists(args.output):
-        print(f"The DB file '{args.output}' already exists.")
+    if args.merge:
+        if not args.output:
+            parser.error('the following arguments are required: --output')
+        if os.path.exists(args.output):
+            print(f"The DB file '{args.output}' already exists.")
+            exit(1)
+        merge_shard_dbs(args.output, args.merge)
+        return
+
+    if args.serve_frontier:
+        if not args.url or not args.output:
+            parser.error('the following arguments are required: --url, --output')
+        host, _, port = args.serve_frontier.rpartition(':')
+        if not port.isdigit():
+            print(f"Invalid --serve-frontier '{args.serve_frontier}'. Must be PORT or HOST:PORT.")
+            exit(1)
+        service = FrontierService(
+            url=args.url,
+            db_path=args.output,
+            host=host if host else '127.0.0.1',
+            port=int(port),
+            token=args.frontier_token,
+            max_depth=args.depth,
+            subdomains=args.subdomains,
+            js_grabbing=args.js_grabbing,
+        )
+        service.serve()
+        return
+
+    # The node's URL and scope come from the frontier service
+    remote_frontier = None
+    if args.frontier:
+        if args.resume or args.processes > 1:
+            print('--frontier can not be used with --resume or --processes.')
+            exit(1)
+        if not args.frontier_token:
+            print('--frontier needs the token of the frontier service (--frontier-token or $OMENEYE_FRONTIER_TOKEN).')
+            exit(1)
+        remote_frontier = RemoteFrontier(address=args.frontier, token=args.frontier_token)
+        try:
+            config = remote_frontier.hello()
+        except (OSError, RuntimeError) as e:
+            print(f"Could not reach the frontier service at '{args.frontier}': {e}")
+            exit(1)
+        args.url = config['url']
+        args.depth = config['max_depth']
+        args.subdomains = config['subdomains']
+        args.js_grabbing = config['js_grabbing']
+
+    if args.resume and args.processes > 1:
+        print('A crawl with --processes can not be resumed.')
+        exit(1)
+    if args.mitm and args.processes > 1:
+        print('--mitm can not be used with --processes, every process would wait for its own authenticated request.')
         exit(1)
 
-    oe = OmenEye(
-        url=args.url,
-        db_name=args.output,
+    if args.resume:
+        args.output = args.resume
+        checkpoint = CrawlCheckpoint(args.resume + '.checkpoint')
+        if not checkpoint.exists():
+            print(f"No checkpoint to resume from. Expected '{checkpoint.path}'")
+            exit(1)
+        if not args.url:
+            args.url = checkpoint.load()['meta']['url']
+    else:
+        if not args.url or not args.output:
+            parser.error('the following arguments are required: --url, --output')
+        if os.path.exists(args.output):
+            print(f"The DB file '{args.output}' already exists.")
+            exit(1)
+
+    # Tries with the immediate policy (at least the first one),
+    # retries on top of the first try with backoff
+    if args.retry_policy == 'backoff' and args.retries < 0:
+        print(f'Invalid --retries {args.retries}. Must be 0 or more with the backoff policy.')
+        exit(1)
+    if args.retry_policy != 'backoff' and args.retries < 1:
+        print(f'Invalid --retries {args.retries}. Must be 1 or more with the immediate policy, every request is tried at least once.')
+        exit(1)
+
+    if args.frontier_weights:
+        frontier_weights = {}
+        try:
+            for pair in args.frontier_weights.split(','):
+                name, value = pair.split('=')
+                if name.strip() not in DEFAULT_WEIGHTS:
+                    raise ValueError(name)
+                frontier_weights[name.strip()] = float(value)
+        except ValueError:
+            print(f"Invalid frontier weights '{args.frontier_weights}'. Must look like \"depth=2,form=3\" with weights from: {', '.join(DEFAULT_WEIGHTS)}.")
+            exit(1)
+    else:
+        frontier_weights = None
+
+    if args.canonical.strip().lower() == 'none':
+        canonical_rules = ()
+    else:
+        canonical_rules = tuple(rule.strip() for rule in args.canonical.split(',') if rule.strip())
+        for rule in canonical_rules:
+            if rule not in CANONICAL_RULES:
+                print(f"Invalid canonical rule '{rule}'. Must be \"none\" or any of: {', '.join(CANONICAL_RULES)}.")
+                exit(1)
+    if args.ignored_params:
+        ignored_params = set(name.strip() for name in args.ignored_params.split(',') if name.strip())
+    else:
+        ignored_params = None
+
+    crawler_kwargs = dict(
         seed_file=args.seed_file,
         mitm_port=args.mitm,
         max_depth=args.depth,
+        max_requests=args.max_requests,
+        max_time=args.max_time,
+        max_bytes=int(args.max_bytes*1024*1024) if args.max_bytes else None,
         delay=args.delay,
         jitter=args.jitter,
         robots=args.robots,
@@ -178,15 +551,59 @@ def cli():
         blacklist_file=args.blacklist,
         canary=args.canary,
         proxy=args.proxy,
+        keep_alive=args.keep_alive,
+        max_size=int(args.max_size*1024*1024),
+        chunk_size=int(args.chunk_size*1024),
+        spill_size=int(args.spill_size*1024*1024),
+        fetch_policy=args.fetch_policy,
+        fetch_policy_file=args.fetch_policy_file,
+        truncate_size=int(args.truncate_size*1024),
+        retry_policy=args.retry_policy,
+        max_retries=args.retries,
+        retry_budget=args.retry_budget,
+        follow_redirects=args.follow_redirects,
         render=args.render,
         headless=(not args.no_headless),
         num_drivers=args.drivers,
         num_request_builders=args.builders,
+        fuse_stages=(not args.no_fusion),
         num_request_workers=args.workers,
         num_response_parsers=args.parsers,
         num_db_workers=args.db_workers,
+        num_parser_processes=args.parser_processes,
+        batch_size=args.batch_size,
+        autoscale=args.autoscale,
+        autoscale_max=args.autoscale_max,
+        priority_frontier=args.priority_frontier,
+        frontier_weights=frontier_weights,
+        queue_size=args.queue_size,
+        queue_bytes=int(args.queue_bytes*1024*1024),
+        engine=args.engine,
+        concurrency=args.concurrency,
+        resume=bool(args.resume),
+        checkpoint_interval=args.checkpoint_interval,
+        canonical_rules=canonical_rules,
+        ignored_params=ignored_params,
+        spill_fingerprints=args.spill_fingerprints,
+        template_budget=args.template_budget,
+        max_segment_repeats=args.max_segment_repeats,
+        near_duplicates=args.near_dup,
+        soft_404=args.soft_404,
+        html_parser=args.html_parser,
     )
 
+    if args.processes > 1:
+        sc = ShardedCrawl(
+            url=args.url,
+            db_name=args.output,
+            num_processes=args.processes,
+            crawler_kwargs=crawler_kwargs,
+        )
+        sc.run()
+        return
+
+    oe = OmenEye(url=args.url, db_name=args.output, partition=remote_frontier, **crawler_kwargs)
+
     if args.silent:
         oe.run()
     else:
@@ -910,7 +910,11 @@ TIP: You can use the sqlite3 cli tool to run queries from the command line
         url TEXT,
         visited INTEGER,
         status_code INTEGER,
-        body BLOB
+        body BLOB,
+        fetch_decision TEXT,
+        simhash INTEGER,
+        near_duplicate TEXT,
+        soft_404 INTEGER
     )
 
     CREATE TABLE headers (
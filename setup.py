@@ -20,6 +20,11 @@ setup(
         'feedparser',
         'selenium>=4.21.0'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'lxml': ['lxml'],
+        'selectolax': ['selectolax'],
+    },
     author='Jacob Moore',
     author_email='moorejacob2017@gmail.com',
     description='',
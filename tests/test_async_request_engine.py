@@ -0,0 +1,124 @@
+import queue
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+pytest.importorskip('aiohttp')
+
+from OmenEye.AsyncRequestEngine import AsyncRequestEngine
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = b'<html><body>ok</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+
+def run_engine(engine, input_queue, timeout=10):
+    engine.start_threads()
+    # join() on the input queue only returns once every item is done
+    joined = threading.Thread(target=input_queue.join, daemon=True)
+    joined.start()
+    joined.join(timeout)
+    engine.stop_threads()
+    return not joined.is_alive()
+
+
+def test_every_item_is_done_when_a_func_raises(server):
+    input_queue = queue.Queue()
+    output_queue = queue.Queue()
+    failed = []
+
+    def result_func(request, depth, response, content):
+        if request.url.endswith('/bad'):
+            raise RuntimeError('boom')
+        return response, content, depth
+
+    engine = AsyncRequestEngine(
+        session=requests.Session(),
+        input_queue=input_queue,
+        output_queue=output_queue,
+        concurrency=4,
+        result_func=result_func,
+        error_func=failed.append,
+    )
+    for path in ('/good', '/bad', '/good2'):
+        input_queue.put((requests.Request('GET', server + path), 0))
+
+    assert run_engine(engine, input_queue)
+    assert failed == [server + '/bad']
+    assert output_queue.qsize() == 2
+
+
+def test_item_is_done_when_build_func_raises():
+    input_queue = queue.Queue()
+    failed = []
+
+    def build_func(item):
+        raise ValueError('bad url')
+
+    engine = AsyncRequestEngine(
+        session=requests.Session(),
+        input_queue=input_queue,
+        output_queue=queue.Queue(),
+        build_func=build_func,
+        error_func=failed.append,
+    )
+    input_queue.put(('http://example.invalid/x', 0))
+
+    assert run_engine(engine, input_queue)
+    assert failed == ['http://example.invalid/x']
+
+
+def test_blocking_result_func_does_not_stall_the_loop(server):
+    input_queue = queue.Queue()
+    output_queue = queue.Queue()
+    # A bounded queue the first result blocks on until the others are through
+    bounded = queue.Queue(maxsize=1)
+    bounded.put('full')
+    seen = []
+
+    def result_func(request, depth, response, content):
+        if request.url.endswith('/slow'):
+            bounded.put('blocks')
+        seen.append(request.url)
+        return response, content, depth
+
+    engine = AsyncRequestEngine(
+        session=requests.Session(),
+        input_queue=input_queue,
+        output_queue=output_queue,
+        concurrency=4,
+        result_func=result_func,
+    )
+    input_queue.put((requests.Request('GET', server + '/slow'), 0))
+    for i in range(3):
+        input_queue.put((requests.Request('GET', server + f'/fast{i}'), 0))
+
+    engine.start_threads()
+    try:
+        for _ in range(3):
+            output_queue.get(timeout=10)
+        assert sorted(seen) == sorted(server + f'/fast{i}' for i in range(3))
+    finally:
+        bounded.get()
+        input_queue.join()
+        engine.stop_threads()
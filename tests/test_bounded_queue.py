@@ -0,0 +1,86 @@
+import queue
+import threading
+
+import pytest
+
+from OmenEye.BoundedQueue import BoundedQueue, get_batch, finish_batch
+
+
+def sized_queue(max_bytes, maxsize=0):
+    return BoundedQueue(maxsize=maxsize, max_bytes=max_bytes, size_func=len)
+
+
+def test_byte_limit_blocks_until_bytes_are_freed():
+    bounded = sized_queue(10)
+    bounded.put(b'123456')
+    with pytest.raises(queue.Full):
+        bounded.put(b'12345', block=False)
+    with pytest.raises(queue.Full):
+        bounded.put(b'12345', timeout=0.05)
+    # A smaller one still fits
+    bounded.put(b'1234', block=False)
+    assert bounded.get_bytes() == 10
+
+    assert bounded.get() == b'123456'
+    assert bounded.get_bytes() == 4
+    bounded.put(b'12345', block=False)
+    assert bounded.get_bytes() == 9
+
+
+def test_blocked_producer_wakes_up_on_get():
+    bounded = sized_queue(10)
+    bounded.put(b'x' * 8)
+    put = threading.Thread(target=bounded.put, args=(b'y' * 8,))
+    put.start()
+    put.join(0.1)
+    assert put.is_alive()
+    bounded.get()
+    put.join(5)
+    assert not put.is_alive()
+    assert bounded.get_bytes() == 8
+
+
+def test_oversized_item_gets_in_when_empty():
+    bounded = sized_queue(10)
+    bounded.put(b'x' * 100, block=False)
+    with pytest.raises(queue.Full):
+        bounded.put(b'x', block=False)
+
+
+def test_item_limit_still_applies():
+    bounded = sized_queue(1000, maxsize=2)
+    bounded.put(b'a')
+    bounded.put(b'b')
+    with pytest.raises(queue.Full):
+        bounded.put(b'c', block=False)
+
+
+def test_force_ignores_the_limits():
+    bounded = sized_queue(10)
+    bounded.put(b'x' * 10)
+    bounded.put(b'y' * 10, force=True)
+    assert bounded.qsize() == 2
+    assert bounded.get_bytes() == 20
+
+
+def test_size_func_is_required_with_a_byte_limit():
+    with pytest.raises(TypeError):
+        BoundedQueue(max_bytes=10)
+    with pytest.raises(TypeError):
+        BoundedQueue(max_bytes=1.5, size_func=len)
+
+
+def test_batches_end_at_the_stop_item():
+    bounded = BoundedQueue()
+    stop = object()
+    for item in ['a', 'b', stop, 'c']:
+        bounded.put(item)
+    assert get_batch(bounded, 10, stop_item=stop) == ['a', 'b', stop]
+    assert get_batch(bounded, 10, stop_item=stop) == ['c']
+    with pytest.raises(queue.Empty):
+        get_batch(bounded, 10, timeout=0.01)
+
+    finish_batch(bounded, 4)
+    assert bounded.unfinished_tasks == 0
+    with pytest.raises(ValueError):
+        bounded.task_done_many(1)
@@ -0,0 +1,45 @@
+import pytest
+
+from OmenEye.Canonicalizer import UrlCanonicalizer
+
+
+def canonical(url, rules):
+    return UrlCanonicalizer(rules=rules).canonicalize(url)
+
+
+def test_default_rules():
+    canonicalizer = UrlCanonicalizer()
+    assert canonicalizer.canonicalize('HTTP://Example.COM:80/Path?b=2&a=1#frag') == 'http://example.com/Path?a=1&b=2'
+    assert canonicalizer.canonicalize('https://example.com:443/a/?utm_source=x&q=1&gclid=z') == 'https://example.com/a/?q=1'
+    # Paths keep their case and trailing slash
+    assert canonicalizer.canonicalize('http://example.com/A/') == 'http://example.com/A/'
+
+
+def test_each_rule_on_its_own():
+    assert canonical('http://example.com/a#top', ('fragment',)) == 'http://example.com/a'
+    assert canonical('http://example.com/a?b=1&a=2&b=0', ('sort',)) == 'http://example.com/a?a=2&b=0&b=1'
+    assert canonical('http://example.com:80/a', ('ports',)) == 'http://example.com/a'
+    assert canonical('https://example.com:443/a', ('ports',)) == 'https://example.com/a'
+    assert canonical('http://example.com:8080/a', ('ports',)) == 'http://example.com:8080/a'
+    assert canonical('HTTP://Example.COM/A', ('case',)) == 'http://example.com/A'
+    assert canonical('http://example.com/a?utm_medium=x&fbclid=y&id=1', ('tracking',)) == 'http://example.com/a?id=1'
+    assert canonical('http://example.com/a/', ('slash',)) == 'http://example.com/a'
+
+
+def test_trailing_slash_is_opt_in():
+    assert UrlCanonicalizer().canonicalize('http://example.com/a/') == 'http://example.com/a/'
+    assert canonical('http://example.com/a/?x=1', ('slash',)) == 'http://example.com/a?x=1'
+
+
+def test_no_rules_leave_the_url_alone():
+    assert canonical('HTTP://Example.com:80/a/?b=1&a=2#x', ()) == 'HTTP://Example.com:80/a/?b=1&a=2#x'
+
+
+def test_custom_ignored_params_replace_the_defaults():
+    canonicalizer = UrlCanonicalizer(ignored_params={'sid'})
+    assert canonicalizer.canonicalize('http://example.com/?sid=1&utm_source=a') == 'http://example.com/?utm_source=a'
+
+
+def test_unknown_rule():
+    with pytest.raises(ValueError):
+        UrlCanonicalizer(rules=('fragment', 'lowercase'))
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from OmenEye import OmenEye
+from OmenEye.Checkpoint import CrawlCheckpoint
+
+
+COUNTERS = {'responses': 7, 'headers': 21}
+
+
+def save(checkpoint, frontier=(), in_flight=(), visited=(), seen=()):
+    checkpoint.save({'url': 'http://example.com/'}, list(frontier), list(in_flight), visited, seen, COUNTERS)
+
+
+def test_round_trip(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'out.db.checkpoint'))
+    assert not checkpoint.exists()
+    # Fingerprints are unsigned 64 bit, SQLite integers are not
+    visited = {1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1}
+    save(checkpoint,
+        frontier=[('http://example.com/a', 1)],
+        in_flight=[('http://example.com/b', 2)],
+        visited=visited,
+        seen={'http://example.com/logout'},
+    )
+
+    state = CrawlCheckpoint(checkpoint.path).load()
+    assert state['meta'] == {'url': 'http://example.com/'}
+    assert state['frontier'] == [('http://example.com/a', 1)]
+    assert state['in_flight'] == [('http://example.com/b', 2)]
+    assert state['visited'] == visited
+    assert state['seen'] == {'http://example.com/logout'}
+    assert state['counters'] == COUNTERS
+
+
+def test_later_saves_append_visited_and_rewrite_the_frontier(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'out.db.checkpoint'))
+    save(checkpoint, frontier=[('http://example.com/a', 1)], visited={1}, seen={'x'})
+    save(checkpoint, frontier=[('http://example.com/c', 2)], visited={2}, seen={'y'})
+
+    state = checkpoint.load()
+    assert state['frontier'] == [('http://example.com/c', 2)]
+    assert state['visited'] == {1, 2}
+    assert state['seen'] == {'x', 'y'}
+
+
+def test_a_fresh_crawl_starts_a_new_file(tmp_path):
+    path = str(tmp_path / 'out.db.checkpoint')
+    save(CrawlCheckpoint(path), visited={1, 2})
+    # A new crawl with the same output never appends to the old state
+    save(CrawlCheckpoint(path), visited={3})
+    assert CrawlCheckpoint(path).load()['visited'] == {3}
+
+    # One that loaded it does
+    checkpoint = CrawlCheckpoint(path)
+    checkpoint.load()
+    save(checkpoint, visited={4})
+    assert checkpoint.load()['visited'] == {3, 4}
+
+
+def test_remove(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / 'out.db.checkpoint'))
+    save(checkpoint)
+    checkpoint.remove()
+    assert not checkpoint.exists()
+    assert not checkpoint.appending
+
+
+class ChainHandler(BaseHTTPRequestHandler):
+    # /p1 .. /p12, each links to the next one and back to the first
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        n = int(self.path.strip('/p') or 1)
+        links = '<a href="/p1">first</a>' + (f'<a href="/p{n + 1}">next</a>' if n < 12 else '')
+        body = f'<html><body>{links}</body></html>'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ChainHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+
+
+def test_resume_fetches_every_page_once(server, tmp_path):
+    db = str(tmp_path / 'out.db')
+    url = server + '/p1'
+    # A spent budget leaves the checkpoint behind, like a killed crawl
+    OmenEye(url=url, db_name=db, max_depth=40, max_requests=4).run()
+    assert CrawlCheckpoint(db + '.checkpoint').exists()
+
+    OmenEye(url=url, db_name=db, max_depth=40, max_requests=4, resume=True).run()
+    OmenEye(url=url, db_name=db, max_depth=40, resume=True).run()
+
+    conn = sqlite3.connect(db)
+    urls = [url for url, in conn.execute('SELECT url FROM responses WHERE visited = 1')]
+    conn.close()
+    assert sorted(urls) == sorted(f'{server}/p{n}' for n in range(1, 13))
+    # Finished, nothing left to resume
+    assert not CrawlCheckpoint(db + '.checkpoint').exists()
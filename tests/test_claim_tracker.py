@@ -0,0 +1,115 @@
+import threading
+
+from OmenEye.ClaimTracker import ClaimTracker, DEEP
+
+
+def test_a_url_moves_through_its_states():
+    claims = ClaimTracker()
+    url = 'http://example.com/a'
+    assert not claims.is_known(url)
+    assert claims.claim(url)
+    assert claims.is_known(url) and not claims.is_fetched(url)
+    assert claims.start(url)
+    assert claims.is_fetched(url)
+    claims.finish(url)
+    assert claims.is_fetched(url)
+    counts, suppressed = claims.get_counts()
+    assert counts == {'queued': 0, 'in_flight': 0, 'visited': 1}
+    assert suppressed == {'queued': 0, 'in_flight': 0, 'visited': 0}
+
+
+def test_duplicates_are_counted_by_the_state_that_turned_them_down():
+    claims = ClaimTracker()
+    claims.claim('http://example.com/q')
+    claims.claim('http://example.com/f')
+    claims.start('http://example.com/f')
+    claims.claim('http://example.com/v')
+    claims.start('http://example.com/v')
+    claims.finish('http://example.com/v')
+
+    assert claims.claim('http://example.com/q') is False
+    assert claims.claim('http://example.com/f') is False
+    assert claims.start('http://example.com/f') is False
+    assert claims.start('http://example.com/v') is False
+    assert claims.get_counts()[1] == {'queued': 1, 'in_flight': 2, 'visited': 1}
+
+
+def test_release_lets_a_url_be_started_again():
+    claims = ClaimTracker()
+    url = 'http://example.com/a'
+    claims.claim(url)
+    assert claims.start(url)
+    claims.release(url)
+    assert not claims.is_fetched(url)
+    assert claims.start(url)
+    assert claims.get_counts()[0] == {'queued': 0, 'in_flight': 1, 'visited': 0}
+
+
+def test_admit_func_only_sees_unknown_urls():
+    claims = ClaimTracker()
+    asked = []
+    def admit(url):
+        asked.append(url)
+        return 'trap' not in url
+    assert claims.claim('http://example.com/trap', admit) is None
+    assert not claims.is_known('http://example.com/trap')
+    assert claims.claim('http://example.com/a', admit)
+    assert claims.claim('http://example.com/a', admit) is False
+    # A url started without a claim is run past it too
+    assert claims.start('http://example.com/trap/b', admit) is None
+    assert asked == ['http://example.com/trap', 'http://example.com/a', 'http://example.com/trap/b']
+
+
+def test_a_queued_url_found_shallower_is_claimed_again():
+    claims = ClaimTracker()
+    url = 'http://example.com/a'
+    assert claims.claim(url, depth=5)
+    assert claims.get_depth(url) == 5
+    assert claims.claim(url, depth=7) is False
+    assert claims.claim(url, depth=2)
+    assert claims.get_depth(url) == 2
+    assert claims.get_counts()[0]['queued'] == 1
+
+    # Starting and finishing keep the depth, but it is too late to
+    # fetch it again
+    claims.start(url)
+    assert claims.get_depth(url) == 2
+    assert claims.claim(url, depth=0) is False
+    claims.finish(url)
+    assert claims.get_depth(url) == 2
+
+
+def test_deep_urls_have_no_depth():
+    claims = ClaimTracker()
+    assert claims.get_depth('http://example.com/unknown') is None
+    claims.claim('http://example.com/deep', depth=DEEP + 10)
+    assert claims.get_depth('http://example.com/deep') is None
+    # Still claimed again when found within range
+    assert claims.claim('http://example.com/deep', depth=DEEP - 1)
+    assert claims.get_depth('http://example.com/deep') == DEEP - 1
+
+
+def test_get_fetched_and_key_func():
+    claims = ClaimTracker(key_func=lambda url: url.split('#')[0])
+    claims.claim('http://example.com/a#top')
+    claims.start('http://example.com/b')
+    claims.start('http://example.com/c')
+    claims.finish('http://example.com/c#x')
+    assert claims.claim('http://example.com/a#bottom') is False
+    assert sorted(claims.get_fetched()) == sorted(claims.fingerprint(url) for url in ('http://example.com/b', 'http://example.com/c'))
+
+
+def test_only_one_thread_wins_a_claim():
+    claims = ClaimTracker()
+    won = []
+    def claim():
+        for n in range(200):
+            if claims.claim(f'http://example.com/{n}'):
+                won.append(n)
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(won) == list(range(200))
+    assert claims.get_counts()[1]['queued'] == 7 * 200
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from OmenEye.CrawlBudget import CrawlBudget
+
+
+def test_max_requests():
+    budget = CrawlBudget(max_requests=3)
+    assert [budget.claim_request() for _ in range(5)] == [True, True, True, False, False]
+    assert budget.is_spent()
+    assert budget.get_reason() == 'max requests'
+    assert budget.get_counts()[0] == 3
+
+
+def test_concurrent_claims_never_go_over():
+    budget = CrawlBudget(max_requests=100)
+    claimed = []
+    def claim():
+        for _ in range(50):
+            if budget.claim_request():
+                claimed.append(1)
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(claimed) == 100
+
+
+def test_max_bytes_is_checked_at_claim_time():
+    budget = CrawlBudget(max_bytes=1000)
+    assert budget.claim_request()
+    budget.add_bytes(600)
+    assert budget.claim_request()
+    # Requests in flight can still go over it
+    budget.add_bytes(600)
+    assert not budget.is_spent()
+    assert not budget.claim_request()
+    assert budget.get_reason() == 'max bytes'
+    assert budget.get_counts()[:2] == (2, 1200)
+
+
+def test_max_time_is_noticed_without_a_claim():
+    budget = CrawlBudget(max_time=10)
+    assert not budget.is_spent()
+    # As if the crawl started 11 seconds ago
+    budget.start_time -= 11
+    assert budget.is_spent()
+    assert budget.get_reason() == 'max time'
+    assert not budget.claim_request()
+
+
+def test_stop_keeps_the_first_reason():
+    budget = CrawlBudget()
+    assert budget.claim_request()
+    budget.stop('interrupted')
+    budget.stop('max time')
+    assert not budget.claim_request()
+    assert budget.get_reason() == 'interrupted'
+
+
+def test_no_limits():
+    budget = CrawlBudget()
+    assert all(budget.claim_request() for _ in range(1000))
+    assert not budget.is_spent()
+    assert budget.get_reason() is None
+
+
+def test_limits_are_type_checked():
+    with pytest.raises(TypeError):
+        CrawlBudget(max_requests='10')
+    with pytest.raises(TypeError):
+        CrawlBudget(max_bytes=1.5)
@@ -0,0 +1,57 @@
+import pytest
+
+from OmenEye.RequestUtils import FetchPolicy, FETCH_FULL, FETCH_TRUNCATE, FETCH_SKIP
+
+
+def decide(policy, content_type, url=None):
+    return policy.decide({'Content-Type': content_type}, url=url)
+
+
+def test_default_rules():
+    policy = FetchPolicy(truncate_size=1024)
+    assert decide(policy, 'image/png') == (FETCH_SKIP, 0)
+    assert decide(policy, 'font/woff2') == (FETCH_SKIP, 0)
+    assert decide(policy, 'application/pdf') == (FETCH_TRUNCATE, 1024)
+    assert decide(policy, 'text/html; charset=utf-8') == (FETCH_FULL, float('inf'))
+
+
+def test_longest_prefix_wins():
+    policy = FetchPolicy()
+    # image/ is skipped, but svg is xml that gets parsed for links
+    assert decide(policy, 'image/svg+xml')[0] == FETCH_FULL
+
+
+def test_content_type_is_matched_without_params_or_case():
+    policy = FetchPolicy()
+    assert decide(policy, 'IMAGE/JPEG; q=0.9')[0] == FETCH_SKIP
+    assert policy.decide({})[0] == FETCH_FULL
+
+
+def test_gz_paths_are_never_truncated():
+    policy = FetchPolicy()
+    assert decide(policy, 'application/x-tar', url='http://example.com/backup.tar')[0] == FETCH_TRUNCATE
+    assert decide(policy, 'application/x-tar', url='http://example.com/backup.tar.gz')[0] == FETCH_FULL
+    assert decide(policy, 'application/vnd.ms-excel', url='http://example.com/sitemap.xml.GZ?v=1')[0] == FETCH_FULL
+    # Skipped bodies stay skipped, only truncation would break them
+    assert decide(policy, 'image/png', url='http://example.com/logo.png.gz')[0] == FETCH_SKIP
+
+
+def test_generic_binary_is_fetched_in_full():
+    policy = FetchPolicy()
+    assert decide(policy, 'application/octet-stream', url='http://example.com/sitemap.xml.gz')[0] == FETCH_FULL
+    assert decide(policy, 'application/octet-stream', url='http://example.com/download')[0] == FETCH_FULL
+
+
+def test_from_file(tmp_path):
+    rules = tmp_path / 'rules.txt'
+    rules.write_text('# comment\ntext/ full\napplication/json truncate:2\nimage/ skip  # no images\n\n')
+    policy = FetchPolicy.from_file(str(rules), truncate_size=512)
+    assert decide(policy, 'application/json') == (FETCH_TRUNCATE, 2048)
+    assert decide(policy, 'image/gif') == (FETCH_SKIP, 0)
+    # Only the rules in the file, pdf falls through to the default
+    assert decide(policy, 'application/pdf')[0] == FETCH_FULL
+
+
+def test_invalid_action_is_an_error():
+    with pytest.raises(ValueError):
+        FetchPolicy(rules=[('text/', 'maybe')])
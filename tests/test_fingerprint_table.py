@@ -0,0 +1,74 @@
+import hashlib
+
+import pytest
+
+from OmenEye.FingerprintTable import FingerprintTable, url_fingerprint
+
+
+def test_get_and_set():
+    table = FingerprintTable()
+    assert table.get('http://example.com/') == 0
+    table.set('http://example.com/', 3)
+    table.set('http://example.com/a', 1)
+    table.set('http://example.com/', 2)
+    assert table.get('http://example.com/') == 2
+    assert table.get('http://example.com/a') == 1
+    assert len(table) == 2
+
+
+def test_capacity_is_rounded_up_to_a_power_of_2():
+    assert FingerprintTable(capacity=5).capacity == 8
+    assert FingerprintTable(capacity=8).get_bytes() == 8 * 9
+    with pytest.raises(TypeError):
+        FingerprintTable(capacity=8.0)
+
+
+def test_colliding_slots_are_probed():
+    table = FingerprintTable(capacity=8)
+    # Same slot for all three
+    for fingerprint, value in ((3, 1), (11, 2), (19, 3)):
+        table.set_fp(fingerprint, value)
+    assert [table.get_fp(fingerprint) for fingerprint in (3, 11, 19, 27)] == [1, 2, 3, 0]
+
+
+def test_growing_keeps_every_entry():
+    table = FingerprintTable(capacity=8)
+    urls = [f'http://example.com/{n}' for n in range(500)]
+    for n, url in enumerate(urls):
+        table.set(url, n % 255 + 1)
+    # Doubled every time it was 2/3 full
+    assert table.capacity == 1024
+    assert len(table) == 500
+    assert all(table.get(url) == n % 255 + 1 for n, url in enumerate(urls))
+    assert sorted(table.items()) == sorted((url_fingerprint(url), n % 255 + 1) for n, url in enumerate(urls))
+
+
+def test_spill_to_a_memory_mapped_file():
+    table = FingerprintTable(capacity=8, spill=True)
+    first_file = table.spill_file
+    for n in range(100):
+        table.set(f'http://example.com/{n}', 1)
+    # Each growth maps a new file and closes the old one
+    assert table.spill_file is not first_file
+    assert first_file.closed
+    assert all(table.get(f'http://example.com/{n}') == 1 for n in range(100))
+    assert len(table.items()) == 100
+    spill_file = table.spill_file
+    table.close()
+    assert spill_file.closed
+
+
+def test_fingerprint():
+    assert url_fingerprint('http://example.com/') == url_fingerprint('http://example.com/')
+    assert url_fingerprint('http://example.com/') != url_fingerprint('http://example.com/a')
+    # Lone surrogates from bad percent decoding still hash
+    assert url_fingerprint('http://example.com/\udcff')
+
+
+def test_fingerprint_is_never_0(monkeypatch):
+    class ZeroHash:
+        def digest(self):
+            return bytes(8)
+    monkeypatch.setattr(hashlib, 'blake2b', lambda *args, **kwargs: ZeroHash())
+    # 0 marks an empty slot
+    assert url_fingerprint('http://example.com/') == 1
@@ -0,0 +1,111 @@
+import pytest
+import requests
+
+from OmenEye.HtmlParsers import HTML_PARSERS, PythonHtmlParser, get_html_parser
+from OmenEye.RequestUtils import build_response, parse_page
+
+
+# Pages every backend has to get the same links and inputs out of as
+# html.parser
+PAGES = [
+    ('link attributes', 'http://example.com/dir/page.html', '''<!DOCTYPE html><html><head>
+        <base href="/base/"><link rel="stylesheet" href="style.css"><script src="/app.js"></script>
+        </head><body>
+        <a href="a.html">a</a><img src="i.png"><picture><source src="s.webm" srcset="s1.jpg 1x, s2.jpg 2x"></picture>
+        <video src="v.mp4"><track src="t.vtt"></video><audio src="a.mp3"></audio><iframe src="/frame"></iframe>
+        <object data="o.swf"><param name="movie" value="m.swf"></object><embed src="e.swf">
+        <map><area href="area.html"></map><form action="/post"><input type="image" src="btn.png"></form>
+        <blockquote cite="http://cite.example.com/">q</blockquote><q cite="q.html">q</q>
+        <del cite="d.html">d</del><ins cite="i.html">i</ins>
+        <div href="div.html">odd</div><span href="span.html">odd</span>
+        </body></html>'''),
+    ('link forms', 'http://example.com/dir/', '''<html><body>
+        <A HREF="Upper.html">upper</A><a href='q?x=1&amp;y=2'>entity</a><a href="">empty</a><a>none</a>
+        <a href="javascript:void(0)">js</a><a href="mailto:a@example.com">mail</a><a href="//other.example.com/p">proto</a>
+        <a href="#top">fragment</a><a href="../up.html">up</a><a href="/caf&eacute;">named entity</a>
+        <a href="https://example.com:8443/x?y=%20z">absolute</a>
+        </body></html>'''),
+    ('hidden links', 'http://example.com/', '''<html><head>
+        <script>var s = '<a href="/in-script">x</a>';</script><style>a[href="/in-style"] {}</style>
+        </head><body><!-- <a href="/in-comment">x</a> --><p>text</p></body></html>'''),
+    ('inputs', 'http://example.com/form', '''<html><body><form action="/login" method="post">
+        <input type="text" name="user" value="bob"><input type="password" name=pw><input disabled name="d">
+        <input name="q" value='say "hi"'><input name="q2" value="it's &quot;x&quot;"><input name="lt" value="a&lt;b&gt;c&amp;d">
+        <input class="  a   b " name="c" value="1" id="x" data-z="z"><INPUT NAME="UP" VALUE="Up"><input type="hidden" name="csrf" value="">
+        <textarea name="t">hello</textarea><select name="s"><option value="1" selected>One</option><option value="2">Two</option></select>
+        <button type="submit" name="go" value="y">Go <i>now</i></button><datalist id="dl"><option value="dv"></option></datalist>
+        </form></body></html>'''),
+    ('xhtml boolean attributes', 'http://example.com/form', '''<html><body><form>
+        <input type="checkbox" name="a" checked="checked"/><input type="checkbox" name="b" checked/>
+        <input name="c" disabled="disabled"/><input name="d" readonly=""/><input name="e" disabled="yes"/>
+        <select name="s" multiple="multiple"><option value="1" selected="selected">One</option><option value="2" selected>Two</option></select>
+        </form></body></html>'''),
+    ('markup in textarea and title', 'http://example.com/', '''<html><head><title>Hi <a href="/in-title">t</a></title></head><body>
+        <form><textarea name="body"><p>Draft with <a href="/in-textarea">a link</a> <input name="inner" value="v"></p></textarea>
+        <input name="after"></form><xmp><a href="/in-xmp">x</a></xmp><noembed><a href="/in-noembed">n</a></noembed>
+        </body></html>'''),
+    ('template', 'http://example.com/', '''<html><body>
+        <template id="row"><a href="/in-template">x</a><input name="tpl"><template><a href="/nested">y</a></template></template>
+        <input name="after"></body></html>'''),
+    ('unicode', 'http://example.com/u/', '''<html><body><a href="/über">über</a><a href="café.html">café</a>
+        <input name="né" value="été"><input name="名前" value="値"></body></html>'''),
+    ('sitemap tags', 'http://example.com/', '''<html><body><loc>http://example.com/loc1</loc><loc> /loc2 </loc></body></html>'''),
+    ('empty', 'http://example.com/', ''),
+]
+
+# Where the C backends are known to differ from html.parser (see
+# HtmlParsers). Kept here so a change in either side shows up.
+KNOWN_DIFFERENCES = [
+    ('duplicate attributes', 'http://example.com/', '''<html><body>
+        <a href="/first" href="/second">x</a><input name="first" name="second" value="v"></body></html>'''),
+    ('entities in textarea', 'http://example.com/', '''<html><body>
+        <textarea>&lt;a href="/escaped"&gt;x&lt;/a&gt;</textarea></body></html>'''),
+    ('malformed markup', 'http://example.com/', '''<a href="/a1"<a href="/a2">x</a>
+        <input name="a" value="b"<input name="c"><a href=/a3 >y</a><a href="/a4'''),
+]
+
+
+def load_backend(name):
+    try:
+        return HTML_PARSERS[name]()
+    except ImportError:
+        pytest.skip(f'{name} is not installed')
+
+
+@pytest.fixture(params=['lxml', 'selectolax'])
+def backend(request):
+    return load_backend(request.param)
+
+
+@pytest.mark.parametrize('name, base_url, text', PAGES, ids=[page[0] for page in PAGES])
+def test_backend_matches_html_parser(backend, name, base_url, text):
+    assert backend.extract(text, base_url) == PythonHtmlParser().extract(text, base_url)
+
+
+@pytest.mark.xfail(strict=True, reason='known difference, see HtmlParsers')
+@pytest.mark.parametrize('name, base_url, text', KNOWN_DIFFERENCES, ids=[page[0] for page in KNOWN_DIFFERENCES])
+def test_known_differences(backend, name, base_url, text):
+    assert backend.extract(text, base_url) == PythonHtmlParser().extract(text, base_url)
+
+
+def test_boolean_attributes_keep_their_written_value(backend):
+    text = '<input name="a" checked="checked"><input name="b" checked>'
+    _, inputs = backend.extract(text, 'http://example.com/')
+    assert [tag for tag, _, _ in inputs] == ['<input checked="checked" name="a"/>', '<input checked="" name="b"/>']
+
+
+def test_parse_page_uses_the_backend(backend):
+    url = 'http://example.com/dir/'
+    request = requests.Request('GET', url).prepare()
+    content = b'<html><body><a href="next.html">n</a><input name="q" value="1"></body></html>'
+    response = build_response(request, 200, {'Content-Type': 'text/html; charset=utf-8'}, url=url, content=content)
+    assert parse_page(response, content, html_parser=backend)[:2] == parse_page(response, content)[:2]
+
+
+def test_unknown_backend_is_an_error():
+    with pytest.raises(ValueError):
+        get_html_parser('html5lib')
+
+
+def test_python_backend_is_always_there():
+    assert get_html_parser('html.parser').name == 'html.parser'
@@ -0,0 +1,88 @@
+import sqlite3
+
+from OmenEye.ResponseDBManager import merge_shard_dbs
+from OmenEye.ShardedCrawl import host_partition
+
+
+SCHEMA = [
+    'CREATE TABLE responses (response_id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT, visited INTEGER, status_code INTEGER)',
+    'CREATE TABLE headers (header_id INTEGER PRIMARY KEY AUTOINCREMENT, response_id INTEGER, header_name TEXT, header_value TEXT)',
+    'CREATE TABLE links (link_id INTEGER PRIMARY KEY AUTOINCREMENT, response_id INTEGER, link TEXT)',
+    'CREATE TABLE query_params (param_id INTEGER PRIMARY KEY AUTOINCREMENT, response_id INTEGER, param_name TEXT, param_value TEXT)',
+    'CREATE TABLE inputs (input_id INTEGER PRIMARY KEY AUTOINCREMENT, response_id INTEGER, tag TEXT, tag_name TEXT, tag_value TEXT)',
+]
+
+
+# responses - list of (url, visited), each visited one gets a header
+# and a link, each unvisited one a query param
+def make_shard(path, responses):
+    conn = sqlite3.connect(path)
+    for sql in SCHEMA:
+        conn.execute(sql)
+    for url, visited in responses:
+        response_id = conn.execute('INSERT INTO responses (url, visited, status_code) VALUES (?, ?, ?)', (url, visited, 200 if visited else None)).lastrowid
+        if visited:
+            conn.execute('INSERT INTO headers (response_id, header_name, header_value) VALUES (?, ?, ?)', (response_id, 'X-Url', url))
+            conn.execute('INSERT INTO links (response_id, link) VALUES (?, ?)', (response_id, url + '/next'))
+        else:
+            conn.execute('INSERT INTO query_params (response_id, param_name, param_value) VALUES (?, ?, ?)', (response_id, 'from', url))
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+def test_merge_keeps_every_row_linked_to_its_response(tmp_path):
+    shards = [
+        make_shard(tmp_path / 'out.db.part0', [('http://a.example.com/', 1), ('http://a.example.com/x', 1)]),
+        make_shard(tmp_path / 'out.db.part1', [('http://b.example.com/', 1), ('http://b.example.com/y', 1)]),
+    ]
+    db = str(tmp_path / 'out.db')
+    merge_shard_dbs(db, shards)
+
+    conn = sqlite3.connect(db)
+    rows = conn.execute('''
+        SELECT r.url, h.header_value, l.link FROM responses r
+        JOIN headers h ON h.response_id = r.response_id
+        JOIN links l ON l.response_id = r.response_id
+    ''').fetchall()
+    ids = [response_id for response_id, in conn.execute('SELECT response_id FROM responses')]
+    conn.close()
+    # Keys were shifted, not clashing, and every header and link
+    # still points at the response it came with
+    assert len(ids) == len(set(ids)) == 4
+    assert sorted(rows) == sorted((url, url, url + '/next') for url in (
+        'http://a.example.com/', 'http://a.example.com/x', 'http://b.example.com/', 'http://b.example.com/y'))
+
+
+def test_unvisited_duplicates_are_dropped(tmp_path):
+    # Both shards saw b.example.com/y, only part1 (its owner) fetched
+    # it. Both saw c.example.com out of scope.
+    shards = [
+        make_shard(tmp_path / 'out.db.part0', [('http://a.example.com/', 1), ('http://b.example.com/y', 0), ('http://c.example.com/', 0)]),
+        make_shard(tmp_path / 'out.db.part1', [('http://b.example.com/y', 1), ('http://c.example.com/', 0)]),
+    ]
+    db = str(tmp_path / 'out.db')
+    merge_shard_dbs(db, shards)
+
+    conn = sqlite3.connect(db)
+    responses = sorted(conn.execute('SELECT url, visited FROM responses').fetchall())
+    orphans = conn.execute('SELECT COUNT(*) FROM query_params WHERE response_id NOT IN (SELECT response_id FROM responses)').fetchone()[0]
+    conn.close()
+    assert responses == [('http://a.example.com/', 1), ('http://b.example.com/y', 1), ('http://c.example.com/', 0)]
+    assert orphans == 0
+
+
+def test_merge_of_empty_shards_is_empty(tmp_path):
+    db = str(tmp_path / 'out.db')
+    merge_shard_dbs(db, [make_shard(tmp_path / 'out.db.part0', [])])
+    conn = sqlite3.connect(db)
+    assert conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 0
+    conn.close()
+
+
+def test_a_host_always_has_the_same_partition():
+    # Every process works out the same owner (and so the same seeding one)
+    first = host_partition('http://Example.com/a', 4)
+    assert first == host_partition('https://example.com:8443/b?c=d', 4)
+    assert all(0 <= host_partition(f'http://{i}.example.com/', 4) < 4 for i in range(50))
+    assert len(set(host_partition(f'http://{i}.example.com/', 4) for i in range(50))) == 4
@@ -0,0 +1,79 @@
+import requests
+
+from OmenEye.NearDuplicateIndex import NearDuplicateIndex, page_simhash
+from OmenEye.RequestUtils import build_response
+from OmenEye.ResponseDBManager import DummyResponse
+
+
+NAV = '<nav><a href="/">Home</a> <a href="/news">News</a> <a href="/about">About us</a> <a href="/contact">Contact</a></nav>'
+FOOTER = '<footer>Copyright 2024 Example News Ltd. All rights reserved. Privacy policy and terms of use.</footer>'
+
+ARTICLE_RU_1 = (
+    'Городской совет утвердил новый бюджет на следующий год. Основная часть средств '
+    'пойдёт на ремонт дорог, строительство школ и обновление общественного транспорта. '
+    'Депутаты спорили о расходах на культуру почти четыре часа, прежде чем прийти к согласию.'
+)
+ARTICLE_RU_2 = (
+    'Сборная по хоккею одержала уверенную победу в финальном матче турнира. Вратарь '
+    'отразил сорок бросков, а капитан команды забросил две шайбы в третьем периоде. '
+    'Болельщики праздновали на центральной площади до самого утра.'
+)
+ARTICLE_JA_1 = '市議会は来年度の予算案を可決した。 道路の補修 学校の建設 公共交通の更新に 多くの予算が充てられる。 文化関連の支出をめぐり 議員たちは 四時間近く 議論を続けた。 最終的に 全会一致で 承認された。 市長は 記者会見で 感謝を述べた。'
+ARTICLE_JA_2 = '代表チームは 決勝戦で 快勝し 大会を 制した。 ゴールキーパーは 四十本の シュートを 防ぎ 主将は 第三ピリオドに 二得点を 挙げた。 ファンは 中央広場で 朝まで 勝利を 祝った。 監督は 選手たちを たたえた。'
+
+
+def page(article):
+    return f'<html><head><title>News</title></head><body>{NAV}<article>{article}</article>{FOOTER}</body></html>'
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def test_different_cyrillic_pages_do_not_match():
+    first = page_simhash(page(ARTICLE_RU_1))
+    second = page_simhash(page(ARTICLE_RU_2))
+    assert first is not None and second is not None
+    assert distance(first, second) > 3
+
+    index = NearDuplicateIndex(max_distance=3)
+    assert index.check('http://example.com/ru/1', first) is None
+    assert index.check('http://example.com/ru/2', second) is None
+
+
+def test_different_japanese_pages_do_not_match():
+    first = page_simhash(page(ARTICLE_JA_1))
+    second = page_simhash(page(ARTICLE_JA_2))
+    assert first is not None and second is not None
+    assert distance(first, second) > 3
+
+
+def test_same_cyrillic_page_with_another_view_count_matches():
+    first = page_simhash(page(ARTICLE_RU_1 + ' Просмотров: 1234'))
+    second = page_simhash(page(ARTICLE_RU_1 + ' Просмотров: 1240'))
+
+    index = NearDuplicateIndex(max_distance=3)
+    assert index.check('http://example.com/ru/1', first) is None
+    assert index.check('http://example.com/ru/1?ref=feed', second) == 'http://example.com/ru/1'
+
+
+def test_dummy_response_hashes_the_decoded_page():
+    url = 'http://example.com/ru/1'
+    request = requests.Request('GET', url).prepare()
+    pages = []
+    for article in (ARTICLE_RU_1, ARTICLE_RU_2):
+        for charset in ('utf-8', 'windows-1251'):
+            content = page(article).encode(charset)
+            headers = {'Content-Type': f'text/html; charset={charset}'}
+            response = build_response(request, 200, headers, url=url, content=content)
+            pages.append(DummyResponse(response, content, get_simhash=True).simhash)
+
+    # The same page in two encodings hashes the same, two different ones do not
+    assert pages[0] == pages[1]
+    assert pages[2] == pages[3]
+    assert distance(pages[0], pages[2]) > 3
+
+
+def test_short_pages_are_not_hashed():
+    assert page_simhash('') is None
+    assert page_simhash('<p>Привет, мир</p>') is None
@@ -0,0 +1,80 @@
+import sys
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+from OmenEye.RequestUtils import build_response, get_url_w_request_and_session
+from OmenEye.RetryPolicy import BackoffRetryPolicy, get_retry_after
+
+
+def respond(status_code, headers=None, url='http://example.com/page'):
+    request = requests.Request('GET', url).prepare()
+    return build_response(request, status_code, headers or {}, url=url, content=b'')
+
+
+def test_retry_after_seconds_is_honored_and_capped():
+    policy = BackoffRetryPolicy(max_retry_after=60)
+    assert policy.schedule('http://example.com/a', 0, respond(429, {'Retry-After': '30'})) == 30
+    assert policy.schedule('http://example.com/a', 0, respond(503, {'Retry-After': '3600'})) == 60
+
+
+def test_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=120)
+    delay = get_retry_after(respond(429, {'Retry-After': format_datetime(when, usegmt=True)}))
+    assert 100 < delay <= 120
+    assert get_retry_after(respond(429, {'Retry-After': 'soon'})) is None
+
+
+def test_backoff_without_retry_after():
+    policy = BackoffRetryPolicy(base_delay=1.0, max_delay=5.0)
+    for attempt in range(6):
+        assert 0 <= policy.schedule('http://example.com/a', attempt % 3, None) <= 5.0
+    # Retry-After only counts on a 429/503
+    assert policy.schedule('http://example.com/a', 0, respond(502, {'Retry-After': '100'})) <= 1.0
+
+
+def test_only_failures_are_retried():
+    policy = BackoffRetryPolicy()
+    assert policy.schedule('http://example.com/a', 0, respond(404)) is None
+    assert policy.schedule('http://example.com/a', 0, respond(200)) is None
+    assert policy.get_counts() == (0, 0)
+
+
+def test_max_retries_per_url():
+    policy = BackoffRetryPolicy(max_retries=2)
+    assert policy.schedule('http://example.com/a', 1, None) is not None
+    assert policy.schedule('http://example.com/a', 2, None) is None
+    assert policy.get_counts() == (1, 1)
+
+
+def test_host_budget():
+    policy = BackoffRetryPolicy(host_budget=3)
+    for i in range(3):
+        assert policy.schedule(f'http://bad.example.com/{i}', 0, respond(503)) is not None
+    # The host spent its retries, other hosts still get theirs
+    assert policy.schedule('http://bad.example.com/3', 0, respond(503)) is None
+    assert policy.schedule('http://good.example.com/0', 0, respond(503)) is not None
+    assert policy.get_counts() == (4, 1)
+
+
+def test_no_tries_leaves_no_result():
+    # Never sent, so nothing is left unbound
+    request = requests.Request('GET', 'http://example.invalid/')
+    assert get_url_w_request_and_session(request, requests.Session(), retries=-1) == (None, None)
+
+
+@pytest.mark.parametrize('args', [
+    ['--retries', '0'],
+    ['--retries', '-1', '--retry-policy', 'backoff'],
+])
+def test_cli_rejects_fewer_than_one_try(args, tmp_path, monkeypatch, capsys):
+    from OmenEye.omeneye_cli import cli
+    output = tmp_path / 'out.db'
+    monkeypatch.setattr(sys, 'argv', ['omeneye', '--url', 'http://example.com/', '--output', str(output)] + args)
+    with pytest.raises(SystemExit) as e:
+        cli()
+    assert e.value.code == 1
+    assert 'Invalid --retries' in capsys.readouterr().out
+    assert not output.exists()
@@ -0,0 +1,77 @@
+import requests
+
+from OmenEye.RequestUtils import build_response
+from OmenEye.Soft404Detector import Soft404Detector
+
+
+NOT_FOUND = '<html><body><h1>Sorry</h1><p>The page you were looking for could not be found on this server.</p></body></html>'
+
+
+def respond(url, status_code, body='', headers=None):
+    request = requests.Request('GET', url).prepare()
+    content = body.encode()
+    headers = dict(headers or {})
+    headers.setdefault('Content-Type', 'text/html; charset=utf-8')
+    return build_response(request, status_code, headers, url=url, content=content), content
+
+
+class FakeSite:
+    # answers[i] is what the i-th probe gets: a status code, or None for a failed fetch
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.probes = []
+
+    def fetch(self, url):
+        self.probes.append(url)
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if answer is None:
+            return None, None
+        if answer == 302:
+            return respond(url, 302, headers={'Location': '/?from=' + url})
+        if answer == 200:
+            return respond(url, 200, NOT_FOUND)
+        return respond(url, answer, 'error')
+
+
+def test_catch_all_page_is_a_soft_404():
+    site = FakeSite([200])
+    detector = Soft404Detector(fetch_func=site.fetch)
+    assert detector.is_soft_404(*respond('http://example.com/a/missing', 200, NOT_FOUND))
+    assert not detector.is_soft_404(*respond('http://example.com/a/real', 200, '<p>A real page about something else entirely</p>'))
+    assert len(site.probes) == 1
+
+
+def test_failed_probe_is_not_cached():
+    site = FakeSite([None, 200])
+    detector = Soft404Detector(fetch_func=site.fetch)
+    # The probe failed, nothing can be said yet
+    assert not detector.is_soft_404(*respond('http://example.com/a/missing', 200, NOT_FOUND))
+    # so the next page of the directory probes again
+    assert detector.is_soft_404(*respond('http://example.com/a/other', 200, NOT_FOUND))
+    assert len(site.probes) == 2
+    assert detector.get_counts() == (1, 1)
+
+
+def test_error_status_means_no_catch_all():
+    site = FakeSite([404, 200])
+    detector = Soft404Detector(fetch_func=site.fetch)
+    assert not detector.is_soft_404(*respond('http://example.com/a/missing', 200, NOT_FOUND))
+    assert not detector.is_soft_404(*respond('http://example.com/a/other', 200, NOT_FOUND))
+    assert len(site.probes) == 1
+
+
+def test_catch_all_redirect_is_a_soft_404():
+    site = FakeSite([302])
+    detector = Soft404Detector(fetch_func=site.fetch)
+    url = 'http://example.com/b/missing'
+    assert detector.is_soft_404(*respond(url, 302, headers={'Location': '/?from=' + url}))
+    assert not detector.is_soft_404(*respond('http://example.com/b/moved', 301, headers={'Location': '/b/new'}))
+    assert not detector.is_soft_404(*respond('http://example.com/b/real', 200, NOT_FOUND))
+
+
+def test_redirect_that_keeps_the_path_is_no_catch_all():
+    def fetch(url):
+        return respond(url, 301, headers={'Location': url.replace('http:', 'https:')})
+    detector = Soft404Detector(fetch_func=fetch)
+    url = 'http://example.com/c/page'
+    assert not detector.is_soft_404(*respond(url, 301, headers={'Location': url.replace('http:', 'https:')}))
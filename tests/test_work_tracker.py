@@ -0,0 +1,89 @@
+import queue
+import threading
+
+import pytest
+
+from OmenEye.WorkTracker import WorkTracker, TrackedQueue
+from OmenEye.WorkerManager import WorkerManager
+
+
+def test_tracker_counts_down_to_done():
+    tracker = WorkTracker()
+    assert tracker.is_done()
+    tracker.add(3)
+    assert not tracker.wait(timeout=0)
+    tracker.finish(2)
+    assert tracker.get_count() == 1 and not tracker.is_done()
+    tracker.finish()
+    assert tracker.wait(timeout=0)
+    # Finishing too much never goes below zero
+    tracker.finish()
+    assert tracker.get_count() == 0
+
+
+def test_tracked_queues_share_one_count():
+    tracker = WorkTracker()
+    first = TrackedQueue(tracker=tracker)
+    second = TrackedQueue(tracker=tracker)
+    first.put('a')
+    second.put('b')
+    assert tracker.get_count() == 2
+    first.get()
+    first.task_done()
+    assert tracker.get_count() == 1
+    second.get()
+    second.task_done_many(1)
+    assert tracker.is_done()
+
+
+def test_full_put_is_not_counted():
+    tracker = WorkTracker()
+    bounded = TrackedQueue(tracker=tracker, maxsize=1)
+    bounded.put('a')
+    with pytest.raises(queue.Full):
+        bounded.put('b', block=False)
+    assert tracker.get_count() == 1
+
+
+def test_tracker_needs_a_work_tracker():
+    with pytest.raises(TypeError):
+        TrackedQueue(tracker=None)
+
+
+def test_pipeline_is_done_only_once_every_stage_drained():
+    tracker = WorkTracker()
+    urls = TrackedQueue(tracker=tracker)
+    pages = TrackedQueue(tracker=tracker)
+    stored = queue.Queue()
+    # Every page links to the next one, up to 50 (0 would end the chain)
+    def fetch(n):
+        return n
+    def parse(n):
+        if n < 50:
+            urls.put(n + 1)
+        return n
+    fetchers = WorkerManager(worker_func=fetch, num_threads=4, input_queue=urls, output_queue=pages)
+    parsers = WorkerManager(worker_func=parse, num_threads=4, input_queue=pages, output_queue=stored)
+
+    # Watches for the count touching zero before the last page is in
+    early = []
+    stop = threading.Event()
+    def watch():
+        while not stop.is_set():
+            if tracker.is_done() and stored.qsize() < 50:
+                early.append(stored.qsize())
+    watcher = threading.Thread(target=watch)
+
+    urls.put(1)
+    watcher.start()
+    fetchers.start_threads()
+    parsers.start_threads()
+    try:
+        assert tracker.wait(timeout=10)
+    finally:
+        stop.set()
+        watcher.join()
+        fetchers.stop_threads()
+        parsers.stop_threads()
+    assert stored.qsize() == 50
+    assert early == []
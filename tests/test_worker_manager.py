@@ -0,0 +1,120 @@
+import queue
+from time import time
+
+import pytest
+
+from OmenEye.WorkerManager import WorkerManager
+
+
+def run(manager, input_queue, items):
+    for item in items:
+        input_queue.put(item)
+    manager.start_threads()
+    manager.join_threads()
+
+
+def drain(output_queue):
+    items = []
+    while not output_queue.empty():
+        items.append(output_queue.get())
+    return items
+
+
+def test_fused_stages_run_in_order():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    manager = WorkerManager(
+        worker_func=[lambda n: n + 1, lambda n: n * 10, str],
+        num_threads=3,
+        input_queue=input_queue,
+        output_queue=output_queue,
+    )
+    run(manager, input_queue, range(1, 6))
+    assert sorted(drain(output_queue)) == ['20', '30', '40', '50', '60']
+    assert manager.get_processed() == 5
+
+
+def test_a_stage_with_no_result_ends_the_chain():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    reached = []
+    def build(n):
+        # Odd items are dropped, like a url that is already claimed
+        return n if n % 2 == 0 else None
+    def fetch(n):
+        reached.append(n)
+        return n
+    manager = WorkerManager(worker_func=[build, fetch], num_threads=2, input_queue=input_queue, output_queue=output_queue)
+    run(manager, input_queue, range(1, 7))
+    assert sorted(reached) == [2, 4, 6]
+    assert sorted(drain(output_queue)) == [2, 4, 6]
+    # Every input was taken, whether it made it through or not
+    assert manager.get_processed() == 6
+
+
+def test_only_the_last_stage_gives_multiple_results():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    manager = WorkerManager(
+        worker_func=[lambda n: n, lambda n: [n, n + 100]],
+        num_threads=1,
+        input_queue=input_queue,
+        output_queue=output_queue,
+        multi_output=True,
+    )
+    run(manager, input_queue, [1, 2])
+    assert sorted(drain(output_queue)) == [1, 2, 101, 102]
+
+
+def test_fused_stages_keep_their_own_rates():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    manager = WorkerManager(
+        worker_func=[lambda n: n if n % 2 else None, lambda n: n],
+        num_threads=1,
+        input_queue=input_queue,
+        output_queue=output_queue,
+    )
+    run(manager, input_queue, range(1, 21))
+    first_in, first_out = manager.get_rates(stage=0)
+    second_in, second_out = manager.get_rates(stage=1)
+    assert first_in > 0 and first_out > 0
+    assert second_in > 0 and second_out > 0
+    # The last item (20) never got to the second stage
+    assert manager.stage_rates[1]['last_input_time'] < manager.stage_rates[0]['last_input_time']
+
+
+def test_fusion_takes_callables_only():
+    with pytest.raises(TypeError):
+        WorkerManager(worker_func=[], num_threads=1, input_queue=queue.Queue(), output_queue=queue.Queue())
+    with pytest.raises(TypeError):
+        WorkerManager(worker_func=[print, None], num_threads=1, input_queue=queue.Queue(), output_queue=queue.Queue())
+
+
+def test_batch_mode_hands_over_lists():
+    input_queue, output_queue = queue.Queue(), queue.Queue()
+    batches = []
+    def parse_batch(items):
+        batches.append(list(items))
+        # A None result is not put on the output queue
+        return [item * 2 if item != 3 else None for item in items]
+    manager = WorkerManager(worker_func=parse_batch, num_threads=1, input_queue=input_queue, output_queue=output_queue, batch_size=4)
+    run(manager, input_queue, range(1, 11))
+    assert all(1 <= len(batch) <= 4 for batch in batches)
+    assert sorted(item for batch in batches for item in batch) == list(range(1, 11))
+    assert sorted(drain(output_queue)) == [2, 4, 8, 10, 12, 14, 16, 18, 20]
+    assert manager.get_processed() == 10
+
+
+def test_batch_mode_stops_all_workers():
+    input_queue = queue.Queue()
+    manager = WorkerManager(worker_func=lambda items: items, num_threads=4, input_queue=input_queue, output_queue=queue.Queue(), batch_size=8)
+    manager.start_threads()
+    # One worker must not swallow every wake up signal meant for the
+    # others, or they would only stop on their 1 second get timeout
+    started = time()
+    manager.stop_threads()
+    assert time() - started < 0.9
+    assert not any(thread.is_alive() for thread in manager.threads)
+    assert input_queue.unfinished_tasks == 0
+
+
+def test_batch_mode_takes_one_function():
+    with pytest.raises(TypeError):
+        WorkerManager(worker_func=[print, print], num_threads=1, input_queue=queue.Queue(), output_queue=queue.Queue(), batch_size=4)